@@ -55,8 +55,7 @@ class ThermoHumidMeterRecordsDataState
       },
     );
     _channel.stream.listen((message) {
-      final correctedMessage = message.replaceAll("'", '"');
-      final Map<String, dynamic> data = jsonDecode(correctedMessage);
+      final Map<String, dynamic> data = jsonDecode(message);
       final double? temperature = data['temperature'] is double
           ? data['temperature']
           : double.tryParse(data['temperature'].toString());
@@ -55,8 +55,7 @@ class WasteSorterRecordsDataState extends State<WasteSorterRecordsData> {
       },
     );
     _channel.stream.listen((message) {
-      final correctedMessage = message.replaceAll("'", '"');
-      final Map<String, dynamic> data = jsonDecode(correctedMessage);
+      final Map<String, dynamic> data = jsonDecode(message);
       final double? recyclableLevel = data['recyclable_level'] is double
           ? data['recyclable_level']
           : double.tryParse(data['recyclable_level'].toString());
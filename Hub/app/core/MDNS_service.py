@@ -12,7 +12,7 @@ class MDNSService:
         self._setup_mdns()
 
     def _setup_mdns(self):
-        desc = {'paths': ['/API/health', '/API/update-credentials']}
+        desc = {'paths': ['/API/health', '/API/metrics', '/API/update-credentials']}
         self.http_hub_service_info = zeroconf.ServiceInfo(
             type_="_http._tcp.local.",
             name="WasteFreeHomeHTTPHub._http._tcp.local.",
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from app.core.outbox import outbox
+
+
+class MeasurementWindow:
+    __slots__ = ("count", "minimum", "maximum", "total")
+
+    def __init__(self):
+        self.count = 0
+        self.minimum = float("inf")
+        self.maximum = float("-inf")
+        self.total = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+
+class DeviceWindow:
+    __slots__ = ("start", "last_timestamp", "temperature", "humidity")
+
+    def __init__(self, start):
+        self.start = start
+        self.last_timestamp = None
+        self.temperature = MeasurementWindow()
+        self.humidity = MeasurementWindow()
+
+
+class ThermoHumidAggregator:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # One open tumbling window per device, so memory stays constant no matter how many readings arrive
+        self.windows = {}
+        self.sweeper = None
+
+    async def start(self):
+        self.sweeper = asyncio.create_task(self._sweep_periodically())
+
+    async def stop(self):
+        self.sweeper.cancel()
+        await asyncio.gather(self.sweeper, return_exceptions=True)
+        with self.lock:
+            closed, self.windows = list(self.windows.items()), {}
+        self._forward(closed)
+
+    @staticmethod
+    def accepts(record):
+        return "temperature" in record and "humidity" in record
+
+    def add(self, device_id, record):
+        # Called from the MQTT network thread, returns False if the record can not be aggregated
+        try:
+            temperature = float(record["temperature"])
+            humidity = float(record["humidity"])
+        except (TypeError, ValueError):
+            return False
+
+        now = time.time()
+        window_start = now - now % settings.aggregation_window
+        closed = None
+        with self.lock:
+            window = self.windows.get(device_id)
+            if window is not None and window.start != window_start:
+                closed = window
+                window = None
+            if window is None:
+                window = self.windows[device_id] = DeviceWindow(window_start)
+            window.last_timestamp = record["timestamp"]
+            window.temperature.add(temperature)
+            window.humidity.add(humidity)
+        if closed is not None:
+            self._forward([(device_id, closed)])
+        return True
+
+    async def _sweep_periodically(self):
+        while True:
+            await asyncio.sleep(settings.aggregation_window / 4)
+            # Close windows of devices that went quiet, they would otherwise wait for their next reading
+            current_window_start = time.time() - time.time() % settings.aggregation_window
+            with self.lock:
+                closed = [(device_id, window) for device_id, window in self.windows.items()
+                          if window.start < current_window_start]
+                for device_id, _ in closed:
+                    del self.windows[device_id]
+            self._forward(closed)
+
+    @staticmethod
+    def _forward(closed):
+        for device_id, window in closed:
+            temperature_mean = window.temperature.total / window.temperature.count
+            humidity_mean = window.humidity.total / window.humidity.count
+            outbox.append(device_id, {
+                "timestamp": datetime.fromtimestamp(window.start, timezone.utc).isoformat(),
+                "window_seconds": settings.aggregation_window,
+                "sample_count": window.temperature.count,
+                "temperature_min": window.temperature.minimum,
+                "temperature_max": window.temperature.maximum,
+                "temperature_mean": temperature_mean,
+                "humidity_min": window.humidity.minimum,
+                "humidity_max": window.humidity.maximum,
+                "humidity_mean": humidity_mean
+            })
+            if settings.aggregation_mode == "aggregate":
+                # Raw readings are not forwarded, so the window mean takes their place in the regular records
+                outbox.append(device_id, {
+                    "timestamp": window.last_timestamp,
+                    "temperature": temperature_mean,
+                    "humidity": humidity_mean
+                })
+
+
+thermo_humid_aggregator = ThermoHumidAggregator()
@@ -0,0 +1,49 @@
+import json
+
+import msgpack
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+# Topic suffixes that select an encoding, for example device/<id>/record/msgpack
+topic_suffix_content_types = {
+    "json": JSON_CONTENT_TYPE,
+    "msgpack": MSGPACK_CONTENT_TYPE
+}
+
+
+def get_content_type(msg, topic_parts):
+    if len(topic_parts) > 3:
+        return topic_suffix_content_types.get(topic_parts[3])
+
+    # MQTT v5 clients can announce the encoding through the content type or a user property
+    properties = getattr(msg, "properties", None)
+    content_type = getattr(properties, "ContentType", None)
+    if content_type:
+        return content_type
+    for key, value in getattr(properties, "UserProperty", None) or []:
+        if key.lower() == "content-type":
+            return value
+    return JSON_CONTENT_TYPE
+
+
+def decode_payload(payload, content_type):
+    # Both decoders work on the raw bytes, without an intermediate str
+    if content_type == MSGPACK_CONTENT_TYPE:
+        data = msgpack.unpackb(payload, raw=False)
+    elif content_type == JSON_CONTENT_TYPE:
+        data = json.loads(payload)
+    else:
+        raise ValueError(f"Unsupported content type {content_type}")
+    # Device messages are objects, and records are stored as JSON which has no binary values
+    if not isinstance(data, dict):
+        raise ValueError(f"Payload is a {type(data).__name__}, not an object")
+    if any(isinstance(value, bytes) for value in data.values()):
+        raise ValueError("Payload has binary values")
+    return data
+
+
+def encode_body(data, content_type):
+    if content_type == MSGPACK_CONTENT_TYPE:
+        return msgpack.packb(data)
+    return json.dumps(data).encode("utf-8")
@@ -1,4 +1,5 @@
 import socket
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
@@ -12,17 +13,64 @@ class Settings(BaseSettings):
     mqtt_password: str
     device_record_topic: str = "device/+/record"
     device_state_topic: str = "device/+/state"
+    device_encoded_record_topic: str = "device/+/record/+"
+    device_encoded_state_topic: str = "device/+/state/+"
+
+    # Number of processes consuming device messages, the first one also serves HTTP and registers mDNS
+    hub_workers: int = 1
+    worker_index: int = 0
+    worker_restart_delay: float = 5.0
+    worker_shutdown_timeout: float = 15.0
+    # Workers write their metrics there for the main process to serve
+    metrics_dir: str = "metrics"
+    metrics_report_interval: float = 5.0
 
     server_hostname: str
     server_port: int
     server_records_endpoint: str = "API/records"
+    server_records_batch_endpoint: str = "API/records/batch"
     server_devices_endpoint: str = "API/devices"
+    server_devices_presence_endpoint: str = "API/devices/presence"
+    server_stream_endpoint: str = "API/records/stream"
+    # Records and state changes are streamed over a WebSocket when possible, HTTP is the fallback
+    server_stream_enabled: bool = True
+    server_stream_retry_interval: float = 5.0
 
     server_auth_endpoint: str = "API/auth"
-    user_email: str
-    user_password: str
+    # An API key issued by a Server admin replaces the login with the user credentials
+    server_api_key: str = ""
+    user_email: str = ""
+    user_password: str = ""
 
     jwt: str = ""
+    jwt_refresh_margin: float = 120.0
+    jwt_retry_interval: float = 5.0
+    jwt_min_refresh_interval: float = 10.0
+    jwt_fallback_lifetime: float = 1800.0
+
+    forwarder_workers: int = 8
+    forwarder_queue_size: int = 10000
+    forwarder_shutdown_timeout: float = 10.0
+    server_request_timeout: float = 10.0
+    # Encoding of request bodies sent to the Server, "application/json" or "application/msgpack"
+    server_content_type: str = "application/json"
+
+    record_batch_size: int = 500
+    record_batch_window: float = 0.25
+
+    outbox_path: str = "outbox.db"
+    outbox_max_bytes: int = 256 * 1024 * 1024
+    outbox_size_check_interval: int = 1000
+    outbox_replay_batch_size: int = 5000
+    outbox_retry_interval: float = 5.0
+    # Batches relayed from the outbox and not yet acknowledged by the Server
+    outbox_max_batches_in_flight: int = 4
+
+    presence_flush_interval: float = 1.0
+
+    # "raw" forwards every reading, "aggregate" only window aggregates, "both" forwards readings and aggregates
+    aggregation_mode: Literal["raw", "aggregate", "both"] = "raw"
+    aggregation_window: int = 60
 
     class Config:
         env_file = ".env"
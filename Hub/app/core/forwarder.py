@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import httpx
+
+from app.core.codecs import encode_body
+from app.core.config import settings
+from app.core.metrics import Gauge, forward_latency, server_responses, server_retries
+from app.core.token_manager import token_manager
+from app.core.uplink import stream_uplink
+
+
+def is_retryable(response):
+    # No response at all, expired credentials or an overloaded Server are worth another attempt
+    return response is None or response.status_code in (401, 403, 429) or response.status_code >= 500
+
+
+class Forwarder:
+    def __init__(self):
+        self.loop = None
+        self.queue = None
+        self.client = None
+        self.workers = []
+
+    async def start(self, transport=None):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.forwarder_queue_size)
+        # One long-lived client shared by all workers, so connections to the Server are kept alive
+        self.client = httpx.AsyncClient(
+            base_url=f"http://{settings.server_hostname}:{settings.server_port}",
+            limits=httpx.Limits(max_connections=settings.forwarder_workers,
+                                max_keepalive_connections=settings.forwarder_workers),
+            timeout=settings.server_request_timeout,
+            transport=transport
+        )
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(settings.forwarder_workers)]
+
+    async def stop(self):
+        # Give the workers a chance to drain what is already queued
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=settings.forwarder_shutdown_timeout)
+        except asyncio.TimeoutError:
+            print(f"Forwarder stopped with {self.queue.qsize()} unsent messages")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        await self.client.aclose()
+
+    async def enqueue(self, path, json_data=None, params=None, on_response=None):
+        # Waits while the queue is full, which slows down the producers
+        await self.queue.put((path, json_data, params, on_response))
+
+    def queue_depth(self):
+        return self.queue.qsize() if self.queue else 0
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth(),
+            "queue_capacity": settings.forwarder_queue_size,
+            "workers": len(self.workers)
+        }
+
+    async def _worker(self):
+        while True:
+            path, json_data, params, on_response = await self.queue.get()
+            try:
+                response = None
+                if stream_uplink.accepts(path):
+                    response = await stream_uplink.send(path, json_data)
+                if response is None:
+                    # Without a stream, or when it was lost, the request is sent over HTTP
+                    response = await self.send_request_with_retry(path, json_data=json_data, params=params)
+                if on_response:
+                    await on_response(response)
+            except Exception as e:
+                print(f"Unexpected error occurred: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def send_request_with_retry(self, path, json_data=None, params=None, retries=3):
+        token = token_manager.token
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+        content = None
+        if json_data is not None:
+            headers["Content-Type"] = settings.server_content_type
+            content = encode_body(json_data, settings.server_content_type)
+
+        start = time.perf_counter()
+        try:
+            # Send the POST request with both the encoded body and query parameters
+            response = await self.client.post(path, content=content, headers=headers, params=params)
+            forward_latency.observe(time.perf_counter() - start, path)
+            server_responses.inc(str(response.status_code))
+            response.raise_for_status()
+            print(f"Response status code: {response.status_code}")
+            return response
+
+        except httpx.HTTPStatusError as e:
+            # Handle specific HTTP status errors
+            if e.response.status_code == 401:  # Unauthorized, possibly due to expired JWT
+                if retries > 0:
+                    server_retries.inc()
+                    await token_manager.refresh(expired_token=token)  # Refresh JWT token
+                    return await self.send_request_with_retry(path, json_data=json_data, params=params,
+                                                              retries=retries - 1)
+            print(f"HTTP Status error occurred: {e}")
+            return e.response
+
+        except httpx.RequestError as e:
+            # Handle request errors
+            server_responses.inc("error")
+            if "Illegal header value" in str(e):
+                if retries > 0:
+                    server_retries.inc()
+                    await token_manager.refresh(expired_token=token)  # Refresh JWT token
+                    return await self.send_request_with_retry(path, json_data=json_data, params=params,
+                                                              retries=retries - 1)
+            else:
+                print(f"Request error occurred: {e}")
+
+        except Exception as e:
+            # Handle any other unexpected errors
+            print(f"Unexpected error occurred: {e}")
+        return None
+
+
+forwarder = Forwarder()
+Gauge("hub_forwarder_queue_depth", "Requests waiting in the forwarder queue", forwarder.queue_depth)
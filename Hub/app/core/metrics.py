@@ -0,0 +1,173 @@
+import asyncio
+import bisect
+import json
+import os
+
+from app.core.config import settings
+
+# Every metric is updated from a single thread (either the MQTT network thread or the event loop),
+# so plain integers are enough and on_message never waits for a lock
+
+registry = []
+
+
+def format_labels(labelnames, labels):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, labels)) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self):
+        return [[list(labels), value] for labels, value in list(self.values.items())]
+
+    def samples(self, snapshots=()):
+        values = dict(self.values)
+        for labels, value in (entry for snapshot in snapshots for entry in snapshot.get(self.name, [])):
+            values[tuple(labels)] = values.get(tuple(labels), 0) + value
+        for labels, value in values.items():
+            yield self.name, format_labels(self.labelnames, labels), value
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        # Gauges are read from their owner when scraped, nothing is updated on the hot path
+        self.callback = callback
+        registry.append(self)
+
+    def snapshot(self):
+        return self.callback()
+
+    def samples(self, snapshots=()):
+        # Every process has its own outbox and queues, their sizes add up
+        yield self.name, "", self.callback() + sum(snapshot.get(self.name, 0) for snapshot in snapshots)
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Per label set: counts per bucket (the last one is +Inf), sum and count
+        self.values = {}
+        registry.append(self)
+
+    def observe(self, value, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def snapshot(self):
+        return [[list(labels), list(bucket_counts), total, count]
+                for labels, (bucket_counts, total, count) in list(self.values.items())]
+
+    def samples(self, snapshots=()):
+        values = {labels: (list(bucket_counts), total, count)
+                  for labels, (bucket_counts, total, count) in list(self.values.items())}
+        for labels, bucket_counts, total, count in (entry for snapshot in snapshots
+                                                     for entry in snapshot.get(self.name, [])):
+            merged = values.get(tuple(labels))
+            if merged is not None:
+                bucket_counts = [a + b for a, b in zip(merged[0], bucket_counts)]
+                total += merged[1]
+                count += merged[2]
+            values[tuple(labels)] = (bucket_counts, total, count)
+        for labels, (bucket_counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), bucket_counts):
+                cumulative += bucket_count
+                yield (f"{self.name}_bucket",
+                       format_labels(self.labelnames + ("le",), labels + (bound,)), cumulative)
+            yield f"{self.name}_sum", format_labels(self.labelnames, labels), total
+            yield f"{self.name}_count", format_labels(self.labelnames, labels), count
+
+
+def render(snapshots=()):
+    # Prometheus text exposition format, the metrics of this process added up with those reported by the workers
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples(snapshots):
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def get_report_path(worker_index):
+    return os.path.join(settings.metrics_dir, f"worker-{worker_index}.json")
+
+
+def write_report():
+    # Replaced at once, the main process never reads half a report
+    os.makedirs(settings.metrics_dir, exist_ok=True)
+    path = get_report_path(settings.worker_index)
+    with open(f"{path}.tmp", "w") as report:
+        json.dump({metric.name: metric.snapshot() for metric in registry}, report)
+    os.replace(f"{path}.tmp", path)
+
+
+def remove_report():
+    try:
+        os.remove(get_report_path(settings.worker_index))
+    except FileNotFoundError:
+        pass
+
+
+async def report_periodically():
+    # Worker processes have no HTTP server, the main process serves their metrics from these reports
+    try:
+        while True:
+            write_report()
+            await asyncio.sleep(settings.metrics_report_interval)
+    finally:
+        remove_report()
+
+
+def read_reports():
+    snapshots = []
+    for worker_index in range(1, settings.hub_workers):
+        try:
+            with open(get_report_path(worker_index)) as report:
+                snapshots.append(json.load(report))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+mqtt_messages_received = Counter("hub_mqtt_messages_received_total",
+                                 "MQTT messages received from devices", ("topic_type",))
+mqtt_decode_failures = Counter("hub_mqtt_decode_failures_total",
+                               "MQTT messages whose payload could not be decoded or handled")
+forward_latency = Histogram("hub_forward_latency_seconds",
+                            "Duration of requests forwarded to the Server", ("path",))
+server_responses = Counter("hub_server_responses_total",
+                           "Responses received from the Server by status code", ("code",))
+server_retries = Counter("hub_server_retries_total",
+                         "Requests to the Server that were retried")
+worker_dispatch_failures = Counter("hub_worker_dispatch_failures_total",
+                                   "Device messages that could not be passed on to the worker owning the device")
+token_refreshes = Counter("hub_token_refreshes_total",
+                          "Logins made to refresh the JWT", ("result",))
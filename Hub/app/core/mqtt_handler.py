@@ -1,88 +1,86 @@
-import json
-import httpx
+import hashlib
+from datetime import datetime, timezone
+from functools import lru_cache
+
 import paho.mqtt.client as mqtt
 
+from app.core.aggregation import thermo_humid_aggregator
+from app.core.codecs import get_content_type, decode_payload
 from app.core.config import settings
-from app.core.utils import get_jwt
+from app.core.metrics import mqtt_messages_received, mqtt_decode_failures
+from app.core.outbox import outbox
+from app.core.presence import presence_table
+from app.core.worker_pool import worker_pool
 
-# Initialize MQTT client
+# Initialize MQTT client, only the main process subscribes and passes the messages of the devices owned by the other
+# workers on to them
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, settings.hub_id)
 
 
-def on_connect(client, userdata, flags, rc):
+def on_connect(client, userdata, flags, rc, properties=None):
     print(f"Connected to MQTT broker with result code {rc}")
-    # Subscribe to the topic
+    # Subscribe to the topics, including the ones with a binary encoding suffix
     client.subscribe(settings.device_record_topic)
+    client.subscribe(settings.device_encoded_record_topic)
     client.subscribe(settings.device_state_topic)
+    client.subscribe(settings.device_encoded_state_topic)
+
+
+@lru_cache(maxsize=65536)
+def get_device_worker(device_id):
+    # Rendezvous hashing, a device only moves when the worker it was assigned to is added or removed
+    return max(range(settings.hub_workers),
+               key=lambda worker_index: hashlib.blake2b(f"{worker_index}/{device_id}".encode(), digest_size=8).digest())
 
 
 def on_message(client, userdata, msg):
     topic_parts = msg.topic.split("/")
 
-    # Extract device ID
-    device_id = topic_parts[1]
+    # Every message of a device goes to the worker that owns it, in the order it was received, so records, state
+    # changes and aggregation windows of a device stay ordered within one process
+    content_type = get_content_type(msg, topic_parts)
+    worker_index = get_device_worker(topic_parts[1])
+    if worker_index != settings.worker_index:
+        worker_pool.dispatch(worker_index, msg.topic, content_type, msg.payload)
+    else:
+        handle_message(msg.topic, content_type, msg.payload)
 
-    # Extract payload and convert it to json
-    data = msg.payload.decode("utf-8")
-    print(f"Received MQTT message: {data} from device {device_id}")
-    json_data = json.loads(data)
 
-    if topic_parts[2] == "state":
-        toggle_device_state(device_id, json_data['state'])
-    elif topic_parts[2] == "record":
-        send_device_record_to_server(device_id, json_data)
-    else:
-        print("Invalid topic")
+def handle_message(topic, content_type, payload):
+    # Called from the MQTT network thread, or from the thread reading the messages passed on to a worker
+    topic_parts = topic.split("/")
 
+    # Extract device ID
+    device_id = topic_parts[1]
 
-def send_device_record_to_server(device_id, record):
-    # Define the URL for the request
-    url = f"http://{settings.server_hostname}:{settings.server_port}/{settings.server_records_endpoint}/{device_id}"
-    send_request_with_retry(url=url, json_data=record)
+    mqtt_messages_received.inc(topic_parts[2])
 
+    # Decode payload according to its encoding. Anything raised here would stop the network thread of paho and with it
+    # every device, so a message that can not be handled is only counted and logged
+    try:
+        json_data = decode_payload(payload, content_type)
+        print(f"Received MQTT message: {json_data} from device {device_id}")
 
-def toggle_device_state(device_id, state):
-    # Define the URL for the request
-    url = f"http://{settings.server_hostname}:{settings.server_port}/{settings.server_devices_endpoint}/{device_id}/toggle"
-    # Define the params for the request
-    params = {
-        "is_online": True if state == "online" else False
-    }
-    send_request_with_retry(url=url, params=params)
+        if topic_parts[2] == "state":
+            toggle_device_state(device_id, json_data['state'])
+        elif topic_parts[2] == "record":
+            send_device_record_to_server(device_id, json_data)
+        else:
+            print("Invalid topic")
+    except (KeyError, TypeError, ValueError) as e:
+        mqtt_decode_failures.inc()
+        print(f"Invalid MQTT message from device {device_id}: {e}")
 
 
-def send_request_with_retry(url, json_data=None, params=None, retries=3):
-    headers = {
-        "Authorization": f"Bearer {settings.jwt}"
-    }
+def send_device_record_to_server(device_id, record):
+    # Records are stored and uploaded later in batches, so stamp them with the time they were received
+    record.setdefault("timestamp", datetime.now(timezone.utc).isoformat())
+    if settings.aggregation_mode != "raw" and thermo_humid_aggregator.accepts(record):
+        if thermo_humid_aggregator.add(device_id, record) and settings.aggregation_mode == "aggregate":
+            return
+    outbox.append(device_id, record)
 
-    try:
-        with httpx.Client() as client:
-            # Send the POST request with both JSON data and query parameters
-            response = client.post(url, json=json_data, headers=headers, params=params)
-            response.raise_for_status()
-            print(f"Response status code: {response.status_code}")
-            return response
-
-    except httpx.HTTPStatusError as e:
-        # Handle specific HTTP status errors
-        if e.response.status_code == 401:  # Unauthorized, possibly due to expired JWT
-            if retries > 0:
-                get_jwt()  # Refresh JWT token
-                return send_request_with_retry(url=url, json_data=json_data, params=params, retries=retries - 1)
-        else:
-            print(f"HTTP Status error occurred: {e}")
-
-    except httpx.RequestError as e:
-        # Handle request errors
-        if "Illegal header value" in str(e):
-            if retries > 0:
-                get_jwt()  # Refresh JWT token
-                return send_request_with_retry(url=url, json_data=json_data, params=params, retries=retries - 1)
-        else:
-            print(f"Request error occurred: {e}")
 
-    except Exception as e:
-        # Handle any other unexpected errors
-        print(f"Unexpected error occurred: {e}")
-    return None
+def toggle_device_state(device_id, state):
+    # State changes are coalesced per device and flushed to the Server periodically
+    presence_table.update(device_id, True if state == "online" else False)
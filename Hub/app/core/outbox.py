@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from functools import partial
+
+from app.core.config import settings
+from app.core.forwarder import forwarder, is_retryable
+from app.core.metrics import Gauge
+
+
+class Outbox:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "device_id TEXT NOT NULL, "
+            "payload TEXT NOT NULL)"
+        )
+        self.page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+        self.depth = self.connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self.evicted_records = 0
+        self.appends_since_size_check = 0
+        self.on_append = None
+
+    def append(self, device_id, record):
+        payload = json.dumps(record)
+        with self.lock:
+            record_id = self.connection.execute(
+                "INSERT INTO outbox (device_id, payload) VALUES (?, ?)", (device_id, payload)
+            ).lastrowid
+            self.depth += 1
+            self.appends_since_size_check += 1
+            if self.appends_since_size_check >= settings.outbox_size_check_interval:
+                self.appends_since_size_check = 0
+                self._enforce_disk_cap()
+        if self.on_append:
+            self.on_append(record_id)
+        return record_id
+
+    def read(self, after_id, limit):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT id, device_id, payload FROM outbox WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ).fetchall()
+
+    def delete(self, record_ids):
+        with self.lock:
+            self.connection.execute("BEGIN")
+            deleted = self.connection.executemany(
+                "DELETE FROM outbox WHERE id = ?", ((record_id,) for record_id in record_ids)
+            ).rowcount
+            self.connection.execute("COMMIT")
+            self.depth -= deleted
+
+    def size_bytes(self):
+        with self.lock:
+            return self._size_bytes()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _size_bytes(self):
+        page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist_count) * self.page_size
+
+    def _enforce_disk_cap(self):
+        # Evict the oldest records until the outbox fits into its disk budget again
+        while self.depth > 0 and self._size_bytes() > settings.outbox_max_bytes:
+            evicted = self.connection.execute(
+                "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)",
+                (max(self.depth // 10, 1),)
+            ).rowcount
+            self.depth -= evicted
+            self.evicted_records += evicted
+            print(f"Outbox is over its disk cap, evicted {evicted} oldest records")
+
+
+class OutboxRelay:
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self.outbox.on_append = self._on_append
+        self.loop = None
+        self.records_available = None
+        self.server_available = None
+        self.relay = None
+        self.last_read_id = 0
+        # Reading starts over after this id once a batch failed, its records are still in the outbox
+        self.retry_after_id = None
+        self.batches_in_flight = None
+        self.replaying = False
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.records_available = asyncio.Event()
+        self.server_available = asyncio.Event()
+        self.server_available.set()
+        self.batches_in_flight = asyncio.Semaphore(settings.outbox_max_batches_in_flight)
+        # Whatever is left from a previous run is sent first, in replay mode
+        self.replaying = self.outbox.depth > 0
+        self.relay = asyncio.create_task(self._relay())
+
+    async def stop(self):
+        self.relay.cancel()
+        await asyncio.gather(self.relay, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "outbox_depth": self.outbox.depth,
+            "outbox_bytes": self.outbox.size_bytes(),
+            "evicted_records": self.outbox.evicted_records,
+            "replaying": self.replaying,
+            "server_available": self.server_available.is_set()
+        }
+
+    def _on_append(self, record_id):
+        # Called from the MQTT network thread, wakes the relay up as soon as a full batch is waiting
+        if record_id - self.last_read_id == settings.record_batch_size:
+            self.loop.call_soon_threadsafe(self.records_available.set)
+
+    async def _relay(self):
+        while True:
+            # Send once a batch is full or the window has passed, whichever comes first
+            try:
+                await asyncio.wait_for(self.records_available.wait(), timeout=settings.record_batch_window)
+            except asyncio.TimeoutError:
+                pass
+            self.records_available.clear()
+
+            if not self.server_available.is_set():
+                # The Server is unreachable, probe it with the oldest records after a while
+                await asyncio.sleep(settings.outbox_retry_interval)
+                self.last_read_id = 0
+                self.retry_after_id = None
+                self.replaying = True
+                await self._probe()
+                continue
+
+            batch_size = settings.outbox_replay_batch_size if self.replaying else settings.record_batch_size
+            while self.server_available.is_set() and await self._send_batch(batch_size) == batch_size:
+                pass
+            if self.server_available.is_set():
+                self.replaying = False
+
+    async def _read_batch(self, batch_size):
+        if self.retry_after_id is not None:
+            # Batches sent after the failed one may be read again, the Server ignores records it already stored
+            self.last_read_id = min(self.last_read_id, self.retry_after_id)
+            self.retry_after_id = None
+        rows = await asyncio.to_thread(self.outbox.read, self.last_read_id, batch_size)
+        if rows:
+            self.last_read_id = rows[-1][0]
+        records = [{"device_id": device_id, "record": json.loads(payload)} for _, device_id, payload in rows]
+        return [row[0] for row in rows], {"records": records}
+
+    async def _send_batch(self, batch_size):
+        # Waits for an ack once enough batches are in flight, so a failure is noticed before reading much further
+        await self.batches_in_flight.acquire()
+        record_ids = []
+        try:
+            if self.server_available.is_set():
+                record_ids, batch = await self._read_batch(batch_size)
+            if record_ids:
+                await forwarder.enqueue(f"/{settings.server_records_batch_endpoint}", json_data=batch,
+                                        on_response=partial(self._on_relayed_batch_sent, record_ids))
+        finally:
+            if not record_ids:
+                self.batches_in_flight.release()
+        return len(record_ids)
+
+    async def _on_relayed_batch_sent(self, record_ids, response):
+        try:
+            await self._on_batch_sent(record_ids, response)
+        finally:
+            self.batches_in_flight.release()
+
+    async def _probe(self):
+        # Sent directly instead of through the queue, so the outcome is known before anything else is read
+        record_ids, batch = await self._read_batch(settings.record_batch_size)
+        if not record_ids:
+            self.server_available.set()
+            return
+        response = await forwarder.send_request_with_retry(f"/{settings.server_records_batch_endpoint}",
+                                                           json_data=batch)
+        await self._on_batch_sent(record_ids, response)
+
+    async def _on_batch_sent(self, record_ids, response):
+        if is_retryable(response):
+            # Keep the records, they are read again even if a later batch succeeds first
+            first_id = record_ids[0] - 1
+            self.retry_after_id = first_id if self.retry_after_id is None else min(self.retry_after_id, first_id)
+            self.server_available.clear()
+            return
+        if response.is_error:
+            print(f"Server rejected a batch of {len(record_ids)} records, dropping it")
+        await asyncio.to_thread(self.outbox.delete, record_ids)
+        if not self.server_available.is_set():
+            self.server_available.set()
+            self.records_available.set()
+
+
+def get_outbox_path():
+    # Every worker process relays the records it received from its own outbox
+    if settings.worker_index == 0:
+        return settings.outbox_path
+    root, extension = os.path.splitext(settings.outbox_path)
+    return f"{root}-{settings.worker_index}{extension}"
+
+
+outbox = Outbox(get_outbox_path())
+outbox_relay = OutboxRelay(outbox)
+Gauge("hub_outbox_depth", "Records stored in the outbox and not yet acknowledged by the Server", lambda: outbox.depth)
+Gauge("hub_outbox_bytes", "Disk space used by records in the outbox", outbox.size_bytes)
+Gauge("hub_outbox_evicted_records", "Records evicted from the outbox because of its disk cap",
+      lambda: outbox.evicted_records)
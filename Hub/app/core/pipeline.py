@@ -0,0 +1,41 @@
+from app.core.aggregation import thermo_humid_aggregator
+from app.core.config import settings
+from app.core.forwarder import forwarder
+from app.core.mqtt_handler import mqtt_client, on_connect, on_message
+from app.core.outbox import outbox, outbox_relay
+from app.core.presence import presence_table
+from app.core.token_manager import token_manager
+from app.core.uplink import stream_uplink
+
+
+async def start_pipeline():
+    # Initialize forwarding pipeline, JWT and MQTT client
+    await forwarder.start()
+    await token_manager.start(forwarder.client)
+    await stream_uplink.start()
+    await outbox_relay.start()
+    await presence_table.start()
+    if settings.aggregation_mode != "raw":
+        await thermo_humid_aggregator.start()
+    # The other workers get their device messages from this process
+    if settings.worker_index != 0:
+        return
+    mqtt_client.username_pw_set(settings.mqtt_username, settings.mqtt_password)
+    mqtt_client.on_connect = on_connect
+    mqtt_client.on_message = on_message
+    mqtt_client.connect(host=settings.hub_hostname, port=settings.mqtt_broker_port, keepalive=60)
+    mqtt_client.loop_start()
+
+
+async def stop_pipeline():
+    if settings.worker_index == 0:
+        mqtt_client.loop_stop()
+        mqtt_client.disconnect()
+    if settings.aggregation_mode != "raw":
+        await thermo_humid_aggregator.stop()
+    await outbox_relay.stop()
+    await presence_table.stop()
+    await token_manager.stop()
+    await forwarder.stop()
+    await stream_uplink.stop()
+    outbox.close()
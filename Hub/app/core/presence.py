@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from functools import partial
+
+from app.core.config import settings
+from app.core.forwarder import forwarder, is_retryable
+from app.core.metrics import Gauge
+
+
+class PresenceTable:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Latest state received per device since the last flush
+        self.pending = {}
+        # Last state the Server acknowledged per device
+        self.reported = {}
+        self.coalesced_transitions = 0
+        self.flusher = None
+
+    async def start(self):
+        self.flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        self.flusher.cancel()
+        await asyncio.gather(self.flusher, return_exceptions=True)
+        await self.flush()
+
+    def update(self, device_id, is_online):
+        # Called from the MQTT network thread, only the latest state of a device is kept
+        with self.lock:
+            if device_id in self.pending:
+                self.coalesced_transitions += 1
+            self.pending[device_id] = is_online
+
+    def stats(self):
+        return {
+            "pending_devices": len(self.pending),
+            "coalesced_transitions": self.coalesced_transitions
+        }
+
+    async def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        # Only the net change is sent, a device that went offline and back online again is skipped
+        changes = {device_id: is_online for device_id, is_online in pending.items()
+                   if self.reported.get(device_id) != is_online}
+        if not changes:
+            return
+        devices = [{"device_id": device_id, "is_online": is_online} for device_id, is_online in changes.items()]
+        await forwarder.enqueue(f"/{settings.server_devices_presence_endpoint}", json_data={"devices": devices},
+                                on_response=partial(self._on_presence_sent, changes))
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(settings.presence_flush_interval)
+            await self.flush()
+
+    async def _on_presence_sent(self, changes, response):
+        if is_retryable(response):
+            # Send the changes again with the next flush, unless a newer state arrived in the meantime
+            with self.lock:
+                for device_id, is_online in changes.items():
+                    self.pending.setdefault(device_id, is_online)
+            return
+        if response.is_error:
+            print(f"Server rejected presence of {len(changes)} devices")
+            return
+        self.reported.update(changes)
+
+
+presence_table = PresenceTable()
+Gauge("hub_presence_pending_devices", "Devices with a state change waiting to be flushed",
+      lambda: len(presence_table.pending))
@@ -0,0 +1,95 @@
+import asyncio
+import base64
+import json
+import time
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import token_refreshes
+
+
+def get_token_expiry(token):
+    # The signature is checked by the Server, the Hub only needs the exp claim to schedule a refresh
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return 0.0
+
+
+class TokenManager:
+    def __init__(self):
+        self.client = None
+        self.issued_at = 0.0
+        self.expires_at = 0.0
+        self.login_task = None
+        self.refresher = None
+
+    async def start(self, client):
+        self.client = client
+        if settings.server_api_key:
+            # API keys do not expire, there is nothing to refresh
+            settings.jwt = settings.server_api_key
+            return
+        await self.refresh()
+        self.refresher = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self.refresher is None:
+            return
+        self.refresher.cancel()
+        await asyncio.gather(self.refresher, return_exceptions=True)
+
+    @property
+    def token(self):
+        return settings.jwt
+
+    async def refresh(self, expired_token=None):
+        if settings.server_api_key:
+            return False
+        # A token that was already replaced does not need another login
+        if expired_token is not None and expired_token != settings.jwt:
+            return True
+        # Concurrent callers share a single in-flight login
+        if self.login_task is None or self.login_task.done():
+            self.login_task = asyncio.create_task(self._login())
+        return await asyncio.shield(self.login_task)
+
+    async def _refresh_periodically(self):
+        while True:
+            # Refresh ahead of expiry, so requests never wait for a login. The margin takes at most half of the
+            # token lifetime and logins stay apart, short-lived tokens must not turn this into a login loop
+            margin = min(settings.jwt_refresh_margin, (self.expires_at - self.issued_at) / 2)
+            await asyncio.sleep(max(self.expires_at - time.time() - margin, settings.jwt_min_refresh_interval))
+            if not await self.refresh():
+                await asyncio.sleep(settings.jwt_retry_interval)
+
+    async def _login(self):
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+        form = {"username": settings.user_email, "password": settings.user_password}
+        try:
+            response = await self.client.post(f"/{settings.server_auth_endpoint}/token", headers=headers, data=form)
+            response.raise_for_status()
+            print(f"Response status code: {response.status_code}")
+
+            token = response.json()["access_token"]
+            self.issued_at = time.time()
+            self.expires_at = get_token_expiry(token) or self.issued_at + settings.jwt_fallback_lifetime
+            # Requests in flight keep using the previous token until this swap
+            settings.jwt = token
+            token_refreshes.inc("success")
+            return True
+
+        except httpx.HTTPStatusError as e:
+            print(f"HTTP error occurred: {e}")
+        except httpx.RequestError as e:
+            print(f"Request error occurred: {e}")
+        token_refreshes.inc("failure")
+        return False
+
+
+token_manager = TokenManager()
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import time
+
+import httpx
+import msgpack
+import websockets
+
+from app.core.codecs import encode_body, MSGPACK_CONTENT_TYPE
+from app.core.config import settings
+from app.core.metrics import forward_latency, server_responses
+from app.core.token_manager import token_manager
+
+
+class StreamUplink:
+    def __init__(self):
+        self.websocket = None
+        self.window = None
+        self.sequence = 0
+        # Futures of the frames waiting for an ack, by sequence number
+        self.pending = {}
+        self.connector = None
+        # Requests that can be sent as stream frames, by path
+        self.frame_types = {
+            f"/{settings.server_records_batch_endpoint}": "records",
+            f"/{settings.server_devices_presence_endpoint}": "presence"
+        }
+
+    async def start(self):
+        if settings.server_stream_enabled:
+            self.connector = asyncio.create_task(self._connect_periodically())
+
+    async def stop(self):
+        if self.connector:
+            self.connector.cancel()
+            await asyncio.gather(self.connector, return_exceptions=True)
+
+    def accepts(self, path):
+        return self.websocket is not None and path in self.frame_types
+
+    def stats(self):
+        return {
+            "connected": self.websocket is not None,
+            "pending_frames": len(self.pending)
+        }
+
+    async def send(self, path, json_data):
+        # Returns None when the stream is lost, the caller then falls back to HTTP
+        async with self.window:
+            websocket = self.websocket
+            if websocket is None:
+                return None
+            self.sequence += 1
+            sequence = self.sequence
+            ack = self.pending[sequence] = asyncio.get_running_loop().create_future()
+            frame = {"seq": sequence, "type": self.frame_types[path], "body": json_data}
+
+            start = time.perf_counter()
+            try:
+                if settings.server_content_type == MSGPACK_CONTENT_TYPE:
+                    await websocket.send(msgpack.packb(frame))
+                else:
+                    await websocket.send(encode_body(frame, settings.server_content_type).decode("utf-8"))
+                result = await asyncio.wait_for(ack, timeout=settings.server_request_timeout)
+            except (websockets.ConnectionClosed, asyncio.TimeoutError):
+                return None
+            finally:
+                self.pending.pop(sequence, None)
+
+        forward_latency.observe(time.perf_counter() - start, path)
+        server_responses.inc(str(result["status"]))
+        return httpx.Response(result["status"], json=result.get("body"), request=httpx.Request("POST", path))
+
+    async def _connect_periodically(self):
+        url = f"ws://{settings.server_hostname}:{settings.server_port}/{settings.server_stream_endpoint}"
+        while True:
+            token = token_manager.token
+            try:
+                # The Server checks the token when the stream is opened and again before every frame, a rejected
+                # token closes the stream with 1008 and the frames that were not acked fall back to HTTP
+                async with websockets.connect(url, extra_headers={"Authorization": f"Bearer {token}"},
+                                              compression=None) as websocket:
+                    hello = json.loads(await websocket.recv())
+                    self.window = asyncio.Semaphore(hello["window"])
+                    self.websocket = websocket
+                    print(f"Stream uplink connected with a window of {hello['window']} frames")
+                    await self._receive_acks(websocket)
+            except websockets.InvalidStatusCode as e:
+                print(f"Stream uplink rejected: {e}")
+                await token_manager.refresh(expired_token=token)
+            except websockets.ConnectionClosed as e:
+                print(f"Stream uplink closed: {e}")
+                if e.rcvd and e.rcvd.code == 1008:
+                    await token_manager.refresh(expired_token=token)
+            except (OSError, websockets.WebSocketException) as e:
+                print(f"Stream uplink unavailable: {e}")
+            finally:
+                self.websocket = None
+                for ack in self.pending.values():
+                    if not ack.done():
+                        ack.set_exception(websockets.ConnectionClosed(None, None))
+            await asyncio.sleep(settings.server_stream_retry_interval)
+
+    async def _receive_acks(self, websocket):
+        async for message in websocket:
+            result = msgpack.unpackb(message) if isinstance(message, bytes) else json.loads(message)
+            ack = self.pending.get(result["ack"])
+            if ack is not None and not ack.done():
+                ack.set_result(result)
+
+
+stream_uplink = StreamUplink()
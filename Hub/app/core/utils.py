@@ -1,8 +1,3 @@
-import httpx
-
-from app.core.config import settings
-
-
 def update_env_file(key, value):
     # Path to the .env file
     env_file_path = '.env'
@@ -23,24 +18,3 @@ def update_env_file(key, value):
     with open(env_file_path, 'w') as f:
         f.writelines(updated_lines)
 
-
-def get_jwt():
-    # Define the URL
-    url = f"http://{settings.server_hostname}:{settings.server_port}/{settings.server_auth_endpoint}/token"
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    form = {"username": settings.user_email, "password": settings.user_password}
-    try:
-        with httpx.Client() as client:
-            response = client.post(url, headers=headers, data=form)
-            response.raise_for_status()
-            print(f"Response status code: {response.status_code}")
-
-            if response.status_code == 200:
-                settings.jwt = response.json()["access_token"]
-
-    except httpx.HTTPStatusError as e:
-        print(f"HTTP error occurred: {e}")
-    except httpx.RequestError as e:
-        print(f"Request error occurred: {e}")
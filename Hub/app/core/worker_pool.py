@@ -0,0 +1,75 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import msgpack
+
+from app.core.config import settings
+from app.core.metrics import worker_dispatch_failures
+
+
+class WorkerPool:
+    def __init__(self):
+        self.processes = {}
+        self.monitor = None
+
+    async def start(self):
+        # This process is worker 0, the others only consume device messages
+        for worker_index in range(1, settings.hub_workers):
+            self._spawn(worker_index)
+        self.monitor = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        self.monitor.cancel()
+        await asyncio.gather(self.monitor, return_exceptions=True)
+        for process in self.processes.values():
+            # Workers stop once they handled the messages left in their pipe
+            process.stdin.close()
+        for worker_index, process in self.processes.items():
+            try:
+                await asyncio.to_thread(process.wait, settings.worker_shutdown_timeout)
+            except subprocess.TimeoutExpired:
+                print(f"Hub worker {worker_index} did not stop in time, killing it")
+                process.kill()
+        self.processes = {}
+
+    async def restart(self):
+        # Workers read their settings when they start, so they are restarted to pick up new ones
+        await self.stop()
+        await self.start()
+
+    def stats(self):
+        return {
+            "workers": settings.hub_workers,
+            "running": 1 + sum(process.poll() is None for process in self.processes.values())
+        }
+
+    def dispatch(self, worker_index, topic, content_type, payload):
+        # Called from the MQTT network thread. Messages are written to the stdin of the worker, length prefixed, and
+        # a worker that falls behind blocks the writes, so it slows the intake down instead of losing messages
+        frame = msgpack.packb([topic, content_type, payload])
+        try:
+            process = self.processes[worker_index]
+            process.stdin.write(len(frame).to_bytes(4, "big") + frame)
+            process.stdin.flush()
+        except (KeyError, OSError, ValueError) as e:
+            # The worker is not running, or is being restarted and its pipe is closed
+            worker_dispatch_failures.inc()
+            print(f"Failed to pass a message on to Hub worker {worker_index}: {e}")
+
+    def _spawn(self, worker_index):
+        env = dict(os.environ, worker_index=str(worker_index))
+        self.processes[worker_index] = subprocess.Popen([sys.executable, "-m", "app.worker"], env=env,
+                                                        stdin=subprocess.PIPE)
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(settings.worker_restart_delay)
+            for worker_index, process in list(self.processes.items()):
+                if process.poll() is not None:
+                    print(f"Hub worker {worker_index} exited with code {process.returncode}, restarting it")
+                    self._spawn(worker_index)
+
+
+worker_pool = WorkerPool()
@@ -1,25 +1,30 @@
 import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
 from app.core.MDNS_service import MDNSService
 from app.entities.schemas import UserCredentials
 from app.core.config import settings
-from app.core.utils import update_env_file, get_jwt
-from app.core.mqtt_handler import mqtt_client, on_connect, on_message
+from app.core.utils import update_env_file
+from app.core.pipeline import start_pipeline, stop_pipeline
+from app.core.worker_pool import worker_pool
+from app.core.forwarder import forwarder
+from app.core.token_manager import token_manager
+from app.core.outbox import outbox_relay
+from app.core.presence import presence_table
+from app.core.uplink import stream_uplink
+from app.core import metrics
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize JWT and MQTT client
-    get_jwt()
-    mqtt_client.username_pw_set(settings.mqtt_username, settings.mqtt_password)
-    mqtt_client.on_connect = on_connect
-    mqtt_client.on_message = on_message
-    mqtt_client.connect(host=settings.hub_hostname, port=settings.mqtt_broker_port, keepalive=60)
-    mqtt_client.loop_start()
-
-    # Initialize mDNS service
+    # Initialize the worker processes sharing the device traffic with this one, before any message is passed on to
+    # them, then the forwarding pipeline
+    await worker_pool.start()
+    await start_pipeline()
+
+    # Initialize mDNS service, only this process registers it
     loop = asyncio.get_event_loop()
     mdns_service = await loop.run_in_executor(None, MDNSService)
     try:
@@ -27,8 +32,8 @@ async def lifespan(app: FastAPI):
     finally:
         # Cleanup resources
         await loop.run_in_executor(None, mdns_service.close)
-        mqtt_client.loop_stop()
-        mqtt_client.disconnect()
+        await stop_pipeline()
+        await worker_pool.stop()
 
 
 # Create FastAPI app with custom lifespan
@@ -37,7 +42,14 @@ app = FastAPI(lifespan=lifespan)
 
 @app.get("/API/health")
 async def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "forwarder": forwarder.stats(), "outbox": outbox_relay.stats(),
+            "presence": presence_table.stats(), "workers": worker_pool.stats(), "stream": stream_uplink.stats()}
+
+
+@app.get("/API/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    snapshots = await asyncio.to_thread(metrics.read_reports)
+    return PlainTextResponse(metrics.render(snapshots), media_type="text/plain; version=0.0.4")
 
 
 @app.put("/API/update-credentials")
@@ -46,4 +58,6 @@ async def update_credentials(credentials: UserCredentials):
     settings.user_password = credentials.password
     update_env_file("user_email", credentials.email)
     update_env_file("user_password", credentials.password)
+    await token_manager.refresh()
+    await worker_pool.restart()
     return {"message": "Success"}
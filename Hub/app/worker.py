@@ -0,0 +1,47 @@
+import asyncio
+import signal
+import sys
+import threading
+
+import msgpack
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.mqtt_handler import handle_message
+from app.core.pipeline import start_pipeline, stop_pipeline
+
+
+def read_messages(stream, on_closed):
+    # Device messages passed on by the main process, see WorkerPool.dispatch. The pipe closes when the main process
+    # stops or exits
+    try:
+        while len(header := stream.read(4)) == 4:
+            topic, content_type, payload = msgpack.unpackb(stream.read(int.from_bytes(header, "big")))
+            handle_message(topic, content_type, payload)
+    finally:
+        on_closed()
+
+
+async def main():
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stopped.set)
+
+    await start_pipeline()
+    reporter = asyncio.create_task(metrics.report_periodically())
+    threading.Thread(target=read_messages, args=(sys.stdin.buffer, lambda: loop.call_soon_threadsafe(stopped.set)),
+                     daemon=True).start()
+    print(f"Hub worker {settings.worker_index} started")
+    try:
+        await stopped.wait()
+    finally:
+        reporter.cancel()
+        await asyncio.gather(reporter, return_exceptions=True)
+        await stop_pipeline()
+        print(f"Hub worker {settings.worker_index} stopped")
+
+
+# Started by the worker pool of the main process: python -m app.worker
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,219 @@
+# Drives the Hub forwarding path with a fleet of simulated devices against an in-process stand-in Server.
+# No broker or Server is needed, messages go straight into on_message like the MQTT network thread would deliver them.
+# Run from the Hub directory: python -m benchmarks.load_generator --devices 1000 --interval 1 --duration 30
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Settings without a .env file, the stand-in Server is reached through the forwarder transport
+for key, value in {"hub_id": "benchmark", "http_port": "8000", "mqtt_broker_port": "1883",
+                   "mqtt_username": "benchmark", "mqtt_password": "benchmark", "server_hostname": "localhost",
+                   "server_port": "9000", "user_email": "benchmark", "user_password": "benchmark"}.items():
+    os.environ.setdefault(key, value)
+directory = tempfile.TemporaryDirectory()
+os.environ["outbox_path"] = os.path.join(directory.name, "outbox.db")
+
+import httpx
+import paho.mqtt.client as mqtt
+from fastapi import FastAPI, Request, Response
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.forwarder import forwarder
+from app.core.mqtt_handler import on_message
+from app.core.outbox import outbox, outbox_relay
+from app.core.presence import presence_table
+from app.core.token_manager import token_manager
+
+# Same topics and messages the firmware in Devices/ publishes
+STATE_ONLINE_MESSAGE = b'{"state":"online"}'
+STATE_OFFLINE_MESSAGE = b'{"state":"offline"}'
+WASTE_TYPES = ["RECYCLABLE", "NON_RECYCLABLE"]
+
+
+def thermo_humid_meter_messages():
+    temperature = random.uniform(15, 30)
+    humidity = random.uniform(30, 70)
+    return [f'{{"temperature":"{temperature:.2f}", "humidity":"{humidity:.2f}"}}'.encode()]
+
+
+def waste_sorter_messages():
+    # Every sorted item is followed by the fill levels of both bins
+    return [f'{{"waste_type":"{random.choice(WASTE_TYPES)}"}}'.encode(),
+            f'{{"recyclable_level":"{random.randint(0, 100)}", '
+            f'"non_recyclable_level":"{random.randint(0, 100)}"}}'.encode()]
+
+
+def create_message(topic, payload):
+    msg = mqtt.MQTTMessage(topic=topic.encode())
+    msg.payload = payload
+    return msg
+
+
+class StubServer:
+    def __init__(self, latency, failure_rate):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.delivered_records = 0
+        self.failed_requests = 0
+        self.presence_updates = 0
+        self.latencies = []
+        self.app = FastAPI()
+        self.app.post("/API/auth/token")(self.login)
+        self.app.post("/API/records/batch")(self.create_records_batch)
+        self.app.post("/API/devices/presence")(self.update_devices_presence)
+
+    async def login(self):
+        claims = base64.urlsafe_b64encode(json.dumps({"exp": time.time() + 3600}).encode()).decode().rstrip("=")
+        return {"access_token": f"header.{claims}.signature", "token_type": "bearer"}
+
+    async def respond(self):
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+        if random.random() < self.failure_rate:
+            self.failed_requests += 1
+            return False
+        return True
+
+    async def create_records_batch(self, request: Request):
+        body = await request.body()
+        if not await self.respond():
+            return Response(status_code=503)
+        now = time.time()
+        records = json.loads(body)["records"]
+        for item in records:
+            # The Hub stamps every record when it is received, so this is the time spent inside the Hub
+            self.latencies.append(now - datetime.fromisoformat(item["record"]["timestamp"]).timestamp())
+        self.delivered_records += len(records)
+        return {"accepted": len(records), "rejected": 0}
+
+    async def update_devices_presence(self, request: Request):
+        body = await request.body()
+        if not await self.respond():
+            return Response(status_code=503)
+        devices = json.loads(body)["devices"]
+        self.presence_updates += len(devices)
+        return {"updated": len(devices), "unknown": 0}
+
+
+class DeviceFleet:
+    def __init__(self, devices, interval, churn):
+        self.interval = interval
+        self.churn = churn
+        self.devices = [(f"device-{i}", thermo_humid_meter_messages if i % 2 == 0 else waste_sorter_messages)
+                        for i in range(devices)]
+        self.published_messages = 0
+        self.published_records = 0
+        self.state_messages = 0
+
+    def publish(self, device_id, kind, payload):
+        on_message(None, None, create_message(f"device/{device_id}/{kind}", payload))
+        self.published_messages += 1
+
+    def run(self, duration):
+        for device_id, _ in self.devices:
+            self.publish(device_id, "state", STATE_ONLINE_MESSAGE)
+            self.state_messages += 1
+
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            cycle_start = time.perf_counter()
+            for device_id, messages in self.devices:
+                if random.random() < self.churn:
+                    # Lost connection, the broker publishes the last will and the device comes back online
+                    self.publish(device_id, "state", STATE_OFFLINE_MESSAGE)
+                    self.publish(device_id, "state", STATE_ONLINE_MESSAGE)
+                    self.state_messages += 2
+                for payload in messages():
+                    self.publish(device_id, "record", payload)
+                    self.published_records += 1
+            time.sleep(max(self.interval - (time.perf_counter() - cycle_start), 0))
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100, method="inclusive")[round(fraction * 100) - 1]
+
+
+async def run(args):
+    stub = StubServer(args.latency, args.failure_rate)
+    fleet = DeviceFleet(args.devices, args.interval, args.churn)
+    settings.outbox_retry_interval = args.retry_interval
+
+    await forwarder.start(transport=httpx.ASGITransport(app=stub.app))
+    await token_manager.start(forwarder.client)
+    await outbox_relay.start()
+    await presence_table.start()
+
+    # Devices publish from their own thread, like the paho network loop does
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        publisher = threading.Thread(target=fleet.run, args=(args.duration,))
+        publisher.start()
+        while publisher.is_alive():
+            await asyncio.sleep(0.1)
+        publish_time = time.perf_counter() - start
+
+        drain_deadline = time.perf_counter() + args.drain_timeout
+        while outbox.depth > 0 and time.perf_counter() < drain_deadline:
+            await asyncio.sleep(0.1)
+        total_time = time.perf_counter() - start
+
+        await outbox_relay.stop()
+        await presence_table.stop()
+        await token_manager.stop()
+        await forwarder.stop()
+    remaining_records = outbox.depth
+    outbox.close()
+
+    dropped_records = fleet.published_records - stub.delivered_records - remaining_records
+    print(f"Devices: {args.devices}, interval: {args.interval}s, Server latency: {args.latency * 1000:.0f}ms, "
+          f"failure rate: {args.failure_rate:.0%}")
+    print(f"Published {fleet.published_messages} messages ({fleet.published_records} records, "
+          f"{fleet.state_messages} state changes) in {publish_time:.1f}s: "
+          f"{fleet.published_messages / publish_time:,.0f} msgs/s")
+    print(f"Delivered {stub.delivered_records} records in {total_time:.1f}s: "
+          f"{stub.delivered_records / total_time:,.0f} records/s")
+    print(f"Forward latency: p50 {percentile(stub.latencies, 0.5) * 1000:,.1f}ms, "
+          f"p99 {percentile(stub.latencies, 0.99) * 1000:,.1f}ms")
+    print(f"Presence updates sent: {stub.presence_updates}, coalesced transitions: "
+          f"{presence_table.coalesced_transitions}")
+    print(f"Failed Server requests: {stub.failed_requests}, retries: {sum(metrics.server_retries.values.values())}")
+    print(f"Left in outbox: {remaining_records}, evicted: {outbox.evicted_records}, "
+          f"decode failures: {sum(metrics.mqtt_decode_failures.values.values())}, dropped: {dropped_records}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=1000, help="Number of simulated devices")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Seconds between two readings of one device, 0 publishes as fast as possible")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to publish for")
+    parser.add_argument("--churn", type=float, default=0.01,
+                        help="Probability that a device reconnects (offline and online state) per reading")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mean Server response time in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of Server requests failing with 503")
+    parser.add_argument("--retry-interval", type=float, default=1.0,
+                        help="Seconds before the outbox probes an unavailable Server again")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                        help="Seconds to wait for the outbox to drain after publishing stops")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
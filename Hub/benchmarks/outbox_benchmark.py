@@ -0,0 +1,51 @@
+# Measures sustained outbox append throughput against the publish rate of a device fleet.
+# Run from the Hub directory: python -m benchmarks.outbox_benchmark --devices 500 --interval 10
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Settings without a .env file, only the values the outbox needs matter here
+for key, value in {"hub_id": "benchmark", "http_port": "8000", "mqtt_broker_port": "1883",
+                   "mqtt_username": "benchmark", "mqtt_password": "benchmark", "server_hostname": "localhost",
+                   "server_port": "9000", "user_email": "benchmark", "user_password": "benchmark"}.items():
+    os.environ.setdefault(key, value)
+
+from app.core.outbox import Outbox
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=500, help="Number of devices in the fleet")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between two records of one device")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = Outbox(os.path.join(directory, "outbox.db"))
+        record = {"temperature": "21.50", "humidity": "45.20", "timestamp": datetime.now(timezone.utc).isoformat()}
+
+        start = time.perf_counter()
+        for i in range(args.records):
+            outbox.append(f"device-{i % args.devices}", record)
+        append_rate = args.records / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        last_id = 0
+        while rows := outbox.read(last_id, args.batch_size):
+            last_id = rows[-1][0]
+            outbox.delete([row[0] for row in rows])
+        drain_rate = args.records / (time.perf_counter() - start)
+        outbox.close()
+
+    fleet_rate = args.devices / args.interval
+    print(f"Appended {args.records} records: {append_rate:,.0f} records/s")
+    print(f"Drained in batches of {args.batch_size}: {drain_rate:,.0f} records/s")
+    print(f"Fleet of {args.devices} devices publishing every {args.interval}s: {fleet_rate:,.0f} records/s "
+          f"({append_rate / fleet_rate:,.0f}x headroom)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Compares JSON and MessagePack decode throughput for device payloads and the size of record batch uploads.
+# Run from the Hub directory: python -m benchmarks.payload_decode_benchmark
+import argparse
+import json
+import timeit
+from datetime import datetime, timezone
+
+import msgpack
+
+from app.core.codecs import decode_payload, encode_body, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE
+
+# Same messages the firmware in Devices/ publishes
+payloads = {
+    "thermo_humid_meter": {"temperature": "21.50", "humidity": "45.20"},
+    "waste_sorter_recycle": {"waste_type": "RECYCLABLE"},
+    "waste_sorter_level": {"recyclable_level": "35.00", "non_recyclable_level": "80.00"},
+    "state": {"state": "online"}
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    for name, payload in payloads.items():
+        json_payload = json.dumps(payload).encode("utf-8")
+        msgpack_payload = msgpack.packb(payload)
+        json_time = timeit.timeit(lambda: decode_payload(json_payload, JSON_CONTENT_TYPE), number=args.iterations)
+        msgpack_time = timeit.timeit(lambda: decode_payload(msgpack_payload, MSGPACK_CONTENT_TYPE),
+                                     number=args.iterations)
+        print(f"{name:22} JSON {len(json_payload):3} B {args.iterations / json_time:>12,.0f} msg/s | "
+              f"MessagePack {len(msgpack_payload):3} B {args.iterations / msgpack_time:>12,.0f} msg/s")
+
+    timestamp = datetime.now(timezone.utc).isoformat()
+    batch = {"records": [{"device_id": "8d0e9f5c-3f5e-4c1e-9f0e-2b7d1c4a6e11",
+                          "record": {**payloads["thermo_humid_meter"], "timestamp": timestamp}}
+                         for _ in range(args.batch_size)]}
+    json_body = encode_body(batch, JSON_CONTENT_TYPE)
+    msgpack_body = encode_body(batch, MSGPACK_CONTENT_TYPE)
+    print(f"Batch of {args.batch_size} records: JSON {len(json_body):,} B | MessagePack {len(msgpack_body):,} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import io
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+directory = tempfile.TemporaryDirectory()
+os.environ.setdefault("hub_id", "test-hub")
+os.environ.setdefault("http_port", "8000")
+os.environ.setdefault("mqtt_broker_port", "1883")
+os.environ.setdefault("mqtt_username", "test")
+os.environ.setdefault("mqtt_password", "test")
+os.environ.setdefault("server_hostname", "localhost")
+os.environ.setdefault("server_port", "8001")
+os.environ.setdefault("outbox_path", f"{directory.name}/outbox.db")
+
+import msgpack
+import pytest
+
+from app.core import mqtt_handler
+from app.core.config import settings
+from app.core.metrics import mqtt_decode_failures
+from app.core.worker_pool import worker_pool
+from app.worker import read_messages
+
+
+@pytest.fixture
+def appended(monkeypatch):
+    records = []
+
+    def append(device_id, record):
+        # Serialized like the outbox stores it
+        records.append((device_id, json.loads(json.dumps(record))))
+
+    monkeypatch.setattr(mqtt_handler.outbox, "append", append)
+    return records
+
+
+def receive(topic, payload):
+    mqtt_handler.on_message(None, None, SimpleNamespace(topic=topic, payload=payload, properties=None))
+
+
+@pytest.mark.parametrize("topic, payload", [
+    ("device/1/record", b"1"),
+    ("device/1/record", b"[1]"),
+    ("device/1/record", b"{"),
+    ("device/1/record/msgpack", msgpack.packb([1])),
+    ("device/1/record/msgpack", msgpack.packb({"temperature": b"\x00"})),
+    ("device/1/record/msgpack", msgpack.packb({"readings": [b"\x00"]})),
+    ("device/1/state", b"{}"),
+])
+def test_invalid_message_is_counted(appended, topic, payload):
+    failures = mqtt_decode_failures.values.get((), 0)
+    receive(topic, payload)
+    assert mqtt_decode_failures.values[()] == failures + 1
+    assert appended == []
+
+
+def test_valid_messages_are_appended(appended):
+    receive("device/1/record", json.dumps({"temperature": 21.5}).encode())
+    receive("device/2/record/msgpack", msgpack.packb({"humidity": 40}))
+    assert [(device_id, sorted(record)) for device_id, record in appended] == [
+        ("1", ["temperature", "timestamp"]), ("2", ["humidity", "timestamp"])
+    ]
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    def set_workers(count):
+        monkeypatch.setattr(settings, "hub_workers", count)
+        mqtt_handler.get_device_worker.cache_clear()
+
+    yield set_workers
+    mqtt_handler.get_device_worker.cache_clear()
+
+
+def test_get_device_worker(workers):
+    workers(4)
+    owners = {device_id: mqtt_handler.get_device_worker(str(device_id)) for device_id in range(1000)}
+    assert all(150 < list(owners.values()).count(worker_index) < 350 for worker_index in range(4))
+
+    # Only the devices the added worker takes over move
+    workers(5)
+    moved = [device_id for device_id, owner in owners.items() if mqtt_handler.get_device_worker(str(device_id)) != owner]
+    assert all(mqtt_handler.get_device_worker(str(device_id)) == 4 for device_id in moved)
+    assert 100 < len(moved) < 300
+
+
+def test_subscriptions_are_not_shared():
+    client = SimpleNamespace(subscribe=lambda topic: topics.append(topic))
+    topics = []
+    mqtt_handler.on_connect(client, None, None, 0)
+    assert topics == ["device/+/record", "device/+/record/+", "device/+/state", "device/+/state/+"]
+
+
+def test_messages_go_to_the_owner_of_the_device(workers, appended, monkeypatch):
+    workers(3)
+    dispatched = []
+    monkeypatch.setattr(worker_pool, "dispatch", lambda *message: dispatched.append(message))
+    device_ids = [str(device_id) for device_id in range(30)]
+    for device_id in device_ids:
+        receive(f"device/{device_id}/record", b'{"value": 1}')
+        receive(f"device/{device_id}/state/msgpack", msgpack.packb({"state": "online"}))
+
+    owned = [device_id for device_id in device_ids if mqtt_handler.get_device_worker(device_id) == 0]
+    assert [device_id for device_id, record in appended] == owned
+    assert dispatched == [
+        message for device_id in device_ids if device_id not in owned for message in (
+            (mqtt_handler.get_device_worker(device_id), f"device/{device_id}/record", "application/json",
+             b'{"value": 1}'),
+            (mqtt_handler.get_device_worker(device_id), f"device/{device_id}/state/msgpack", "application/msgpack",
+             msgpack.packb({"state": "online"}))
+        )
+    ]
+
+
+def test_worker_reads_dispatched_messages(appended, monkeypatch):
+    pipe = io.BytesIO()
+    monkeypatch.setattr(worker_pool, "processes", {1: SimpleNamespace(stdin=pipe)})
+    for value in range(3):
+        worker_pool.dispatch(1, "device/7/record/msgpack", "application/msgpack", msgpack.packb({"value": value}))
+
+    closed = []
+    pipe.seek(0)
+    read_messages(pipe, lambda: closed.append(True))
+    assert [record["value"] for device_id, record in appended] == [0, 1, 2]
+    assert closed == [True]
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import tempfile
+
+directory = tempfile.TemporaryDirectory()
+os.environ.setdefault("hub_id", "test-hub")
+os.environ.setdefault("http_port", "8000")
+os.environ.setdefault("mqtt_broker_port", "1883")
+os.environ.setdefault("mqtt_username", "test")
+os.environ.setdefault("mqtt_password", "test")
+os.environ.setdefault("server_hostname", "localhost")
+os.environ.setdefault("server_port", "8001")
+os.environ.setdefault("outbox_path", f"{directory.name}/outbox.db")
+
+import httpx
+import pytest
+
+from app.core import outbox as outbox_module
+from app.core.config import settings
+from app.core.outbox import Outbox, OutboxRelay
+
+
+@pytest.fixture
+def relay(monkeypatch):
+    monkeypatch.setattr(settings, "record_batch_size", 10)
+    monkeypatch.setattr(settings, "record_batch_window", 0.01)
+    monkeypatch.setattr(settings, "outbox_retry_interval", 0.01)
+    outbox = Outbox(f"{directory.name}/relay-{os.urandom(4).hex()}.db")
+    yield OutboxRelay(outbox)
+    outbox.close()
+
+
+def run_relay(relay, monkeypatch, respond, records=100):
+    sent = []
+    in_flight = [0, 0]
+
+    async def acknowledge(numbers, on_response):
+        # Acked later, like by a forwarder worker, while the relay keeps reading
+        await asyncio.sleep(0.005)
+        in_flight[0] -= 1
+        await on_response(httpx.Response(respond(numbers)))
+
+    async def enqueue(path, json_data=None, params=None, on_response=None):
+        numbers = [item["record"]["n"] for item in json_data["records"]]
+        sent.append(numbers)
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        asyncio.ensure_future(acknowledge(numbers, on_response))
+
+    monkeypatch.setattr(outbox_module.forwarder, "enqueue", enqueue)
+
+    async def run():
+        await relay.start()
+        for n in range(records):
+            relay.outbox.append("device", {"n": n})
+        for _ in range(200):
+            if relay.outbox.depth == 0:
+                break
+            await asyncio.sleep(0.01)
+        await relay.stop()
+
+    asyncio.run(run())
+    return sent, in_flight[1]
+
+
+def test_failed_batch_is_sent_again_after_later_success(relay, monkeypatch):
+    failures = []
+
+    def respond(numbers):
+        # The second batch fails once, the Server is healthy otherwise
+        if numbers[0] == 10 and not failures:
+            failures.append(numbers)
+            return 503
+        return 200
+
+    sent, _ = run_relay(relay, monkeypatch, respond)
+    assert failures
+    assert relay.outbox.depth == 0
+    assert sent.count(failures[0]) >= 2
+
+
+def test_batches_in_flight_are_bounded(relay, monkeypatch):
+    monkeypatch.setattr(settings, "outbox_max_batches_in_flight", 2)
+    sent, most_in_flight = run_relay(relay, monkeypatch, lambda numbers: 200)
+    assert relay.outbox.depth == 0
+    assert len(sent) == 10
+    assert most_in_flight == 2
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import time
+
+os.environ.setdefault("hub_id", "test-hub")
+os.environ.setdefault("http_port", "8000")
+os.environ.setdefault("mqtt_broker_port", "1883")
+os.environ.setdefault("mqtt_username", "test")
+os.environ.setdefault("mqtt_password", "test")
+os.environ.setdefault("server_hostname", "localhost")
+os.environ.setdefault("server_port", "8001")
+
+import pytest
+
+from app.core import token_manager as token_manager_module
+from app.core.config import settings
+from app.core.token_manager import TokenManager
+
+
+def run_refresher(monkeypatch, lifetime, refreshes=3):
+    manager = TokenManager()
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+        if len(sleeps) >= refreshes:
+            raise asyncio.CancelledError
+
+    async def refresh():
+        # Logins return a token with the same short lifetime every time
+        manager.issued_at = time.time()
+        manager.expires_at = manager.issued_at + lifetime
+        return True
+
+    monkeypatch.setattr(token_manager_module.asyncio, "sleep", sleep)
+    monkeypatch.setattr(manager, "refresh", refresh)
+    asyncio.run(refresh())
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(manager._refresh_periodically())
+    return sleeps
+
+
+def test_refresh_short_lived_token(monkeypatch):
+    monkeypatch.setattr(settings, "jwt_refresh_margin", 120.0)
+    sleeps = run_refresher(monkeypatch, lifetime=60)
+    # The margin is clamped to half the lifetime instead of refreshing right away
+    assert all(25 < delay <= 30 for delay in sleeps)
+
+
+def test_refresh_expired_token(monkeypatch):
+    monkeypatch.setattr(settings, "jwt_min_refresh_interval", 10.0)
+    sleeps = run_refresher(monkeypatch, lifetime=0)
+    assert sleeps == [10.0] * 3
+
+
+def test_concurrent_refreshes_share_one_login(monkeypatch):
+    monkeypatch.setattr(settings, "server_api_key", "")
+    monkeypatch.setattr(settings, "jwt", "expired")
+    manager = TokenManager()
+    logins = []
+
+    async def login():
+        logins.append(settings.jwt)
+        await asyncio.sleep(0.01)
+        settings.jwt = f"token-{len(logins)}"
+        return True
+
+    monkeypatch.setattr(manager, "_login", login)
+
+    async def run():
+        # Every request rejected with the expired token retries at once
+        results = await asyncio.gather(*(manager.refresh(expired_token="expired") for _ in range(50)))
+        assert results == [True] * 50
+        assert logins == ["expired"]
+        # A late retry with the replaced token uses the new one without logging in again
+        assert await manager.refresh(expired_token="expired")
+        assert logins == ["expired"]
+        # Once the new token is rejected too, there is a single new login
+        await asyncio.gather(*(manager.refresh(expired_token="token-1") for _ in range(50)))
+        assert logins == ["expired", "token-1"]
+
+    asyncio.run(run())
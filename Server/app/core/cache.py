@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from uuid import UUID
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+# Postgres refuses NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+
+class LRUTTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl=None):
+        self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl)))
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class InvalidationBus:
+    # Delivers invalidations to the caches of this process only
+    def __init__(self):
+        self.caches = {}
+
+    def register(self, name: str, cache: LRUTTLCache, key_type=UUID):
+        self.caches[name] = (cache, key_type)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, name: str, key):
+        await self.publish_many(name, [key])
+
+    async def publish_many(self, name: str, keys):
+        self._deliver(name, [str(key) for key in keys])
+
+    def _deliver(self, name: str, keys: list[str]):
+        if name in self.caches:
+            cache, key_type = self.caches[name]
+            for key in keys:
+                cache.invalidate(key_type(key))
+
+    def _clear_all(self):
+        for cache, _ in self.caches.values():
+            cache.clear()
+
+
+class PostgresInvalidationBus(InvalidationBus):
+    # Keeps the caches of every worker coherent through LISTEN/NOTIFY on the regular database
+    def __init__(self, database_url: str, channel: str):
+        super().__init__()
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.connection = None
+        self.publish_pool = None
+        self.reconnector = None
+
+    async def start(self):
+        await self._connect()
+        # The listening connection can not run anything while a notification is published, publishes get their own
+        self.publish_pool = await asyncpg.create_pool(self.dsn, min_size=1,
+                                                      max_size=settings.cache_invalidation_publish_pool_size)
+
+    async def stop(self):
+        if self.reconnector:
+            self.reconnector.cancel()
+        if self.publish_pool:
+            await self.publish_pool.close()
+        if self.connection and not self.connection.is_closed():
+            self.connection.remove_termination_listener(self._on_termination)
+            await self.connection.close()
+
+    async def publish_many(self, name: str, keys):
+        keys = [str(key) for key in keys]
+        # Applied locally right away, so this worker reads its own writes
+        self._deliver(name, keys)
+        try:
+            for payload in self._payloads(name, keys):
+                await self.publish_pool.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+            logger.error("Failed to publish cache invalidation: %s", e)
+
+    @staticmethod
+    def _payloads(name: str, keys: list[str]):
+        # As few notifications as fit the keys, one per line
+        payload = None
+        for key in keys:
+            if payload is not None and len(payload.encode()) + len(key.encode()) + 1 > NOTIFY_PAYLOAD_LIMIT:
+                yield payload
+                payload = None
+            payload = f"{name}:{key}" if payload is None else f"{payload}\n{key}"
+        if payload is not None:
+            yield payload
+
+    async def _connect(self):
+        self.connection = await asyncpg.connect(self.dsn)
+        await self.connection.add_listener(self.channel, self._on_notification)
+        self.connection.add_termination_listener(self._on_termination)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        name, _, keys = payload.partition(":")
+        self._deliver(name, keys.split("\n"))
+
+    def _on_termination(self, connection):
+        # Invalidations may be missed until the listener is back, nothing cached can be trusted
+        self._clear_all()
+        self.reconnector = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while True:
+            await asyncio.sleep(settings.cache_invalidation_retry_interval)
+            try:
+                await self._connect()
+                self._clear_all()
+                return
+            except (asyncpg.PostgresError, OSError) as e:
+                logger.error("Failed to reconnect cache invalidation listener: %s", e)
+
+
+def create_invalidation_bus():
+    if settings.cache_invalidation_bus == "postgres":
+        return PostgresInvalidationBus(settings.regular_database_url, settings.cache_invalidation_channel)
+    return InvalidationBus()
+
+
+invalidation_bus = create_invalidation_bus()
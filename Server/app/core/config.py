@@ -1,5 +1,6 @@
 import logging
 import secrets
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -7,10 +8,56 @@ class Settings(BaseSettings):
     secret_key: str = secrets.token_urlsafe(32)
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    # API keys are stored hashed with this secret, it must stay the same across restarts and instances. Falls back to
+    # secret_key when that is configured
+    api_key_secret: Optional[str] = None
     devices_thumbnails_path: str = "static/devices/thumbnails/"
+    # Frames a Hub may send on the records stream before waiting for their acks
+    records_stream_window: int = 32
+    # Most records one page returns per record table
+    records_max_page_size: int = 1000
+    # Most records of one table read to downsample a date range for a chart
+    records_downsample_max_rows: int = 2000000
+    # Most buckets one aggregate query returns per record table
+    records_aggregate_max_buckets: int = 10000
+    # Rows fetched from the database cursor and sent at once by record exports
+    records_export_batch_size: int = 1000
+    records_export_row_group_size: int = 100000
+    # Messages queued for every records WebSocket client, when a client falls further behind its oldest messages are
+    # dropped or it is disconnected
+    websocket_send_queue_size: int = 64
+    websocket_slow_client_policy: Literal["drop_oldest", "disconnect"] = "drop_oldest"
+    # Seconds one message may take to send before the client is considered stalled and disconnected
+    websocket_send_timeout: float = 10
 
     regular_database_url: str
     time_series_database_url: str
+    database_pool_size: int = 20
+    database_max_overflow: int = 20
+    # Time series tables become TimescaleDB hypertables when the time series database is Postgres
+    timescale_enabled: bool = True
+    timescale_chunk_interval_days: int = 7
+    # None disables the policy, records are then kept uncompressed or forever
+    timescale_compress_after_days: Optional[int] = 7
+    timescale_retention_days: Optional[int] = None
+    # Threads hashing and verifying passwords, and password requests allowed to wait for one
+    password_hash_workers: int = 4
+    password_hash_queue_size: int = 32
+    password_hash_retry_after: int = 1
+
+    device_cache_size: int = 10000
+    device_cache_ttl: float = 300.0
+    token_cache_size: int = 10000
+    token_cache_ttl: float = 300.0
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 60.0
+    api_key_cache_size: int = 10000
+    api_key_cache_ttl: float = 300.0
+    # "local" keeps caches coherent within one worker, "postgres" across workers through LISTEN/NOTIFY
+    cache_invalidation_bus: Literal["local", "postgres"] = "local"
+    cache_invalidation_channel: str = "cache_invalidation"
+    cache_invalidation_retry_interval: float = 5.0
+    cache_invalidation_publish_pool_size: int = 4
 
     class Config:
         env_file = ".env"
@@ -1,20 +1,61 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from app.core.config import settings
+from app.core.migrations import upgrade_record_keys
+from app.core.timescale import setup_hypertables
 from app.entities.models import regular_db_base
 from app.entities.time_series_models import time_series_db_base
 
+# Async drivers used in place of the synchronous ones the database URLs may name
+async_drivers = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite"
+}
+
+
+def get_async_database_url(database_url):
+    url = make_url(database_url)
+    return url.set(drivername=async_drivers.get(url.drivername, url.drivername))
+
 
 class DatabaseManager:
     def __init__(self, database_url, models):
-        self.engine = create_engine(database_url)
-        self.SessionLocal = sessionmaker(autocommit=False, bind=self.engine)
-        models.metadata.create_all(bind=self.engine)
+        self.models = models
+        url = get_async_database_url(database_url)
+        # aiosqlite opens a connection per session, only server databases use a pool
+        pool_options = {} if url.get_backend_name() == "sqlite" else {
+            "pool_size": settings.database_pool_size,
+            "max_overflow": settings.database_max_overflow
+        }
+        self.engine = create_async_engine(url, **pool_options)
+        # Objects stay usable after a commit, an expired attribute can not be lazy loaded from async code
+        self.SessionLocal = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    async def create_all(self):
+        async with self.engine.begin() as connection:
+            await connection.run_sync(self.models.metadata.create_all)
+
+    async def dispose(self):
+        await self.engine.dispose()
 
     def get_session(self):
         return self.SessionLocal()
 
 
+class TimeSeriesDatabaseManager(DatabaseManager):
+    async def create_all(self):
+        await super().create_all()
+        # Hypertables are partitioned on the current keys, so older tables are rekeyed first
+        async with self.engine.begin() as connection:
+            await upgrade_record_keys(connection)
+        # SQLite and plain Postgres keep regular tables
+        if settings.timescale_enabled and self.engine.dialect.name == "postgresql":
+            async with self.engine.begin() as connection:
+                await setup_hypertables(connection)
+
+
 regular_db_manager = DatabaseManager(settings.regular_database_url, regular_db_base)
-time_series_db_manager = DatabaseManager(settings.time_series_database_url, time_series_db_base)
+time_series_db_manager = TimeSeriesDatabaseManager(settings.time_series_database_url, time_series_db_base)
@@ -0,0 +1,45 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.entities import time_series_models
+
+# Record tables were keyed by timestamp alone, with a separate device_id index, before they were keyed by
+# (device_id, timestamp). create_all does not alter existing tables, so they are rekeyed here
+rekeyed_models = [
+    time_series_models.ThermoHumidMeterRecord,
+    time_series_models.ThermoHumidMeterAggregateRecord,
+    time_series_models.WasteSorterRecycleRecord,
+    time_series_models.WasteSorterLevelRecord
+]
+# Serializes the upgrade when several Server workers start together
+UPGRADE_LOCK_ID = 7340212
+
+
+def get_outdated_record_tables(connection):
+    inspector = inspect(connection)
+    outdated = []
+    for model in rekeyed_models:
+        primary_key = inspector.get_pk_constraint(model.__tablename__)
+        if primary_key["constrained_columns"] != [column.name for column in model.__table__.primary_key.columns]:
+            outdated.append((model.__tablename__, primary_key["name"]))
+    return outdated
+
+
+async def upgrade_record_keys(connection: AsyncConnection):
+    if connection.dialect.name == "postgresql":
+        await connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": UPGRADE_LOCK_ID})
+    outdated = await connection.run_sync(get_outdated_record_tables)
+    if not outdated:
+        return
+    if connection.dialect.name != "postgresql":
+        # SQLite can not change the primary key of a table, and running on the old keys would mix up devices
+        raise RuntimeError(f"Record tables {', '.join(table for table, _ in outdated)} use the primary key of an "
+                           f"older version, recreate them or migrate their rows to tables created by this version")
+    for table, constraint in outdated:
+        # The old keys were unique per timestamp, so they are unique per device and timestamp as well
+        print(f"Rekeying record table {table} by (device_id, timestamp)")
+        await connection.execute(text(
+            f"ALTER TABLE {table} DROP CONSTRAINT {constraint}, ADD PRIMARY KEY (device_id, timestamp)"
+        ))
+        # Served by the new primary key
+        await connection.execute(text(f"DROP INDEX IF EXISTS ix_{table}_device_id"))
@@ -1,11 +1,36 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
+from app.core.config import settings
+
 pwd_context = CryptContext(schemes=["bcrypt"])
+# bcrypt releases the GIL, so hashing runs on these threads while the event loop keeps serving requests
+password_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="passwords")
+# Running and queued password jobs, beyond the limit requests are shed instead of queueing up
+password_jobs = 0
+
+
+async def run_password_job(function, *args):
+    global password_jobs
+    if password_jobs >= settings.password_hash_workers + settings.password_hash_queue_size:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress",
+            headers={"Retry-After": str(settings.password_hash_retry_after)},
+        )
+    password_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, function, *args)
+    finally:
+        password_jobs -= 1
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_job(pwd_context.verify, plain_password, hashed_password)
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await run_password_job(pwd_context.hash, password)
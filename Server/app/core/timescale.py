@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+from app.entities import time_series_models
+
+# Record tables partitioned by time, every one is keyed by (device_id, timestamp)
+hypertable_models = [
+    time_series_models.ThermoHumidMeterRecord,
+    time_series_models.ThermoHumidMeterAggregateRecord,
+    time_series_models.WasteSorterRecycleRecord,
+    time_series_models.WasteSorterLevelRecord
+]
+# Serializes the setup when several Server workers start together
+SETUP_LOCK_ID = 7340211
+
+
+async def setup_hypertables(connection: AsyncConnection):
+    await connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": SETUP_LOCK_ID})
+    await connection.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+    for model in hypertable_models:
+        await setup_hypertable(connection, model.__tablename__)
+
+
+async def setup_hypertable(connection: AsyncConnection, table: str):
+    # Every statement is safe to repeat, the setup runs on each start
+    chunk_interval = timedelta(days=settings.timescale_chunk_interval_days)
+    await connection.execute(
+        text("SELECT create_hypertable(CAST(:table AS regclass), 'timestamp', "
+             "chunk_time_interval => CAST(:chunk_interval AS interval), if_not_exists => TRUE, migrate_data => TRUE)"),
+        {"table": table, "chunk_interval": chunk_interval}
+    )
+    # Applies to chunks created from now on, when the interval was changed since the table was converted
+    await connection.execute(
+        text("SELECT set_chunk_time_interval(CAST(:table AS regclass), CAST(:chunk_interval AS interval))"),
+        {"table": table, "chunk_interval": chunk_interval}
+    )
+
+    compression_enabled = (await connection.execute(
+        text("SELECT compression_enabled FROM timescaledb_information.hypertables WHERE hypertable_name = :table"),
+        {"table": table}
+    )).scalar()
+    if not compression_enabled:
+        # Segmented by device, so compressed chunks still serve the queries of one device
+        await connection.execute(text(
+            f"ALTER TABLE {table} SET (timescaledb.compress, timescaledb.compress_segmentby = 'device_id', "
+            f"timescaledb.compress_orderby = 'timestamp DESC')"
+        ))
+
+    # Policies are replaced, so changed settings take effect on the next start
+    await connection.execute(
+        text("SELECT remove_compression_policy(CAST(:table AS regclass), if_exists => TRUE)"), {"table": table}
+    )
+    if settings.timescale_compress_after_days is not None:
+        await connection.execute(
+            text("SELECT add_compression_policy(CAST(:table AS regclass), "
+                 "compress_after => CAST(:compress_after AS interval))"),
+            {"table": table, "compress_after": timedelta(days=settings.timescale_compress_after_days)}
+        )
+    await connection.execute(
+        text("SELECT remove_retention_policy(CAST(:table AS regclass), if_exists => TRUE)"), {"table": table}
+    )
+    if settings.timescale_retention_days is not None:
+        await connection.execute(
+            text("SELECT add_retention_policy(CAST(:table AS regclass), drop_after => CAST(:drop_after AS interval))"),
+            {"table": table, "drop_after": timedelta(days=settings.timescale_retention_days)}
+        )
@@ -1,11 +1,19 @@
+import hashlib
+import hmac
+import secrets
+import time
 import jwt
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi.security import OAuth2PasswordBearer
 
+from app.core.cache import LRUTTLCache
 from app.core.config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
+API_KEY_PREFIX = "wfh_"
+# Payloads of verified tokens by token digest, Hubs send the same token with every request
+verified_token_cache = LRUTTLCache(settings.token_cache_size, settings.token_cache_ttl)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -26,3 +34,36 @@ def decode_access_token(token: str):
     except jwt.PyJWTError:
         return None
 
+
+def decode_access_token_cached(token: str):
+    token_digest = hashlib.sha256(token.encode()).digest()
+    payload = verified_token_cache.get(token_digest)
+    if payload is None:
+        payload = decode_access_token(token)
+        if payload is None:
+            return None
+        # Never kept past the expiry of the token
+        verified_token_cache.set(token_digest, payload, ttl=payload.get("exp", 0) - time.time())
+    return payload
+
+
+def generate_api_key():
+    return API_KEY_PREFIX + secrets.token_urlsafe(32)
+
+
+def get_api_key_secret():
+    # The default secret_key is random per process, stored keys would stop verifying after a restart, so API keys are
+    # disabled until a secret is configured
+    if settings.api_key_secret:
+        return settings.api_key_secret
+    if "secret_key" in settings.model_fields_set:
+        return settings.secret_key
+    return None
+
+
+def hash_api_key(api_key: str):
+    secret = get_api_key_secret()
+    if secret is None:
+        raise RuntimeError("api_key_secret or secret_key must be configured to hash API keys")
+    # Keys are random, a keyed hash is enough and can be looked up directly
+    return hmac.new(secret.encode(), api_key.encode(), hashlib.sha256).hexdigest()
@@ -1,4 +1,5 @@
 import re
+from datetime import datetime, timezone
 
 import qrcode
 
@@ -13,3 +14,14 @@ def generate_qr_code(data: str):
 
 def camelcase_to_snakecase(name):
     return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+
+def to_naive_utc(timestamp: datetime):
+    # Record tables hold naive UTC timestamps, asyncpg rejects aware datetimes for them
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def utc_now():
+    return to_naive_utc(datetime.now(timezone.utc))
@@ -1,27 +1,96 @@
+import asyncio
 import uuid
-from typing import Dict, Set
+from typing import Callable, Dict
 
+from fastapi import status
 from fastapi.websockets import WebSocket
 
+from app.core.config import settings
+
+
+class WebSocketConnection:
+    # Messages wait in a bounded queue sent by a writer task of the connection, a slow client only delays itself
+    def __init__(self, websocket: WebSocket, on_closed: Callable[[], None]):
+        self.websocket = websocket
+        self.on_closed = on_closed
+        self.queue = asyncio.Queue(maxsize=settings.websocket_send_queue_size)
+        self.dropped = 0
+        self.close_code = None
+        self.writer = asyncio.create_task(self._write())
+
+    def send(self, message: str):
+        if self.queue.full():
+            if settings.websocket_slow_client_policy == "disconnect":
+                self.close(status.WS_1013_TRY_AGAIN_LATER)
+                return
+            # The oldest message is the least useful to a client that is behind
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    def close(self, code: int):
+        # The writer may be stuck sending, it is cancelled and closes the WebSocket itself
+        if self.close_code is None:
+            self.close_code = code
+            self.writer.cancel()
+
+    async def _write(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(message), settings.websocket_send_timeout)
+        except asyncio.TimeoutError:
+            self.close_code = status.WS_1013_TRY_AGAIN_LATER
+        except asyncio.CancelledError:
+            # Cancelled by the manager when the client disconnected
+            if self.close_code is None:
+                raise
+        except Exception as e:
+            print(f"Failed to send WebSocket message: {e}")
+            self.close_code = status.WS_1011_INTERNAL_ERROR
+        finally:
+            self.on_closed()
+
+        if self.dropped:
+            print(f"Dropped {self.dropped} messages of a slow WebSocket client")
+        try:
+            await asyncio.wait_for(self.websocket.close(code=self.close_code), settings.websocket_send_timeout)
+        except Exception:
+            pass
+
 
 class WebSocketManager:
     def __init__(self):
-        self.active_connections: Dict[uuid.UUID, Set[WebSocket]] = {}
+        self.active_connections: Dict[uuid.UUID, Dict[WebSocket, WebSocketConnection]] = {}
 
     async def connect(self, websocket: WebSocket, group_id: uuid.UUID):
         await websocket.accept()
-        self.active_connections.setdefault(group_id, set()).add(websocket)
+        self.active_connections.setdefault(group_id, {})[websocket] = WebSocketConnection(
+            websocket, lambda: self._remove(websocket, group_id)
+        )
 
     async def disconnect(self, websocket: WebSocket, group_id: uuid.UUID):
-        if group_id in self.active_connections:
-            self.active_connections[group_id].remove(websocket)
-            if not self.active_connections[group_id]:
-                del self.active_connections[group_id]
-
-    async def broadcast(self, group_id: uuid.UUID, message: str):
-        if group_id in self.active_connections:
-            for connection in self.active_connections[group_id]:
-                await connection.send_text(message)
+        connection = self._remove(websocket, group_id)
+        if connection is not None:
+            connection.writer.cancel()
+            await asyncio.gather(connection.writer, return_exceptions=True)
+
+    def _remove(self, websocket: WebSocket, group_id: uuid.UUID):
+        connections = self.active_connections.get(group_id)
+        if connections is None:
+            return None
+        connection = connections.pop(websocket, None)
+        if not connections:
+            del self.active_connections[group_id]
+        return connection
+
+    def has_connections(self, group_id: uuid.UUID):
+        return group_id in self.active_connections
+
+    def broadcast(self, group_id: uuid.UUID, message: str):
+        # Only queues the message, serialized once by the caller and shared by every connection
+        for connection in list(self.active_connections.get(group_id, {}).values()):
+            connection.send(message)
 
 
 records_ws_manager = WebSocketManager()
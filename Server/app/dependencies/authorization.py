@@ -2,25 +2,25 @@ from typing import Annotated, List
 from uuid import UUID
 from fastapi import Depends, status, HTTPException
 from jwt import InvalidTokenError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.dependencies.database import get_regular_db
 from app.entities.enums import Role
-from app.entities.schemas import TokenData, RegularUser
-from app.core.tokens import oauth2_scheme, decode_access_token
-from app.services import base_device_service
-from app.services.base_user_service import get_base_user_by_email
+from app.entities.schemas import TokenData, Principal
+from app.core.tokens import oauth2_scheme, decode_access_token_cached, API_KEY_PREFIX
+from app.services import base_device_service, api_key_service
+from app.services.base_user_service import get_principal_by_email
 
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)],
-                           db: Annotated[Session, Depends(get_regular_db)]):
+                           db: Annotated[AsyncSession, Depends(get_regular_db)]):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = decode_access_token(token)
+        payload = decode_access_token_cached(token)
         if payload is None:
             raise credentials_exception
         email: str = payload.get("sub")
@@ -29,21 +29,40 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)],
         token_data = TokenData(email=email)
     except InvalidTokenError:
         raise credentials_exception
-    user = get_base_user_by_email(db, token_data.email)
-    if user is None:
+    principal = await get_principal_by_email(db, token_data.email)
+    if principal is None:
         raise credentials_exception
-    return user
+    return principal
 
 
-async def get_current_active_user(current_user: Annotated[RegularUser, Depends(get_current_user)]):
+async def get_current_hub_user(token: Annotated[str, Depends(oauth2_scheme)],
+                               db: Annotated[AsyncSession, Depends(get_regular_db)]):
+    # Hubs may present an API key in place of a JWT, it only acts on the devices of its owner
+    if not token.startswith(API_KEY_PREFIX):
+        return await get_current_user(token, db)
+    principal = await api_key_service.get_api_key_principal(db, token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+
+async def get_current_active_user(current_user: Annotated[Principal, Depends(get_current_user)]):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 
+async def get_current_active_hub_user(current_user: Annotated[Principal, Depends(get_current_hub_user)]):
+    return await get_current_active_user(current_user)
+
+
 def user_dependency(required_roles: List[Role]):
     def role_checker(
-            current_user: Annotated[RegularUser, Depends(get_current_active_user)]
+            current_user: Annotated[Principal, Depends(get_current_active_user)]
     ):
         if current_user.role not in required_roles:
             raise HTTPException(
@@ -55,13 +74,19 @@ def user_dependency(required_roles: List[Role]):
     return role_checker
 
 
-def device_dependency(device_id: UUID,
-                      current_user: Annotated[RegularUser, Depends(get_current_active_user)],
-                      db: Session = Depends(get_regular_db)):
-    device = base_device_service.get_device(db, device_id)
+async def device_dependency(device_id: UUID,
+                            current_user: Annotated[Principal, Depends(get_current_active_user)],
+                            db: AsyncSession = Depends(get_regular_db)):
+    device = await base_device_service.get_device_metadata(db, device_id)
     if device is None or device.owner_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Device not found",
         )
     return device
+
+
+async def hub_device_dependency(device_id: UUID,
+                                current_user: Annotated[Principal, Depends(get_current_active_hub_user)],
+                                db: AsyncSession = Depends(get_regular_db)):
+    return await device_dependency(device_id=device_id, current_user=current_user, db=db)
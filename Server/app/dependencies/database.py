@@ -1,19 +1,29 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database_manager import regular_db_manager, time_series_db_manager
 
 
-def get_regular_db() -> Session:
+async def get_regular_db() -> AsyncSession:
     db = regular_db_manager.get_session()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
 
 
-def get_time_series_db() -> Session:
+async def get_time_series_db() -> AsyncSession:
     db = time_series_db_manager.get_session()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+
+def get_time_series_session_factory():
+    # Streaming responses are sent after the request dependencies are closed, they open their own session
+    return time_series_db_manager.get_session
+
+
+def get_regular_session_factory():
+    # For connections open far longer than a request, they take a session per unit of work
+    return regular_db_manager.get_session
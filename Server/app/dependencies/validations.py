@@ -1,6 +1,10 @@
-from fastapi import UploadFile, File, HTTPException
-from typing import Optional
+from fastapi import UploadFile, File, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from typing import Optional, Type
+import json
 import mimetypes
+import msgpack
 
 
 async def validate_thumbnail(thumbnail: Optional[UploadFile] = File(None)):
@@ -20,3 +24,26 @@ async def validate_thumbnail(thumbnail: Optional[UploadFile] = File(None)):
             raise HTTPException(status_code=400, detail="Unsupported image format")
 
     return thumbnail
+
+
+def encoded_body(schema: Type[BaseModel]):
+    # Accepts the body as JSON or as MessagePack, depending on its content type
+    async def validate_encoded_body(request: Request):
+        body = await request.body()
+        content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+        try:
+            if content_type == "application/msgpack":
+                data = msgpack.unpackb(body)
+            elif content_type == "application/json":
+                data = json.loads(body)
+            else:
+                raise HTTPException(status_code=415, detail="Unsupported content type")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Malformed request body")
+
+        try:
+            return schema.model_validate(data)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+
+    return validate_encoded_body
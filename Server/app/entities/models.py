@@ -35,6 +35,17 @@ class Admin(BaseUser):
     }
 
 
+class ApiKey(regular_db_base):
+    __tablename__ = "api_keys"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    title = Column(String, nullable=False)
+    hashed_key = Column(String, unique=True, index=True, nullable=False)
+    created_timestamp = Column(TIMESTAMP, server_default=func.now(), nullable=False)
+    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete='CASCADE'), nullable=False)
+    owner = relationship("RegularUser")
+
+
 class BaseDevice(regular_db_base):
     __tablename__ = "devices"
 
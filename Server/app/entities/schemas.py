@@ -1,11 +1,17 @@
 import datetime
-from typing import Optional
+from typing import Annotated, Literal, Optional
 from uuid import UUID
-from pydantic import BaseModel
+from pydantic import AfterValidator, BaseModel
+
+from app.core.utils import to_naive_utc
 
 from app.entities.enums import DeviceType, Role, WasteType
 
 
+# Timestamps sent with a timezone are stored and compared as naive UTC, like the record tables hold them
+NaiveUTCDatetime = Annotated[datetime.datetime, AfterValidator(to_naive_utc)]
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -39,6 +45,19 @@ class Device(DeviceBase):
         from_attributes = True
 
 
+class DevicePresence(BaseModel):
+    device_id: UUID
+    is_online: bool
+
+
+class DevicePresenceBatch(BaseModel):
+    devices: list[DevicePresence]
+
+
+class DevicePresenceResult(BaseModel):
+    updated: int
+
+
 class UserBase(BaseModel):
     id: UUID
     email: str
@@ -46,6 +65,35 @@ class UserBase(BaseModel):
     role: Role
 
 
+class Principal(UserBase):
+    class Config:
+        from_attributes = True
+        frozen = True
+
+
+class UserStatusUpdate(BaseModel):
+    is_active: Optional[bool] = None
+    role: Optional[Role] = None
+
+
+class ApiKeyCreate(BaseModel):
+    title: str
+    owner_id: UUID
+
+
+class ApiKey(ApiKeyCreate):
+    id: UUID
+    created_timestamp: datetime.datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ApiKeyCreated(ApiKey):
+    # Only returned once, the Server keeps a hash of it
+    key: str
+
+
 class UserCreate(BaseModel):
     email: str
     password: str
@@ -64,7 +112,7 @@ class Admin(UserBase):
 
 
 class BaseRecord(BaseModel):
-    timestamp: datetime.datetime | None = None
+    timestamp: NaiveUTCDatetime | None = None
 
 
 class ThermoHumidMeterRecord(BaseRecord):
@@ -75,6 +123,20 @@ class ThermoHumidMeterRecord(BaseRecord):
         use_enum_values = True
 
 
+class ThermoHumidMeterAggregateRecord(BaseRecord):
+    window_seconds: int
+    sample_count: int
+    temperature_min: float
+    temperature_max: float
+    temperature_mean: float
+    humidity_min: float
+    humidity_max: float
+    humidity_mean: float
+
+    class Config:
+        use_enum_values = True
+
+
 class WasteSorterRecycleRecord(BaseRecord):
     waste_type: WasteType
 
@@ -88,3 +150,35 @@ class WasteSorterLevelRecord(BaseRecord):
 
     class Config:
         use_enum_values = True
+
+
+class RecordBucket(BaseModel):
+    timestamp: datetime.datetime
+    # Set for records counted by waste type, there is one bucket per waste type then
+    waste_type: Optional[WasteType] = None
+    count: Optional[int] = None
+    # Aggregates by "<field>_<aggregate>", like temperature_avg
+    values: dict[str, Optional[float]] = {}
+
+    class Config:
+        use_enum_values = True
+
+
+class RecordBatchItem(BaseModel):
+    device_id: UUID
+    record: dict
+
+
+class RecordBatch(BaseModel):
+    records: list[RecordBatchItem]
+
+
+class RecordBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+
+
+class RecordStreamFrame(BaseModel):
+    seq: int
+    type: Literal["records", "presence"]
+    body: dict
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Float, Enum, TIMESTAMP, func, CheckConstraint
+from sqlalchemy import Column, Float, Integer, Enum, TIMESTAMP, func, CheckConstraint, PrimaryKeyConstraint
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import declarative_base, declared_attr
 
 from app.entities.enums import WasteType
 
@@ -10,30 +10,128 @@ time_series_db_base = declarative_base()
 class ThermoHumidMeterRecord(time_series_db_base):
     __tablename__ = "thermo_humid_meter"
 
-    timestamp = Column(TIMESTAMP, primary_key=True, server_default=func.now())
-    device_id = Column(UUID(as_uuid=True), index=True, unique=False, nullable=False)
+    timestamp = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    device_id = Column(UUID(as_uuid=True), nullable=False)
     temperature = Column(Float, nullable=False)
     humidity = Column(Float, nullable=False)
 
+    __table_args__ = (
+        # Records of one device are contiguous in the index, in time order
+        PrimaryKeyConstraint('device_id', 'timestamp'),
+    )
+
+
+class ThermoHumidMeterAggregateRecord(time_series_db_base):
+    __tablename__ = "thermo_humid_meter_aggregate"
+
+    timestamp = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    device_id = Column(UUID(as_uuid=True), nullable=False)
+    window_seconds = Column(Integer, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    temperature_min = Column(Float, nullable=False)
+    temperature_max = Column(Float, nullable=False)
+    temperature_mean = Column(Float, nullable=False)
+    humidity_min = Column(Float, nullable=False)
+    humidity_max = Column(Float, nullable=False)
+    humidity_mean = Column(Float, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('device_id', 'timestamp'),
+    )
+
 
 class WasteSorterRecycleRecord(time_series_db_base):
     __tablename__ = "waste_sorter_recycle"
 
-    timestamp = Column(TIMESTAMP, primary_key=True, server_default=func.now())
-    device_id = Column(UUID(as_uuid=True), index=True, unique=False, nullable=False)
+    timestamp = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    device_id = Column(UUID(as_uuid=True), nullable=False)
     waste_type = Column(Enum(WasteType), nullable=False)
 
+    __table_args__ = (
+        PrimaryKeyConstraint('device_id', 'timestamp'),
+    )
+
 
 class WasteSorterLevelRecord(time_series_db_base):
     __tablename__ = "waste_sorter_level"
 
-    timestamp = Column(TIMESTAMP, primary_key=True, server_default=func.now())
-    device_id = Column(UUID(as_uuid=True), index=True, unique=False, nullable=False)
+    timestamp = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    device_id = Column(UUID(as_uuid=True), nullable=False)
     recyclable_level = Column(Float, nullable=False)
     non_recyclable_level = Column(Float, nullable=False)
 
     __table_args__ = (
+        PrimaryKeyConstraint('device_id', 'timestamp'),
         CheckConstraint('recyclable_level >= 0.0 AND recyclable_level <= 100.0', name='waste_recyclable_level_range'),
         CheckConstraint('non_recyclable_level >= 0.0 AND non_recyclable_level <= 100.0',
                         name='waste_non_recyclable_level_range'),
     )
+
+
+# Hourly and daily rollups of the record tables, updated as records are stored. Sums are kept rather than means,
+# so rollups merge into any coarser bucket.
+class ThermoHumidMeterRollup:
+    timestamp = Column(TIMESTAMP, nullable=False)
+    device_id = Column(UUID(as_uuid=True), nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    temperature_sum = Column(Float, nullable=False)
+    temperature_min = Column(Float, nullable=False)
+    temperature_max = Column(Float, nullable=False)
+    humidity_sum = Column(Float, nullable=False)
+    humidity_min = Column(Float, nullable=False)
+    humidity_max = Column(Float, nullable=False)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (PrimaryKeyConstraint('device_id', 'timestamp'),)
+
+
+class ThermoHumidMeterHourlyRollup(ThermoHumidMeterRollup, time_series_db_base):
+    __tablename__ = "thermo_humid_meter_hourly"
+
+
+class ThermoHumidMeterDailyRollup(ThermoHumidMeterRollup, time_series_db_base):
+    __tablename__ = "thermo_humid_meter_daily"
+
+
+class WasteSorterRecycleRollup:
+    timestamp = Column(TIMESTAMP, nullable=False)
+    device_id = Column(UUID(as_uuid=True), nullable=False)
+    waste_type = Column(Enum(WasteType), nullable=False)
+    sample_count = Column(Integer, nullable=False)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (PrimaryKeyConstraint('device_id', 'timestamp', 'waste_type'),)
+
+
+class WasteSorterRecycleHourlyRollup(WasteSorterRecycleRollup, time_series_db_base):
+    __tablename__ = "waste_sorter_recycle_hourly"
+
+
+class WasteSorterRecycleDailyRollup(WasteSorterRecycleRollup, time_series_db_base):
+    __tablename__ = "waste_sorter_recycle_daily"
+
+
+class WasteSorterLevelRollup:
+    timestamp = Column(TIMESTAMP, nullable=False)
+    device_id = Column(UUID(as_uuid=True), nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    recyclable_level_sum = Column(Float, nullable=False)
+    recyclable_level_min = Column(Float, nullable=False)
+    recyclable_level_max = Column(Float, nullable=False)
+    non_recyclable_level_sum = Column(Float, nullable=False)
+    non_recyclable_level_min = Column(Float, nullable=False)
+    non_recyclable_level_max = Column(Float, nullable=False)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (PrimaryKeyConstraint('device_id', 'timestamp'),)
+
+
+class WasteSorterLevelHourlyRollup(WasteSorterLevelRollup, time_series_db_base):
+    __tablename__ = "waste_sorter_level_hourly"
+
+
+class WasteSorterLevelDailyRollup(WasteSorterLevelRollup, time_series_db_base):
+    __tablename__ = "waste_sorter_level_daily"
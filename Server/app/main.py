@@ -1,14 +1,39 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
+from app.core.cache import invalidation_bus
+from app.core.database_manager import regular_db_manager, time_series_db_manager
+from app.core.tokens import get_api_key_secret
 from app.routers.admin_router import admin_router
+from app.routers.api_key_router import api_key_router
 from app.routers.auth_router import auth_router
 from app.routers.device_router import device_router
 from app.routers.records_router import records_router
 from app.routers.regular_user_router import regular_user_router
+from app.services import rollup_service
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if get_api_key_secret() is None:
+        print("API keys are disabled, configure api_key_secret or secret_key to enable them")
+    await regular_db_manager.create_all()
+    await time_series_db_manager.create_all()
+    async with time_series_db_manager.get_session() as db:
+        await rollup_service.backfill_rollups(db)
+    await invalidation_bus.start()
+    try:
+        yield
+    finally:
+        await invalidation_bus.stop()
+        await regular_db_manager.dispose()
+        await time_series_db_manager.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(auth_router)
 app.include_router(admin_router)
+app.include_router(api_key_router)
 app.include_router(regular_user_router)
 app.include_router(device_router)
 app.include_router(records_router)
@@ -0,0 +1,51 @@
+from typing import Annotated
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.dependencies.database import get_regular_db
+from app.entities import schemas
+from app.entities.enums import Role
+from app.entities.schemas import Admin
+from app.dependencies.authorization import user_dependency
+from app.services import api_key_service, regular_user_service
+
+api_key_router = APIRouter()
+api_key_router_root_path = "/API/api-keys"
+
+
+@api_key_router.get(api_key_router_root_path, tags=["API keys"], response_model=list[schemas.ApiKey])
+async def read_user_api_keys(
+        current_user: Annotated[Admin, Depends(user_dependency([Role.ADMIN]))],
+        owner_id: UUID,
+        skip: int = 0,
+        limit: int = 100,
+        db: AsyncSession = Depends(get_regular_db)):
+    return await api_key_service.get_api_keys(db, owner_id=owner_id, skip=skip, limit=limit)
+
+
+@api_key_router.post(api_key_router_root_path, tags=["API keys"], response_model=schemas.ApiKeyCreated)
+async def create_api_key(
+        current_user: Annotated[Admin, Depends(user_dependency([Role.ADMIN]))],
+        api_key: schemas.ApiKeyCreate,
+        db: AsyncSession = Depends(get_regular_db)):
+    # Keys act for a regular user on the devices they own
+    owner = await regular_user_service.get_user(db, user_id=api_key.owner_id)
+    if owner is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    created_api_key = await api_key_service.create_api_key(db, api_key=api_key)
+    if created_api_key is None:
+        raise HTTPException(status_code=503, detail="API keys are disabled, api_key_secret is not configured")
+    return created_api_key
+
+
+@api_key_router.delete(api_key_router_root_path + "/{api_key_id}", tags=["API keys"],
+                       response_model=schemas.ApiKey)
+async def revoke_api_key(
+        current_user: Annotated[Admin, Depends(user_dependency([Role.ADMIN]))],
+        api_key_id: UUID,
+        db: AsyncSession = Depends(get_regular_db)):
+    api_key = await api_key_service.revoke_api_key(db, api_key_id=api_key_id)
+    if api_key is None:
+        raise HTTPException(status_code=404, detail="API key not found")
+    return api_key
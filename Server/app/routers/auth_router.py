@@ -4,7 +4,7 @@ from typing import Annotated
 from fastapi import APIRouter
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.dependencies.authorization import user_dependency
 from app.core.config import settings
@@ -20,8 +20,8 @@ auth_router_root_path = "/API/auth"
 
 
 @auth_router.post(auth_router_root_path + "/token", tags=["Auth"], response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_regular_db)):
-    user = authenticate_base_user(db, form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_regular_db)):
+    user = await authenticate_base_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -3,16 +3,17 @@ import os
 from typing import Annotated, Optional
 from uuid import UUID
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, Form, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.responses import StreamingResponse, FileResponse
 
 from app.core import utils
-from app.dependencies.validations import validate_thumbnail
+from app.dependencies.validations import validate_thumbnail, encoded_body
 from app.dependencies.database import get_regular_db
 from app.entities import schemas
 from app.entities.enums import Role, DeviceType
 from app.entities.schemas import RegularUser, Device, Admin
-from app.dependencies.authorization import user_dependency, device_dependency
+from app.dependencies.authorization import (user_dependency, device_dependency, hub_device_dependency,
+                                            get_current_active_hub_user)
 from app.services import base_device_service, image_service
 
 device_router = APIRouter()
@@ -26,10 +27,10 @@ async def create_device(
         description: str = Form(...),
         type: DeviceType = Form(...),
         thumbnail: Optional[UploadFile] = Depends(validate_thumbnail),
-        db: Session = Depends(get_regular_db)
+        db: AsyncSession = Depends(get_regular_db)
 ):
     device_schema = schemas.DeviceCreate(title=title, description=description, type=type)
-    db_device = base_device_service.create_device(db=db, device_schema=device_schema)
+    db_device = await base_device_service.create_device(db=db, device_schema=device_schema)
 
     if thumbnail:
         await image_service.save_device_thumbnail(db_device.id, thumbnail)
@@ -42,22 +43,34 @@ async def create_device(
     return StreamingResponse(buf, media_type="image/png")
 
 
+@device_router.post(device_router_root_path + "/presence", tags=["Devices"],
+                    response_model=schemas.DevicePresenceResult)
+async def update_devices_presence(current_user: Annotated[RegularUser, Depends(get_current_active_hub_user)],
+                                  presence: Annotated[schemas.DevicePresenceBatch,
+                                                      Depends(encoded_body(schemas.DevicePresenceBatch))],
+                                  db: AsyncSession = Depends(get_regular_db)):
+    updated = await base_device_service.set_devices_presence(
+        db, current_user.id, {device.device_id: device.is_online for device in presence.devices}
+    )
+    return schemas.DevicePresenceResult(updated=updated)
+
+
 @device_router.get(device_router_root_path + "/unlinked", tags=["Devices"], response_model=list[schemas.Device])
 async def read_all_unlinked_devices(current_user: Annotated[RegularUser, Depends(user_dependency([Role.ADMIN]))],
-                           db: Session = Depends(get_regular_db),
+                           db: AsyncSession = Depends(get_regular_db),
                            limit: int = 100,
                            skip: int = 0):
-    devices = base_device_service.get_unlinked_devices(db, skip=skip, limit=limit)
+    devices = await base_device_service.get_unlinked_devices(db, skip=skip, limit=limit)
     return devices
 
 
 @device_router.get(device_router_root_path + "/me", tags=["Devices"], response_model=list[schemas.Device])
 async def read_all_user_devices(
         current_user: Annotated[RegularUser, Depends(user_dependency([Role.REGULAR_USER]))],
-        db: Session = Depends(get_regular_db),
+        db: AsyncSession = Depends(get_regular_db),
         skip: int = 0,
         limit: int = 100, ):
-    devices = base_device_service.get_user_devices(db, skip=skip, limit=limit, user_id=current_user.id)
+    devices = await base_device_service.get_user_devices(db, skip=skip, limit=limit, user_id=current_user.id)
     return devices
 
 
@@ -70,17 +83,17 @@ async def read_device(current_device: Annotated[Device, Depends(device_dependenc
 async def update_device(
         current_device: Annotated[Device, Depends(device_dependency)],
         device_schema: schemas.DeviceUpdate,
-        db: Session = Depends(get_regular_db)):
-    return base_device_service.update_device(db=db, device_id=current_device.id, device_schema=device_schema)
+        db: AsyncSession = Depends(get_regular_db)):
+    return await base_device_service.update_device(db=db, device_id=current_device.id, device_schema=device_schema)
 
 
 @device_router.post(device_router_root_path + "/{device_id}/link", tags=["Devices"], response_model=schemas.Device)
 async def link_with_device(
         current_user: Annotated[RegularUser, Depends(user_dependency([Role.REGULAR_USER]))],
         device_id: UUID,
-        db: Session = Depends(get_regular_db)
+        db: AsyncSession = Depends(get_regular_db)
 ):
-    device = base_device_service.link_device_to_user(db=db, device_id=device_id, user_id=current_user.id)
+    device = await base_device_service.link_device_to_user(db=db, device_id=device_id, user_id=current_user.id)
     if device is None:
         raise HTTPException(status_code=400, detail="Bad request")
     return device
@@ -99,10 +112,10 @@ async def read_device_thumbnail(
 
 
 @device_router.post(device_router_root_path + "/{device_id}/toggle", tags=["Devices"], response_model=schemas.Device)
-async def toggle_device_state(current_device: Annotated[Device, Depends(device_dependency)],
+async def toggle_device_state(current_device: Annotated[Device, Depends(hub_device_dependency)],
                               is_online: bool = Query(...),
-                              db: Session = Depends(get_regular_db)):
-    db_device = base_device_service.toggle_device(db, current_device.id, is_online)
+                              db: AsyncSession = Depends(get_regular_db)):
+    db_device = await base_device_service.toggle_device(db, current_device.id, is_online)
     if not db_device:
         raise HTTPException(status_code=500, detail="Failed to turn on device")
     return db_device
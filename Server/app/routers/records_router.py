@@ -1,15 +1,24 @@
+import asyncio
+import json
 import uuid
-from datetime import datetime
-from typing import Union, Annotated, List, Optional, Dict
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from typing import Union, Annotated, List, Literal, Optional, Dict
+import msgpack
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.websockets import WebSocket, WebSocketDisconnect
 
-from app.dependencies.authorization import device_dependency, get_current_user, get_current_active_user
+from app.core.config import settings
+from app.dependencies.authorization import (device_dependency, hub_device_dependency, get_current_user,
+                                            get_current_active_user, get_current_hub_user,
+                                            get_current_active_hub_user)
 from app.core.websockets import records_ws_manager
-from app.dependencies.database import get_regular_db, get_time_series_db
-from app.entities.schemas import Device
-from app.services import records_service
+from app.dependencies.database import (get_regular_db, get_time_series_db, get_regular_session_factory,
+                                       get_time_series_session_factory)
+from app.dependencies.validations import encoded_body
+from app.entities.schemas import (Device, NaiveUTCDatetime, RegularUser, RecordBatch, RecordBatchResult,
+                                  RecordBucket, RecordStreamFrame, DevicePresenceBatch, DevicePresenceResult)
+from app.services import records_service, base_device_service, arrow_service
 
 records_router = APIRouter()
 records_router_root_path = "/API/records"
@@ -17,45 +26,244 @@ records_router_root_path = "/API/records"
 records_schemas = records_service.get_all_records_schemas()
 records_response_model = Union[tuple(records_schemas)]
 records_lists_response_model = Dict[str, Union[tuple(List[schema] for schema in records_schemas)]]
+export_formats = Literal["ndjson", "csv", "arrow", "parquet"]
+
+
+@records_router.post(records_router_root_path + "/batch", tags=["Records"], response_model=RecordBatchResult)
+async def create_records_batch(current_user: Annotated[RegularUser, Depends(get_current_active_hub_user)],
+                               batch: Annotated[RecordBatch, Depends(encoded_body(RecordBatch))],
+                               models_db: AsyncSession = Depends(get_regular_db),
+                               time_series_db: AsyncSession = Depends(get_time_series_db)):
+    accepted = await records_service.record_devices_data_batch(models_db, time_series_db, current_user.id,
+                                                               batch.records)
+    broadcast_records(accepted)
+    return RecordBatchResult(accepted=len(accepted), rejected=len(batch.records) - len(accepted))
+
+
+def broadcast_records(accepted):
+    # Serialized once per record, whatever the number of clients watching the device
+    for device_id, record in accepted:
+        if records_ws_manager.has_connections(device_id):
+            records_ws_manager.broadcast(device_id, record.model_dump_json())
 
 
 @records_router.post(records_router_root_path + "/{device_id}", tags=["Records"],
                      response_model=records_response_model)
-async def create_device_records(current_device: Annotated[Device, Depends(device_dependency)],
+async def create_device_records(current_device: Annotated[Device, Depends(hub_device_dependency)],
                                 record: records_response_model,
-                                models_db: Session = Depends(get_regular_db),
-                                time_series_db: Session = Depends(get_time_series_db)):
+                                models_db: AsyncSession = Depends(get_regular_db),
+                                time_series_db: AsyncSession = Depends(get_time_series_db)):
     db_record = await records_service.record_device_data(models_db, time_series_db, current_device.id, record)
     if db_record is None:
         raise HTTPException(status_code=400, detail="Bad request")
 
-    ws_message = record.__class__(**db_record.__dict__).model_dump()
-    ws_message['timestamp'] = ws_message['timestamp'].isoformat()
-    await records_ws_manager.broadcast(current_device.id, str(ws_message))
+    broadcast_records([(current_device.id, record.__class__(**db_record.__dict__))])
     return db_record
 
 
+@records_router.get(records_router_root_path + "/export", tags=["Records"])
+async def export_user_records(current_user: Annotated[RegularUser, Depends(get_current_active_user)],
+                              record_type: str,
+                              export_format: Literal["arrow", "parquet"] = Query("arrow", alias="format"),
+                              start_date: Optional[NaiveUTCDatetime] = None,
+                              end_date: Optional[NaiveUTCDatetime] = None,
+                              models_db: AsyncSession = Depends(get_regular_db),
+                              session_factory=Depends(get_time_series_session_factory)):
+    # One record type across all devices of the user, declared before the routes matching any device id
+    if record_type not in arrow_service.record_types:
+        raise HTTPException(status_code=400, detail="Invalid record type")
+    device_type, model_class = arrow_service.record_types[record_type]
+    device_ids = await base_device_service.get_user_device_ids(models_db, current_user.id, device_type)
+    return columnar_export_response(session_factory, model_class, device_ids, export_format, start_date, end_date,
+                                    record_type)
+
+
 @records_router.get(records_router_root_path + "/{device_id}", tags=["Records"],
                     response_model=records_lists_response_model)
 async def get_device_records(current_device: Annotated[Device, Depends(device_dependency)],
-                             models_db: Session = Depends(get_regular_db),
-                             time_series_db: Session = Depends(get_time_series_db),
-                             limit: int = 100,
+                             response: Response,
+                             session_factory=Depends(get_time_series_session_factory),
+                             limit: int = Query(100, ge=1, le=settings.records_max_page_size),
                              skip: int = 0,
-                             start_date: Optional[datetime] = None,
-                             end_date: Optional[datetime] = None):
-    records = records_service.get_device_records(
-        models_db, time_series_db, current_device.id, skip=skip, limit=limit, start_date=start_date, end_date=end_date
+                             start_date: Optional[NaiveUTCDatetime] = None,
+                             end_date: Optional[NaiveUTCDatetime] = None,
+                             after: Optional[str] = None,
+                             max_points: Optional[int] = Query(None, ge=records_service.MIN_DOWNSAMPLED_POINTS)):
+    # The next page is requested with the X-Next-Cursor header of this one as "after", max_points returns the
+    # whole range downsampled for charts instead
+    cursor = None
+    if after is not None:
+        cursor = records_service.decode_records_cursor(after)
+        if cursor is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    records, next_cursor = await records_service.get_device_records(
+        session_factory, current_device, skip=skip, limit=limit, start_date=start_date, end_date=end_date, after=cursor,
+        max_points=max_points
+    )
+    if records is None:
+        raise HTTPException(status_code=400, detail="Too many records to downsample, narrow the date range")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return records
+
+
+@records_router.get(records_router_root_path + "/{device_id}/aggregate", tags=["Records"],
+                    response_model=Dict[str, List[RecordBucket]])
+async def get_device_records_aggregate(current_device: Annotated[Device, Depends(device_dependency)],
+                                       bucket: str,
+                                       models_db: AsyncSession = Depends(get_regular_db),
+                                       time_series_db: AsyncSession = Depends(get_time_series_db),
+                                       fields: Optional[str] = None,
+                                       agg: Optional[str] = None,
+                                       start_date: Optional[NaiveUTCDatetime] = None,
+                                       end_date: Optional[NaiveUTCDatetime] = None,
+                                       limit: int = Query(1000, ge=1, le=settings.records_aggregate_max_buckets)):
+    # Buckets like 5m, 1h or 1d, fields and aggregates as comma separated lists
+    bucket_interval = records_service.parse_bucket(bucket)
+    if bucket_interval is None:
+        raise HTTPException(status_code=400, detail="Invalid bucket")
+    records = await records_service.get_device_records_aggregate(
+        models_db, time_series_db, current_device.id, bucket_interval,
+        fields=fields.split(",") if fields else None, aggregates=agg.split(",") if agg else None,
+        start_date=start_date, end_date=end_date, limit=limit
     )
     if records is None:
         raise HTTPException(status_code=400, detail="Bad request")
     return records
 
 
+@records_router.get(records_router_root_path + "/{device_id}/export", tags=["Records"])
+async def export_device_records(current_device: Annotated[Device, Depends(device_dependency)],
+                                export_format: export_formats = Query("ndjson", alias="format"),
+                                record_type: Optional[str] = None,
+                                start_date: Optional[NaiveUTCDatetime] = None,
+                                end_date: Optional[NaiveUTCDatetime] = None,
+                                session_factory=Depends(get_time_series_session_factory)):
+    if export_format in ("arrow", "parquet"):
+        # Columnar formats hold a single record type
+        device_type, model_class = arrow_service.record_types.get(record_type, (None, None))
+        if device_type != current_device.type:
+            raise HTTPException(status_code=400, detail="Invalid record type")
+        return columnar_export_response(session_factory, model_class, [current_device.id], export_format,
+                                        start_date, end_date, f"{current_device.id}.{record_type}")
+
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        records_service.export_device_records(session_factory, current_device, export_format, start_date, end_date),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{current_device.id}.{export_format}"'}
+    )
+
+
+def columnar_export_response(session_factory, model_class, device_ids, export_format, start_date, end_date, name):
+    media_type = arrow_service.PARQUET_MEDIA_TYPE if export_format == "parquet" else arrow_service.ARROW_MEDIA_TYPE
+    return StreamingResponse(
+        arrow_service.export_records_columnar(session_factory, model_class, device_ids, export_format,
+                                              start_date, end_date),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"'}
+    )
+
+
+@records_router.websocket(records_router_root_path + "/stream")
+async def records_stream_websocket(websocket: WebSocket,
+                                   regular_session_factory=Depends(get_regular_session_factory),
+                                   time_series_session_factory=Depends(get_time_series_session_factory)):
+    # A Hub streams record and presence frames that are acked by their seq. Its token is checked again before every
+    # frame, and every frame gets sessions of its own, no database connection is held while the stream is idle
+    token = websocket.headers.get('Authorization')
+    if not token or not token.startswith("Bearer "):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    token = token[7:]
+    if await authenticate_stream(regular_session_factory, token) is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await websocket.send_json({"window": settings.records_stream_window})
+
+    # Frames keep being received while earlier ones are stored, the Hub never sends more than the window
+    frames = asyncio.Queue(maxsize=settings.records_stream_window)
+    processor = asyncio.create_task(process_stream_frames(websocket, frames, token, regular_session_factory,
+                                                          time_series_session_factory))
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            binary = message.get("bytes") is not None
+            try:
+                data = msgpack.unpackb(message["bytes"]) if binary else json.loads(message["text"])
+                frame = RecordStreamFrame.model_validate(data)
+            except ValueError:
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                break
+            await frames.put((frame, binary))
+    finally:
+        processor.cancel()
+        await asyncio.gather(processor, return_exceptions=True)
+
+
+async def authenticate_stream(regular_session_factory, token: str):
+    # Served from the token and principal caches, an expired token, a revoked key or a deactivated user fails
+    # as soon as the invalidation arrives
+    async with regular_session_factory() as models_db:
+        try:
+            current_user = await get_current_hub_user(token=token, db=models_db)
+            return await get_current_active_user(current_user=current_user)
+        except HTTPException:
+            return None
+
+
+async def process_stream_frames(websocket: WebSocket, frames: asyncio.Queue, token: str, regular_session_factory,
+                                time_series_session_factory):
+    while True:
+        frame, binary = await frames.get()
+        current_user = await authenticate_stream(regular_session_factory, token)
+        if current_user is None:
+            # The Hub sends the frames still waiting for an ack again, once it has new credentials
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        try:
+            async with regular_session_factory() as models_db, time_series_session_factory() as time_series_db:
+                status_code, body = await process_stream_frame(frame, current_user, models_db, time_series_db)
+        except Exception as e:
+            print(f"Failed to process records stream frame: {e}")
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+            return
+
+        ack = {"ack": frame.seq, "status": status_code, "body": body}
+        if binary:
+            await websocket.send_bytes(msgpack.packb(ack))
+        else:
+            await websocket.send_json(ack)
+
+
+async def process_stream_frame(frame: RecordStreamFrame, current_user: RegularUser,
+                               models_db: AsyncSession, time_series_db: AsyncSession):
+    try:
+        if frame.type == "records":
+            batch = RecordBatch.model_validate(frame.body)
+            accepted = await records_service.record_devices_data_batch(models_db, time_series_db, current_user.id,
+                                                                       batch.records)
+            broadcast_records(accepted)
+            return 200, RecordBatchResult(accepted=len(accepted),
+                                          rejected=len(batch.records) - len(accepted)).model_dump()
+
+        presence = DevicePresenceBatch.model_validate(frame.body)
+        updated = await base_device_service.set_devices_presence(
+            models_db, current_user.id, {device.device_id: device.is_online for device in presence.devices}
+        )
+        return 200, DevicePresenceResult(updated=updated).model_dump()
+    except ValueError:
+        return 422, {"detail": "Invalid frame body"}
+
+
 @records_router.websocket(records_router_root_path + "/{device_id}")
 async def device_records_websocket(websocket: WebSocket,
                                    device_id: uuid.UUID,
-                                   db: Session = Depends(get_regular_db)):
+                                   db: AsyncSession = Depends(get_regular_db)):
     # Get token from headers
     token = websocket.headers.get('Authorization')
     if not token:
@@ -68,7 +276,7 @@ async def device_records_websocket(websocket: WebSocket,
         # Check client authorization
         current_user = await get_current_user(token=token, db=db)
         current_user = await get_current_active_user(current_user=current_user)
-        device = device_dependency(device_id=device_id, current_user=current_user, db=db)
+        device = await device_dependency(device_id=device_id, current_user=current_user, db=db)
 
         await records_ws_manager.connect(websocket, device.id)
         try:
@@ -77,4 +285,4 @@ async def device_records_websocket(websocket: WebSocket,
         except WebSocketDisconnect:
             await records_ws_manager.disconnect(websocket, device.id)
     finally:
-        db.close()
+        await db.close()
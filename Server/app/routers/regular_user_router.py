@@ -1,6 +1,7 @@
 from typing import Annotated
+from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.dependencies.database import get_regular_db
 from app.entities import schemas
@@ -18,26 +19,39 @@ async def read_all_users(
         current_user: Annotated[RegularUser, Depends(user_dependency([Role.ADMIN]))],
         skip: int = 0,
         limit: int = 100,
-        db: Session = Depends(get_regular_db)):
-    users = regular_user_service.get_users(db, skip=skip, limit=limit)
+        db: AsyncSession = Depends(get_regular_db)):
+    users = await regular_user_service.get_users(db, skip=skip, limit=limit)
     return users
 
 
 @regular_user_router.post(regular_user_router_root_path, tags=["Users"], response_model=schemas.RegularUser)
 async def create_user(
         new_user: schemas.UserCreate,
-        db: Session = Depends(get_regular_db)):
-    user = base_user_service.get_base_user_by_email(db, email=new_user.email)
+        db: AsyncSession = Depends(get_regular_db)):
+    user = await base_user_service.get_base_user_by_email(db, email=new_user.email)
     if user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return regular_user_service.create_user(db=db, user=new_user)
+    return await regular_user_service.create_user(db=db, user=new_user)
 
 
 @regular_user_router.get(regular_user_router_root_path + "/me", tags=["Users"], response_model=schemas.RegularUser)
 async def read_my_info(
         current_user: Annotated[RegularUser, Depends(user_dependency([Role.REGULAR_USER]))],
-        db: Session = Depends(get_regular_db)):
-    user = regular_user_service.get_user(db, user_id=current_user.id)
+        db: AsyncSession = Depends(get_regular_db)):
+    user = await regular_user_service.get_user(db, user_id=current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+@regular_user_router.put(regular_user_router_root_path + "/{user_id}/status", tags=["Users"],
+                         response_model=schemas.UserBase)
+async def update_user_status(
+        user_id: UUID,
+        user_status: schemas.UserStatusUpdate,
+        current_user: Annotated[RegularUser, Depends(user_dependency([Role.ADMIN]))],
+        db: AsyncSession = Depends(get_regular_db)):
+    user = await base_user_service.update_user_status(db, user_id=user_id, user_status=user_status)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -1,21 +1,22 @@
 from uuid import UUID
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.passwords import get_password_hash
 from app.entities import schemas, models
 
 
-def get_admin(db: Session, admin_id: UUID):
-    return db.query(models.Admin).filter(models.Admin.id == admin_id).first()
+async def get_admin(db: AsyncSession, admin_id: UUID):
+    return (await db.scalars(select(models.Admin).filter(models.Admin.id == admin_id))).first()
 
 
-def get_admins(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Admin).offset(skip).limit(limit).all()
+async def get_admins(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return (await db.scalars(select(models.Admin).offset(skip).limit(limit))).all()
 
 
-def create_admin(db: Session, user: schemas.UserCreate):
-    db_user = models.Admin(email=user.email, hashed_password=get_password_hash(user.password))
+async def create_admin(db: AsyncSession, user: schemas.UserCreate):
+    db_user = models.Admin(email=user.email, hashed_password=await get_password_hash(user.password))
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
@@ -0,0 +1,61 @@
+from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import LRUTTLCache, invalidation_bus
+from app.core.config import settings
+from app.core.tokens import generate_api_key, get_api_key_secret, hash_api_key
+from app.entities import schemas, models
+from app.services.base_user_service import get_principal_by_email
+
+# Owner emails of API keys by key hash, the owner principal itself comes from the principal cache
+api_key_cache = LRUTTLCache(settings.api_key_cache_size, settings.api_key_cache_ttl)
+invalidation_bus.register("api_keys", api_key_cache, key_type=str)
+
+
+async def get_api_key(db: AsyncSession, api_key_id: UUID):
+    return (await db.scalars(select(models.ApiKey).filter(models.ApiKey.id == api_key_id))).first()
+
+
+async def get_api_keys(db: AsyncSession, owner_id: UUID, skip: int = 0, limit: int = 100):
+    return (await db.scalars(
+        select(models.ApiKey).filter(models.ApiKey.owner_id == owner_id).offset(skip).limit(limit)
+    )).all()
+
+
+async def create_api_key(db: AsyncSession, api_key: schemas.ApiKeyCreate):
+    if get_api_key_secret() is None:
+        return None
+    key = generate_api_key()
+    db_api_key = models.ApiKey(title=api_key.title, owner_id=api_key.owner_id, hashed_key=hash_api_key(key))
+    db.add(db_api_key)
+    await db.commit()
+    await db.refresh(db_api_key)
+    return schemas.ApiKeyCreated(id=db_api_key.id, title=db_api_key.title, owner_id=db_api_key.owner_id,
+                                 created_timestamp=db_api_key.created_timestamp, key=key)
+
+
+async def revoke_api_key(db: AsyncSession, api_key_id: UUID):
+    db_api_key = await get_api_key(db, api_key_id)
+    if db_api_key is None:
+        return None
+    await db.delete(db_api_key)
+    await db.commit()
+    await invalidation_bus.publish("api_keys", db_api_key.hashed_key)
+    return db_api_key
+
+
+async def get_api_key_principal(db: AsyncSession, key: str):
+    if get_api_key_secret() is None:
+        return None
+    hashed_key = hash_api_key(key)
+    email = api_key_cache.get(hashed_key)
+    if email is None:
+        email = (await db.scalars(
+            select(models.RegularUser.email).join(models.ApiKey, models.ApiKey.owner_id == models.RegularUser.id)
+            .filter(models.ApiKey.hashed_key == hashed_key)
+        )).first()
+        if email is None:
+            return None
+        api_key_cache.set(hashed_key, email)
+    return await get_principal_by_email(db, email)
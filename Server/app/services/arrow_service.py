@@ -0,0 +1,106 @@
+import io
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Enum, Float, Integer, asc, select
+
+from app.core.config import settings
+from app.core.utils import camelcase_to_snakecase
+from app.services.records_service import schema_model_map
+
+# Record tables by the record type clients name, with the device type they belong to
+record_types = {
+    camelcase_to_snakecase(model_class.__name__): (device_type, model_class)
+    for device_type, model_map in schema_model_map.items() for model_class in model_map.values()
+}
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+
+def get_arrow_type(column):
+    if column.name == "timestamp":
+        return pa.timestamp("us")
+    if column.name == "device_id" or isinstance(column.type, Enum):
+        # Few distinct values repeated on every row
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, Integer):
+        return pa.int32()
+    return pa.string()
+
+
+def get_arrow_schema(model_class):
+    # Time and device first, then the record values in table order
+    columns = sorted(model_class.__table__.columns, key=lambda column: column.name not in ("timestamp", "device_id"))
+    return pa.schema([pa.field(column.name, get_arrow_type(column), nullable=False) for column in columns])
+
+
+def get_dictionaries(model_class, device_ids: list[UUID]):
+    # Fixed up front, so every batch shares the same dictionary and the IPC stream never replaces one
+    dictionaries = {"device_id": [str(device_id) for device_id in device_ids]}
+    for column in model_class.__table__.columns:
+        if isinstance(column.type, Enum):
+            dictionaries[column.name] = list(column.type.enums)
+    return {name: (pa.array(values, pa.string()), {value: index for index, value in enumerate(values)})
+            for name, values in dictionaries.items()}
+
+
+def build_record_batch(schema: pa.Schema, dictionaries, rows):
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if field.name in dictionaries:
+            dictionary, indices = dictionaries[field.name]
+            keys = [indices[str(value) if field.name == "device_id" else value.name] for value in values]
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(keys, pa.int32()), dictionary))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def export_records_columnar(session_factory, model_class, device_ids: list[UUID], export_format: str,
+                                  start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    # Columns are built batch by batch from the database cursor, no row is held longer than its batch
+    schema = get_arrow_schema(model_class)
+    dictionaries = get_dictionaries(model_class, device_ids)
+    query = (select(*[model_class.__table__.columns[name] for name in schema.names])
+             .filter(model_class.device_id.in_(device_ids)))
+    if start_date:
+        query = query.filter(model_class.timestamp >= start_date)
+    if end_date:
+        query = query.filter(model_class.timestamp <= end_date)
+    query = (query.order_by(asc(model_class.device_id), asc(model_class.timestamp))
+             .execution_options(yield_per=settings.records_export_batch_size))
+
+    sink = io.BytesIO()
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    # Parquet row groups span many cursor batches, small row groups would defeat the columnar layout
+    pending = []
+    pending_rows = 0
+    async with session_factory() as db:
+        result = await db.stream(query)
+        async for partition in result.partitions():
+            batch = build_record_batch(schema, dictionaries, partition)
+            if export_format == "parquet":
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                if pending_rows < settings.records_export_row_group_size:
+                    continue
+                writer.write_table(pa.Table.from_batches(pending))
+                pending = []
+                pending_rows = 0
+            else:
+                writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    if pending:
+        writer.write_table(pa.Table.from_batches(pending))
+    writer.close()
+    yield sink.getvalue()
@@ -1,8 +1,11 @@
+from typing import Iterable
 from uuid import UUID
 
-from sqlalchemy import desc
-from sqlalchemy.orm import Session
+from sqlalchemy import desc, select, update, case
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import LRUTTLCache, invalidation_bus
+from app.core.config import settings
 from app.entities import schemas, models
 from app.entities.enums import DeviceType
 
@@ -11,68 +14,126 @@ model_mapping = {
     DeviceType.WASTE_SORTER: models.WasteSorter
 }
 
+# Detached snapshots of devices, type and owner are read on every request but almost never change
+device_cache = LRUTTLCache(settings.device_cache_size, settings.device_cache_ttl)
+invalidation_bus.register("devices", device_cache)
 
-def get_device(db: Session, device_id: UUID):
-    return (db.query(models.BaseDevice)
-            .filter(models.BaseDevice.id == device_id)
-            .first())
 
+async def get_device_metadata(db: AsyncSession, device_id: UUID):
+    device = device_cache.get(device_id)
+    if device is None:
+        db_device = await get_device(db, device_id)
+        if db_device is None:
+            return None
+        device = schemas.Device.model_validate(db_device)
+        device_cache.set(device_id, device)
+    return device
 
-def get_devices(db: Session, skip: int = 0, limit: int = 100):
-    return (db.query(models.BaseDevice)
-            .offset(skip)
-            .limit(limit).all())
 
+async def get_devices_metadata(db: AsyncSession, device_ids: Iterable[UUID]):
+    devices = {}
+    missing_ids = set()
+    for device_id in device_ids:
+        device = device_cache.get(device_id)
+        if device is None:
+            missing_ids.add(device_id)
+        else:
+            devices[device_id] = device
+    if missing_ids:
+        for db_device in (await db.scalars(select(models.BaseDevice)
+                                           .filter(models.BaseDevice.id.in_(missing_ids)))).all():
+            device = devices[db_device.id] = schemas.Device.model_validate(db_device)
+            device_cache.set(db_device.id, device)
+    return devices
 
-def get_unlinked_devices(db: Session, skip: int = 0, limit: int = 100):
-    return (db.query(models.BaseDevice)
-            .filter(models.BaseDevice.owner_id == None)
-            .offset(skip)
-            .limit(limit).all())
 
+async def invalidate_devices(device_ids: Iterable[UUID]):
+    await invalidation_bus.publish_many("devices", device_ids)
 
-def get_user_devices(db: Session, user_id: UUID, skip: int = 0, limit: int = 100):
-    return (db.query(models.BaseDevice)
-            .filter(models.BaseDevice.owner_id == user_id)
-            .order_by(desc(models.BaseDevice.linked_timestamp))
-            .offset(skip)
-            .limit(limit)
-            .all())
 
+async def get_device(db: AsyncSession, device_id: UUID):
+    return (await db.scalars(select(models.BaseDevice)
+                             .filter(models.BaseDevice.id == device_id))).first()
 
-def link_device_to_user(db: Session, device_id: UUID, user_id: UUID):
-    db_device = get_device(db, device_id)
+
+async def get_devices(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return (await db.scalars(select(models.BaseDevice)
+                             .offset(skip)
+                             .limit(limit))).all()
+
+
+async def get_unlinked_devices(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return (await db.scalars(select(models.BaseDevice)
+                             .filter(models.BaseDevice.owner_id == None)
+                             .offset(skip)
+                             .limit(limit))).all()
+
+
+async def get_user_devices(db: AsyncSession, user_id: UUID, skip: int = 0, limit: int = 100):
+    return (await db.scalars(select(models.BaseDevice)
+                             .filter(models.BaseDevice.owner_id == user_id)
+                             .order_by(desc(models.BaseDevice.linked_timestamp))
+                             .offset(skip)
+                             .limit(limit))).all()
+
+
+async def get_user_device_ids(db: AsyncSession, user_id: UUID, device_type: DeviceType):
+    return (await db.scalars(select(models.BaseDevice.id)
+                             .filter(models.BaseDevice.owner_id == user_id, models.BaseDevice.type == device_type)
+                             .order_by(models.BaseDevice.id))).all()
+
+
+async def link_device_to_user(db: AsyncSession, device_id: UUID, user_id: UUID):
+    db_device = await get_device(db, device_id)
     if db_device.owner_id:
         return None
     db_device.owner_id = user_id
-    db.commit()
-    db.refresh(db_device)
+    await db.commit()
+    await invalidate_devices([device_id])
+    await db.refresh(db_device)
     return db_device
 
 
-def create_device(db: Session, device_schema: schemas.DeviceCreate):
+async def create_device(db: AsyncSession, device_schema: schemas.DeviceCreate):
     model_class = model_mapping.get(device_schema.type)
     if not model_class:
         return None
     db_device = model_class(**device_schema.model_dump(exclude={'type'}))
     db.add(db_device)
-    db.commit()
-    db.refresh(db_device)
+    await db.commit()
+    await invalidate_devices([db_device.id])
+    await db.refresh(db_device)
     return db_device
 
 
-def update_device(db: Session, device_id: UUID, device_schema: schemas.DeviceUpdate):
-    db_device = get_device(db, device_id)
+async def update_device(db: AsyncSession, device_id: UUID, device_schema: schemas.DeviceUpdate):
+    db_device = await get_device(db, device_id)
     db_device.title = device_schema.title
     db_device.description = device_schema.description
-    db.commit()
-    db.refresh(db_device)
+    await db.commit()
+    await invalidate_devices([device_id])
+    await db.refresh(db_device)
     return db_device
 
 
-def toggle_device(db: Session, device_id: UUID, is_online: bool):
-    db_device = get_device(db, device_id)
+async def toggle_device(db: AsyncSession, device_id: UUID, is_online: bool):
+    db_device = await get_device(db, device_id)
     db_device.is_online = is_online
-    db.commit()
-    db.refresh(db_device)
+    await db.commit()
+    await invalidate_devices([device_id])
+    await db.refresh(db_device)
     return db_device
+
+
+async def set_devices_presence(db: AsyncSession, owner_id: UUID, presence: dict[UUID, bool]):
+    if not presence:
+        return 0
+    # A single UPDATE for all devices, each one gets its own value through the CASE expression
+    result = await db.execute(update(models.BaseDevice)
+                              .where(models.BaseDevice.owner_id == owner_id)
+                              .where(models.BaseDevice.id.in_(presence.keys()))
+                              .values(is_online=case(presence, value=models.BaseDevice.id))
+                              .execution_options(synchronize_session=False))
+    await db.commit()
+    await invalidate_devices(presence.keys())
+    return result.rowcount
@@ -1,17 +1,56 @@
-from sqlalchemy.orm import Session
+from uuid import UUID
 
-from app.entities import models
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import LRUTTLCache, invalidation_bus
+from app.core.config import settings
+from app.entities import models, schemas
 from app.core.passwords import verify_password
 
+# Principals of authenticated users by email, evicted when their status or role changes
+principal_cache = LRUTTLCache(settings.principal_cache_size, settings.principal_cache_ttl)
+invalidation_bus.register("principals", principal_cache, key_type=str)
+
 
-def authenticate_base_user(db: Session, email: str, password: str):
-    user = get_base_user_by_email(db, email)
+async def authenticate_base_user(db: AsyncSession, email: str, password: str):
+    user = await get_base_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
 
-def get_base_user_by_email(db: Session, email: str):
-    return db.query(models.BaseUser).filter(models.BaseUser.email == email).first()
+async def get_base_user(db: AsyncSession, user_id: UUID):
+    return (await db.scalars(select(models.BaseUser).filter(models.BaseUser.id == user_id))).first()
+
+
+async def get_base_user_by_email(db: AsyncSession, email: str):
+    return (await db.scalars(select(models.BaseUser).filter(models.BaseUser.email == email))).first()
+
+
+async def get_principal_by_email(db: AsyncSession, email: str):
+    principal = principal_cache.get(email)
+    if principal is None:
+        user = await get_base_user_by_email(db, email)
+        if user is None:
+            return None
+        principal = schemas.Principal.model_validate(user)
+        principal_cache.set(email, principal)
+    return principal
+
+
+async def update_user_status(db: AsyncSession, user_id: UUID, user_status: schemas.UserStatusUpdate):
+    user = await get_base_user(db, user_id)
+    if user is None:
+        return None
+    values = user_status.model_dump(exclude_none=True)
+    if values:
+        # The role is the polymorphic identity, so the row is updated directly and reloaded
+        await db.execute(update(models.BaseUser).where(models.BaseUser.id == user_id).values(**values))
+        await db.commit()
+        await invalidation_bus.publish("principals", user.email)
+        db.expunge(user)
+        user = await get_base_user(db, user_id)
+    return user
@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def largest_triangle_three_buckets(x: np.ndarray, y: np.ndarray, threshold: int):
+    # Indices of the points kept, the first, the last, and in every bucket between them the point forming the
+    # largest triangle with the point kept before it and the average of the next bucket, so peaks and troughs stay
+    size = len(x)
+    if threshold >= size:
+        return np.arange(size)
+    if threshold < 3:
+        return np.array([0, size - 1][:threshold], dtype=np.intp)
+
+    edges = (np.arange(threshold - 1) * ((size - 2) / (threshold - 2))).astype(np.intp) + 1
+    edges[-1] = size - 1
+    counts = np.diff(edges)
+    # Averages of every bucket at once, the last bucket is followed by the last point
+    next_x = np.append(np.add.reduceat(x[1:-1], edges[:-1] - 1)[1:] / counts[1:], x[-1])
+    next_y = np.append(np.add.reduceat(y[1:-1], edges[:-1] - 1)[1:] / counts[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = size - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        areas = np.abs((x[a] - next_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(timestamps: np.ndarray, series: list[np.ndarray], max_points: int):
+    # Every series keeps its own shape within an equal share of the points, the rows kept are those any series needs.
+    # A series gets 3 points at least, fewer would lose its shape, max_points must allow for that
+    if len(timestamps) <= max_points:
+        return np.arange(len(timestamps))
+    x = (timestamps - timestamps[0]).astype(np.float64)
+    threshold = max(max_points // len(series), 3)
+    return np.unique(np.concatenate([largest_triangle_three_buckets(x, y, threshold) for y in series]))
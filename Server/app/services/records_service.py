@@ -1,23 +1,48 @@
-from typing import Optional
+import asyncio
+import base64
+import binascii
+import csv
+import enum
+import io
+import json
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional, Union
 from uuid import UUID
 
-from sqlalchemy import asc
-from sqlalchemy.orm import Session
+import numpy as np
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import asc, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.utils import camelcase_to_snakecase
+from app.core.config import settings
+from app.core.utils import camelcase_to_snakecase, to_naive_utc, utc_now
 from app.entities import schemas, time_series_models
 from app.entities.enums import DeviceType
-from app.services import base_device_service
+from app.services import base_device_service, downsampling_service, rollup_service
 
 schema_model_map = {
     DeviceType.THERMO_HUMID_METER: {
-        schemas.ThermoHumidMeterRecord: time_series_models.ThermoHumidMeterRecord
+        schemas.ThermoHumidMeterRecord: time_series_models.ThermoHumidMeterRecord,
+        schemas.ThermoHumidMeterAggregateRecord: time_series_models.ThermoHumidMeterAggregateRecord
     },
     DeviceType.WASTE_SORTER: {
         schemas.WasteSorterRecycleRecord: time_series_models.WasteSorterRecycleRecord,
         schemas.WasteSorterLevelRecord: time_series_models.WasteSorterLevelRecord
     }
 }
+# Record tables aggregated per bucket
+aggregated_models = {
+    DeviceType.THERMO_HUMID_METER: [time_series_models.ThermoHumidMeterRecord],
+    DeviceType.WASTE_SORTER: [time_series_models.WasteSorterRecycleRecord, time_series_models.WasteSorterLevelRecord]
+}
+aggregate_names = ["avg", "min", "max", "sum", "count"]
+# Every series of a downsampled table keeps at least its first, last and one point between them
+MIN_DOWNSAMPLED_POINTS = 3 * max(len(rollup_service.get_aggregated_fields(model_class))
+                                 for model_map in schema_model_map.values() for model_class in model_map.values())
+bucket_units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
 
 
 def get_all_records_schemas():
@@ -27,12 +52,64 @@ def get_all_records_schemas():
     return all_schemas
 
 
+records_adapter = TypeAdapter(Union[tuple(get_all_records_schemas())])
+
+
+def insert_ignoring_duplicates(db: AsyncSession, model_class):
+    dialect_name = db.bind.dialect.name
+    if dialect_name == "postgresql":
+        return postgresql.insert(model_class).on_conflict_do_nothing()
+    if dialect_name == "sqlite":
+        return sqlite.insert(model_class).on_conflict_do_nothing()
+    return insert(model_class)
+
+
+async def record_devices_data_batch(
+        models_db: AsyncSession,
+        time_series_db: AsyncSession,
+        owner_id: UUID,
+        items: list[schemas.RecordBatchItem]):
+    devices = await base_device_service.get_devices_metadata(models_db, {item.device_id for item in items})
+    device_types = {device.id: device.type for device in devices.values() if device.owner_id == owner_id}
+
+    rows_by_model = defaultdict(list)
+    schema_classes = {}
+    for item in items:
+        model_map = schema_model_map.get(device_types.get(item.device_id))
+        if model_map is None:
+            continue
+        try:
+            record = records_adapter.validate_python(item.record)
+        except ValidationError:
+            continue
+        model_class = model_map.get(record.__class__)
+        if model_class is None:
+            continue
+
+        if record.timestamp is None:
+            record.timestamp = utc_now()
+        rows_by_model[model_class].append({"device_id": item.device_id, **record.model_dump()})
+        schema_classes[model_class] = record.__class__
+
+    # One multi-row insert per table, all in a single transaction with the rollups of the records actually stored.
+    # Duplicates of a retried batch are skipped by the insert, only the rows it returns are accepted
+    accepted = []
+    for model_class, rows in rows_by_model.items():
+        inserted = (await time_series_db.execute(
+            insert_ignoring_duplicates(time_series_db, model_class).returning(*model_class.__table__.columns), rows
+        )).mappings().all()
+        await rollup_service.roll_up_records(time_series_db, model_class, inserted)
+        accepted.extend((row["device_id"], schema_classes[model_class](**row)) for row in inserted)
+    await time_series_db.commit()
+    return accepted
+
+
 async def record_device_data(
-        models_db: Session,
-        time_series_db: Session,
+        models_db: AsyncSession,
+        time_series_db: AsyncSession,
         device_id: UUID,
         record):
-    device = base_device_service.get_device(models_db, device_id)
+    device = await base_device_service.get_device_metadata(models_db, device_id)
 
     model_map = schema_model_map.get(device.type)
     if model_map is None:
@@ -41,31 +118,265 @@ async def record_device_data(
     if model_class is None:
         return None
 
-    model_instance = model_class(device_id=device_id, **record.model_dump(exclude={'timestamp'}))
+    # Stamped here rather than by the database, the timestamp is part of the primary key
+    row = {"device_id": device_id, "timestamp": utc_now(), **record.model_dump(exclude={'timestamp'})}
+    model_instance = model_class(**row)
     time_series_db.add(model_instance)
-    time_series_db.commit()
-    time_series_db.refresh(model_instance)
+    await time_series_db.flush()
+    await rollup_service.roll_up_records(time_series_db, model_class, [row])
+    await time_series_db.commit()
+    await time_series_db.refresh(model_instance)
     return model_instance
 
 
-def get_device_records(
-        models_db: Session,
-        time_series_db: Session,
+def encode_records_cursor(positions: dict[str, Optional[str]]):
+    return base64.urlsafe_b64encode(json.dumps(positions).encode()).decode()
+
+
+def decode_records_cursor(cursor: str):
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {name: None if position is None else to_naive_utc(datetime.fromisoformat(position))
+                for name, position in positions.items()}
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, AttributeError):
+        return None
+
+
+async def get_table_records(
+        session_factory,
+        record_model,
+        device_id: UUID,
+        skip: int,
+        limit: int,
+        start_date: Optional[float],
+        end_date: Optional[float],
+        after: Optional[datetime]):
+    query = select(record_model).filter(record_model.device_id == device_id)
+    if start_date:
+        query = query.filter(record_model.timestamp >= start_date)
+    if end_date:
+        query = query.filter(record_model.timestamp <= end_date)
+    if after is not None:
+        # Seeks in the (device_id, timestamp) primary key, so deep pages cost the same as the first one
+        query = query.filter(record_model.timestamp > after)
+    query = query.order_by(asc(record_model.timestamp))
+    async with session_factory() as db:
+        return (await db.scalars(query.offset(skip).limit(limit))).all()
+
+
+async def get_downsampled_table_records(
+        session_factory,
+        record_model,
         device_id: UUID,
+        start_date: Optional[float],
+        end_date: Optional[float],
+        max_points: int):
+    # The whole range is streamed into an array per column and reduced for charts, rather than paged, so no row
+    # object is kept for the points that are dropped
+    fields = rollup_service.get_aggregated_fields(record_model)
+    columns = [column for column in record_model.__table__.columns if column.name != "device_id"]
+    query = select(*columns).filter(record_model.device_id == device_id)
+    if start_date:
+        query = query.filter(record_model.timestamp >= start_date)
+    if end_date:
+        query = query.filter(record_model.timestamp <= end_date)
+    # Past the row cap the range is refused, its arrays are bounded by the cap
+    query = (query.order_by(asc(record_model.timestamp)).limit(settings.records_downsample_max_rows + 1)
+             .execution_options(yield_per=settings.records_export_batch_size))
+    dtypes = ["datetime64[us]" if column.name == "timestamp" else np.float64 if column.name in fields else object
+              for column in columns]
+    chunks = []
+    async with session_factory() as db:
+        result = await db.stream(query)
+        async for partition in result.partitions():
+            chunks.append([np.array(values, dtype=dtype) for values, dtype in zip(zip(*partition), dtypes)])
+    arrays = {column.name: np.concatenate(column_chunks) for column, column_chunks in zip(columns, zip(*chunks))}
+    if not arrays:
+        return []
+    if len(arrays["timestamp"]) > settings.records_downsample_max_rows:
+        return None
+    indices = downsampling_service.downsample(arrays["timestamp"], [arrays[field] for field in fields], max_points)
+    kept = {name: array[indices].tolist() for name, array in arrays.items()}
+    return [dict(zip(kept, values)) for values in zip(*kept.values())]
+
+
+async def get_device_records(
+        session_factory,
+        device: schemas.Device,
         skip: int = 0,
         limit: int = 100,
         start_date: Optional[float] = None,
-        end_date: Optional[float] = None):
-    device = base_device_service.get_device(models_db, device_id)
+        end_date: Optional[float] = None,
+        after: Optional[dict[str, Optional[datetime]]] = None,
+        max_points: Optional[int] = None):
+    # The cursor holds the last timestamp returned of every table, None once a table is exhausted
+    record_models = {camelcase_to_snakecase(record_model.__name__): record_model
+                     for record_model in schema_model_map[device.type].values()}
+    queried = {name: record_model for name, record_model in record_models.items()
+               if after is None or name not in after or after[name] is not None}
+    # Tables without numeric values to chart are paged as usual
+    downsampled = {name for name, record_model in queried.items()
+                   if max_points is not None and rollup_service.get_aggregated_fields(record_model)}
+
+    # Every table is read on its own pooled connection, the request waits for the slowest table only
+    results = await asyncio.gather(*(
+        get_downsampled_table_records(session_factory, record_model, device.id, start_date, end_date, max_points)
+        if name in downsampled else
+        get_table_records(session_factory, record_model, device.id, skip, limit, start_date, end_date,
+                          after.get(name) if after is not None else None)
+        for name, record_model in queried.items()
+    ))
+    if any(result is None for result in results):
+        return None, None
+    records = {name: [] for name in record_models} | dict(zip(queried, results))
+    positions = {name: rows[-1].timestamp.isoformat() if rows and len(rows) == limit and name not in downsampled
+                 else None for name, rows in records.items()}
+
+    next_cursor = encode_records_cursor(positions) if any(positions.values()) else None
+    return records, next_cursor
+
+
+def get_export_query(model_class, device_id: UUID, start_date: Optional[datetime], end_date: Optional[datetime]):
+    # Plain rows rather than ORM objects, fetched through a server side cursor in batches
+    query = (select(*[column for column in model_class.__table__.columns if column.name != "device_id"])
+             .filter(model_class.device_id == device_id))
+    if start_date:
+        query = query.filter(model_class.timestamp >= start_date)
+    if end_date:
+        query = query.filter(model_class.timestamp <= end_date)
+    return query.order_by(asc(model_class.timestamp)).execution_options(yield_per=settings.records_export_batch_size)
+
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+async def export_device_records(session_factory, device: schemas.Device, export_format: str,
+                                start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+    # Records of every table of the device one after the other, each row tagged with its record type
+    model_classes = list(schema_model_map[device.type].values())
+    csv_columns = ["record_type", "timestamp"] + list(dict.fromkeys(
+        column.name for model_class in model_classes for column in model_class.__table__.columns
+        if column.name not in ("device_id", "timestamp")
+    ))
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=csv_columns, lineterminator="\n")
+    if export_format == "csv":
+        writer.writeheader()
+
+    async with session_factory() as db:
+        for model_class in model_classes:
+            record_type = camelcase_to_snakecase(model_class.__name__)
+            result = await db.stream(get_export_query(model_class, device.id, start_date, end_date))
+            async for partition in result.mappings().partitions():
+                for row in partition:
+                    record = {"record_type": record_type, **{key: export_value(value) for key, value in row.items()}}
+                    if export_format == "csv":
+                        writer.writerow(record)
+                    else:
+                        buffer.write(json.dumps(record))
+                        buffer.write("\n")
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def parse_bucket(bucket: str):
+    match = re.fullmatch(r"(\d+)([smhd])", bucket)
+    if match is None or int(match.group(1)) == 0:
+        return None
+    return timedelta(**{bucket_units[match.group(2)]: int(match.group(1))})
+
+
+def partial_aggregates_query(dialect_name: str, source_class, model_class, device_id: UUID, bucket: timedelta,
+                             fields: list[str], start_date, end_date, end_inclusive: bool, limit: int):
+    # Counts, sums, minimums and maximums per bucket, they merge across raw records and rollups
+    rollup = source_class is not model_class
+    bucket_column = rollup_service.time_bucket(dialect_name, bucket, source_class.timestamp).label("bucket")
+    counted_column = rollup_service.counted_columns.get(model_class)
+    group = [bucket_column] + ([getattr(source_class, counted_column)] if counted_column else [])
+    columns = [*group, (func.sum(source_class.sample_count) if rollup else func.count()).label("count")]
+    for field in fields:
+        columns += [func.sum(getattr(source_class, f"{field}_sum" if rollup else field)).label(f"{field}_sum"),
+                    func.min(getattr(source_class, f"{field}_min" if rollup else field)).label(f"{field}_min"),
+                    func.max(getattr(source_class, f"{field}_max" if rollup else field)).label(f"{field}_max")]
+
+    query = select(*columns).filter(source_class.device_id == device_id)
+    if start_date:
+        query = query.filter(source_class.timestamp >= start_date)
+    if end_date:
+        query = query.filter(
+            source_class.timestamp <= end_date if end_inclusive else source_class.timestamp < end_date
+        )
+    return query.group_by(*group).order_by(bucket_column).limit(limit)
+
+
+async def get_device_records_aggregate(
+        models_db: AsyncSession,
+        time_series_db: AsyncSession,
+        device_id: UUID,
+        bucket: timedelta,
+        fields: Optional[list[str]] = None,
+        aggregates: Optional[list[str]] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        limit: int = 1000):
+    device = await base_device_service.get_device_metadata(models_db, device_id)
+    model_classes = aggregated_models[device.type]
+    aggregates = aggregates or ["avg", "min", "max", "count"]
+    if not set(aggregates) <= set(aggregate_names):
+        return None
+    all_fields = {field for model_class in model_classes
+                  for field in rollup_service.get_aggregated_fields(model_class)}
+    if fields and not set(fields) <= all_fields:
+        return None
+    dialect_name = time_series_db.bind.dialect.name
 
     records = {}
-    for record_model in schema_model_map[device.type].values():
-        query = time_series_db.query(record_model).filter(record_model.device_id == device_id)
-        if start_date:
-            query = query.filter(record_model.timestamp >= start_date)
-        if end_date:
-            query = query.filter(record_model.timestamp <= end_date)
-        query = query.order_by(asc(record_model.timestamp))
-        records[camelcase_to_snakecase(record_model.__name__)] = query.offset(skip).limit(limit).all()
+    for model_class in model_classes:
+        model_fields = [field for field in rollup_service.get_aggregated_fields(model_class)
+                        if not fields or field in fields]
+        counted_column = rollup_service.counted_columns.get(model_class)
+        partials = {}
+        for source_class, source_start, source_end, end_inclusive in rollup_service.get_aggregate_sources(
+                dialect_name, model_class, bucket, start_date, end_date):
+            query = partial_aggregates_query(dialect_name, source_class, model_class, device_id, bucket, model_fields,
+                                             source_start, source_end, end_inclusive, limit)
+            for row in (await time_series_db.execute(query)).mappings():
+                key = (rollup_service.normalize_timestamp(row["bucket"]),
+                       row[counted_column] if counted_column else None)
+                partial = partials.get(key)
+                if partial is None:
+                    partials[key] = dict(row)
+                    continue
+                partial["count"] += row["count"]
+                for field in model_fields:
+                    partial[f"{field}_sum"] += row[f"{field}_sum"]
+                    partial[f"{field}_min"] = min(partial[f"{field}_min"], row[f"{field}_min"])
+                    partial[f"{field}_max"] = max(partial[f"{field}_max"], row[f"{field}_max"])
 
+        buckets = []
+        keys = sorted(partials, key=lambda key: (key[0], str(key[1])))[:limit]
+        for timestamp, counted_value in keys:
+            partial = partials[(timestamp, counted_value)]
+            values = {}
+            for field in model_fields:
+                for aggregate in aggregates:
+                    if aggregate == "avg":
+                        values[f"{field}_avg"] = partial[f"{field}_sum"] / partial["count"]
+                    elif aggregate != "count":
+                        values[f"{field}_{aggregate}"] = partial[f"{field}_{aggregate}"]
+            buckets.append(schemas.RecordBucket(
+                timestamp=timestamp,
+                count=partial["count"] if "count" in aggregates or counted_column else None,
+                values=values,
+                **({counted_column: counted_value} if counted_column else {})
+            ))
+        records[camelcase_to_snakecase(model_class.__name__)] = buckets
     return records
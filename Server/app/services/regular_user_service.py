@@ -1,21 +1,29 @@
 from uuid import UUID
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app.entities import schemas, models
 from app.core.passwords import get_password_hash
 
 
-def get_user(db: Session, user_id: UUID):
-    return db.query(models.RegularUser).filter(models.RegularUser.id == user_id).first()
+async def get_user(db: AsyncSession, user_id: UUID):
+    # Devices are part of the response, they can not be lazy loaded later on
+    return (await db.scalars(select(models.RegularUser)
+                             .options(selectinload(models.RegularUser.devices))
+                             .filter(models.RegularUser.id == user_id))).first()
 
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.RegularUser).offset(skip).limit(limit).all()
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return (await db.scalars(select(models.RegularUser)
+                             .options(selectinload(models.RegularUser.devices))
+                             .offset(skip)
+                             .limit(limit))).all()
 
 
-def create_user(db: Session, user: schemas.UserCreate):
-    db_user = models.RegularUser(email=user.email, hashed_password=get_password_hash(user.password))
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    db_user = models.RegularUser(email=user.email, hashed_password=await get_password_hash(user.password))
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user, ["devices"])
     return db_user
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Float, Integer, Interval, TIMESTAMP, cast, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.utils import to_naive_utc
+from app.entities import time_series_models
+
+# Rollups of every record table, coarsest first
+rollup_tiers = {
+    time_series_models.ThermoHumidMeterRecord: [
+        (timedelta(days=1), time_series_models.ThermoHumidMeterDailyRollup),
+        (timedelta(hours=1), time_series_models.ThermoHumidMeterHourlyRollup)
+    ],
+    time_series_models.WasteSorterRecycleRecord: [
+        (timedelta(days=1), time_series_models.WasteSorterRecycleDailyRollup),
+        (timedelta(hours=1), time_series_models.WasteSorterRecycleHourlyRollup)
+    ],
+    time_series_models.WasteSorterLevelRecord: [
+        (timedelta(days=1), time_series_models.WasteSorterLevelDailyRollup),
+        (timedelta(hours=1), time_series_models.WasteSorterLevelHourlyRollup)
+    ]
+}
+# Records counted by value rather than aggregated
+counted_columns = {
+    time_series_models.WasteSorterRecycleRecord: "waste_type"
+}
+# Rollups are upserted, which needs ON CONFLICT
+rollup_dialects = {"postgresql", "sqlite"}
+EPOCH = datetime(1970, 1, 1)
+
+
+def get_aggregated_fields(model_class):
+    return [column.name for column in model_class.__table__.columns if isinstance(column.type, Float)]
+
+
+def time_bucket(dialect_name: str, bucket: timedelta, column):
+    if dialect_name == "postgresql":
+        if settings.timescale_enabled:
+            return func.time_bucket(literal(bucket, Interval()), column)
+        return func.date_bin(literal(bucket, Interval()), column, literal(EPOCH, TIMESTAMP()))
+    # SQLite keeps timestamps as text, buckets are computed on unix seconds and formatted like stored timestamps
+    seconds = int(bucket.total_seconds())
+    return func.strftime("%Y-%m-%d %H:%M:%S.000000", cast(func.strftime("%s", column), Integer) // seconds * seconds,
+                         "unixepoch")
+
+
+def normalize_timestamp(timestamp):
+    # Buckets are naive UTC, like the timestamps the time series tables hold
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return to_naive_utc(timestamp)
+
+
+def floor_timestamp(timestamp: datetime, interval: timedelta):
+    return EPOCH + (normalize_timestamp(timestamp) - EPOCH) // interval * interval
+
+
+def ceil_timestamp(timestamp: datetime, interval: timedelta):
+    floored = floor_timestamp(timestamp, interval)
+    return floored if floored == normalize_timestamp(timestamp) else floored + interval
+
+
+def get_key_columns(model_class):
+    counted_column = counted_columns.get(model_class)
+    return ["device_id", "timestamp"] + ([counted_column] if counted_column else [])
+
+
+def upsert_rollups(dialect_name: str, rollup_class, key_columns: list[str], fields: list[str]):
+    statement = (postgresql.insert if dialect_name == "postgresql" else sqlite.insert)(rollup_class)
+    table = rollup_class.__table__
+    least, greatest = (func.least, func.greatest) if dialect_name == "postgresql" else (func.min, func.max)
+    values = {"sample_count": table.c.sample_count + statement.excluded.sample_count}
+    for field in fields:
+        values[f"{field}_sum"] = table.c[f"{field}_sum"] + statement.excluded[f"{field}_sum"]
+        values[f"{field}_min"] = least(table.c[f"{field}_min"], statement.excluded[f"{field}_min"])
+        values[f"{field}_max"] = greatest(table.c[f"{field}_max"], statement.excluded[f"{field}_max"])
+    return statement.on_conflict_do_update(index_elements=key_columns, set_=values)
+
+
+async def roll_up_records(db: AsyncSession, model_class, rows):
+    # Rows must be the records actually stored, a record sent twice is rolled up once
+    dialect_name = db.bind.dialect.name
+    if dialect_name not in rollup_dialects or not rows:
+        return
+    fields = get_aggregated_fields(model_class)
+    key_columns = get_key_columns(model_class)
+    for interval, rollup_class in rollup_tiers.get(model_class, []):
+        rollups = {}
+        for row in rows:
+            key = tuple(floor_timestamp(row[column], interval) if column == "timestamp" else row[column]
+                        for column in key_columns)
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = dict(zip(key_columns, key), sample_count=0)
+                for field in fields:
+                    rollup.update({f"{field}_sum": 0.0, f"{field}_min": row[field], f"{field}_max": row[field]})
+            rollup["sample_count"] += 1
+            for field in fields:
+                rollup[f"{field}_sum"] += row[field]
+                rollup[f"{field}_min"] = min(rollup[f"{field}_min"], row[field])
+                rollup[f"{field}_max"] = max(rollup[f"{field}_max"], row[field])
+        await db.execute(upsert_rollups(dialect_name, rollup_class, key_columns, fields), list(rollups.values()))
+
+
+async def backfill_rollups(db: AsyncSession):
+    # Rolls up records stored before the rollup tables existed, empty rollup tables only
+    dialect_name = db.bind.dialect.name
+    if dialect_name not in rollup_dialects:
+        return
+    for model_class, tiers in rollup_tiers.items():
+        fields = get_aggregated_fields(model_class)
+        for interval, rollup_class in tiers:
+            if (await db.scalars(select(rollup_class.device_id).limit(1))).first() is not None:
+                continue
+            bucket_column = time_bucket(dialect_name, interval, model_class.timestamp)
+            group = [bucket_column if column == "timestamp" else getattr(model_class, column)
+                     for column in get_key_columns(model_class)]
+            columns = [*group, func.count()]
+            names = get_key_columns(model_class) + ["sample_count"]
+            for field in fields:
+                column = getattr(model_class, field)
+                columns += [func.sum(column), func.min(column), func.max(column)]
+                names += [f"{field}_sum", f"{field}_min", f"{field}_max"]
+            statement = (postgresql.insert if dialect_name == "postgresql" else sqlite.insert)(rollup_class)
+            # Another worker may be filling the same table
+            await db.execute(statement.from_select(names, select(*columns).group_by(*group)).on_conflict_do_nothing())
+    await db.commit()
+
+
+def get_aggregate_sources(dialect_name: str, model_class, bucket: timedelta, start_date: Optional[datetime],
+                          end_date: Optional[datetime]):
+    # Tables to read for the range, as (table, start, end, end inclusive): the coarsest rollup dividing the bucket
+    # for whole rollup periods, raw records for the partial periods at both ends
+    tiers = rollup_tiers.get(model_class, []) if dialect_name in rollup_dialects else []
+    tier = next(((interval, rollup_class) for interval, rollup_class in tiers if bucket % interval == timedelta(0)),
+                None)
+    if tier is None:
+        return [(model_class, start_date, end_date, True)]
+    interval, rollup_class = tier
+    rollup_start = ceil_timestamp(start_date, interval) if start_date else None
+    rollup_end = floor_timestamp(end_date, interval) if end_date else None
+    if rollup_start and rollup_end and rollup_start >= rollup_end:
+        return [(model_class, start_date, end_date, True)]
+
+    sources = []
+    if start_date and rollup_start != normalize_timestamp(start_date):
+        sources.append((model_class, start_date, rollup_start, False))
+    sources.append((rollup_class, rollup_start, rollup_end, False))
+    if end_date:
+        sources.append((model_class, rollup_end, end_date, True))
+    return sources
@@ -0,0 +1,153 @@
+# Compares request latency of a synchronous Session used from async routes with the AsyncSession layer,
+# under many concurrent clients. Database round trips are simulated with an io_wait() SQL function that sleeps
+# inside the driver, so the difference shows without a Postgres server.
+# Run from the Server directory: python -m benchmarks.database_concurrency_benchmark --clients 200
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+directory = tempfile.TemporaryDirectory()
+os.environ.setdefault("regular_database_url", f"sqlite:///{directory.name}/regular.db")
+os.environ.setdefault("time_series_database_url", f"sqlite:///{directory.name}/time_series.db")
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+from app.core.database_manager import get_async_database_url
+from app.entities import models
+from app.entities.models import regular_db_base
+from app.services import base_device_service
+
+
+def register_io_wait(dbapi_connection, connection_record):
+    dbapi_connection.create_function("io_wait", 1, lambda milliseconds: time.sleep(milliseconds / 1000))
+
+
+def create_database(database_url, devices):
+    engine = create_engine(database_url)
+    event.listen(engine, "connect", register_io_wait)
+    regular_db_base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        user = models.RegularUser(email="benchmark@example.com", hashed_password="benchmark")
+        db.add(user)
+        db.flush()
+        db.add_all([models.ThermoHumidMeter(title=f"Device {i}", description="Benchmark", owner_id=user.id,
+                                            linked_timestamp=datetime.now()) for i in range(devices)])
+        db.commit()
+        user_id = user.id
+    engine.dispose()
+    return user_id
+
+
+def create_app(user_id, io_wait):
+    sync_engine = create_engine(settings.regular_database_url)
+    event.listen(sync_engine, "connect", register_io_wait)
+    SyncSessionLocal = sessionmaker(bind=sync_engine)
+
+    # Same pool as a server database gets from DatabaseManager
+    async_engine = create_async_engine(get_async_database_url(settings.regular_database_url),
+                                       poolclass=AsyncAdaptedQueuePool, pool_size=settings.database_pool_size,
+                                       max_overflow=settings.database_max_overflow)
+    event.listen(async_engine.sync_engine, "connect", register_io_wait)
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    app = FastAPI()
+
+    @app.get("/sync")
+    async def read_devices_sync():
+        # Every round trip blocks the event loop, like the routes did before the async database layer
+        db = SyncSessionLocal()
+        try:
+            db.execute(select(func.io_wait(io_wait)))
+            devices = db.scalars(select(models.BaseDevice).filter(models.BaseDevice.owner_id == user_id)).all()
+        finally:
+            db.close()
+        return len(devices)
+
+    @app.get("/async")
+    async def read_devices_async():
+        db = AsyncSessionLocal()
+        try:
+            await db.execute(select(func.io_wait(io_wait)))
+            devices = await base_device_service.get_user_devices(db, user_id)
+        finally:
+            await db.close()
+        return len(devices)
+
+    return app
+
+
+def serve(user_id, args):
+    uvicorn.run(create_app(user_id, args.io_wait), port=args.port, log_level="warning", timeout_keep_alive=60)
+
+
+async def run_clients(client, path, clients, requests):
+    latencies = []
+
+    async def run_client():
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get(path)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client() for _ in range(clients)))
+    return latencies, time.perf_counter() - start
+
+
+async def run(args):
+    user_id = create_database(settings.regular_database_url, args.devices)
+
+    # The Server runs in its own process, so clients keep sending while its event loop is blocked
+    server = multiprocessing.Process(target=serve, args=(user_id, args))
+    server.start()
+    limits = httpx.Limits(max_connections=args.clients)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=60) as client:
+            while True:
+                try:
+                    await client.get("/docs")
+                    break
+                except httpx.ConnectError:
+                    await asyncio.sleep(0.1)
+
+            print(f"{args.clients} clients, {args.requests} requests each, {args.io_wait}ms per database round trip")
+            for path in ("/sync", "/async"):
+                latencies, elapsed = await run_clients(client, path, args.clients, args.requests)
+                percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+                print(f"{path:>6}: {len(latencies) / elapsed:8,.0f} requests/s, "
+                      f"p50 {percentiles[49] * 1000:8,.1f}ms, p99 {percentiles[98] * 1000:8,.1f}ms")
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200, help="Number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=10, help="Requests sent by every client")
+    parser.add_argument("--devices", type=int, default=20, help="Devices owned by the benchmark user")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--io-wait", type=float, default=2.0, help="Simulated database round trip in milliseconds")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Measures the time LTTB downsampling takes on a long temperature and humidity series, and the size of the JSON
+# records the Server returns for a chart with and without max_points.
+# Run from the Server directory: python -m benchmarks.downsampling_benchmark --points 1000000 --max-points 1000
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from app.services.downsampling_service import downsample
+
+
+def create_series(points, interval):
+    rng = np.random.default_rng(0)
+    timestamps = np.datetime64("2024-01-01T00:00:00", "us") + np.arange(points) * np.timedelta64(interval, "s")
+    # Daily cycles with noise and a few spikes a chart must not lose
+    days = np.arange(points) * interval / 86400
+    temperature = 21 + 4 * np.sin(2 * np.pi * days) + rng.normal(0, 0.3, points)
+    humidity = 45 + 10 * np.cos(2 * np.pi * days) + rng.normal(0, 1, points)
+    spikes = rng.choice(points, 5, replace=False)
+    temperature[spikes] += 15
+    return timestamps, temperature, humidity, spikes
+
+
+def to_json(timestamps, temperature, humidity, indices):
+    return json.dumps([{"timestamp": str(timestamps[i]), "temperature": float(temperature[i]),
+                        "humidity": float(humidity[i])} for i in indices])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=1000000, help="Records in the series")
+    parser.add_argument("--interval", type=int, default=10, help="Seconds between two records")
+    parser.add_argument("--max-points", type=int, default=1000, help="Points requested by the chart")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    timestamps, temperature, humidity, spikes = create_series(args.points, args.interval)
+    durations = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        indices = downsample(timestamps, [temperature, humidity], args.max_points)
+        durations.append(time.perf_counter() - start)
+
+    raw_size = len(to_json(timestamps, temperature, humidity, range(args.points)))
+    downsampled_size = len(to_json(timestamps, temperature, humidity, indices))
+    print(f"{args.points:,} records every {args.interval}s reduced to {len(indices):,} points "
+          f"in {statistics.median(durations) * 1000:,.1f}ms (median of {args.runs})")
+    print(f"spikes kept: {np.isin(spikes, indices).sum()} of {len(spikes)}")
+    print(f"JSON payload: {raw_size / 1024:,.0f} KiB raw, {downsampled_size / 1024:,.0f} KiB downsampled, "
+          f"{raw_size / downsampled_size:,.0f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# Measures record ingestion latency while a burst of logins hits the Server, with bcrypt verified inline on the
+# event loop like login did before, and on the bounded password thread pool.
+# Run from the Server directory: python -m benchmarks.login_burst_benchmark --logins 16 --duration 10
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+directory = tempfile.TemporaryDirectory()
+os.environ.setdefault("regular_database_url", f"sqlite:///{directory.name}/regular.db")
+os.environ.setdefault("time_series_database_url", f"sqlite:///{directory.name}/time_series.db")
+
+import httpx
+import uvicorn
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.passwords import pwd_context
+from app.core.tokens import create_access_token
+from app.dependencies.database import get_regular_db
+from app.entities import models
+from app.main import app
+from app.services.base_user_service import get_base_user_by_email
+
+EMAIL = "benchmark@example.com"
+PASSWORD = "benchmark"
+
+
+@app.post("/benchmark/inline-login")
+async def inline_login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_regular_db)):
+    # Blocks the event loop for the whole bcrypt verification, like login did before the password thread pool
+    user = await get_base_user_by_email(db, form_data.username)
+    if not user or not pwd_context.verify(form_data.password, user.hashed_password):
+        raise HTTPException(status_code=401, detail="Incorrect email or password")
+    return {"access_token": create_access_token(data={"sub": user.email}), "token_type": "bearer"}
+
+
+def serve(port):
+    uvicorn.run(app, port=port, log_level="warning", timeout_keep_alive=60)
+
+
+def create_device(user_id):
+    engine = create_engine(settings.regular_database_url)
+    with sessionmaker(bind=engine)() as db:
+        device = models.ThermoHumidMeter(title="Benchmark", description="Benchmark", owner_id=user_id,
+                                         linked_timestamp=datetime.now())
+        db.add(device)
+        db.commit()
+        device_id = device.id
+    engine.dispose()
+    return device_id
+
+
+async def ingest(client, token, device_id, args, stop):
+    headers = {"Authorization": f"Bearer {token}"}
+    timestamps = itertools.count()
+    start_time = datetime.now()
+    latencies = []
+
+    async def run_client():
+        while not stop.is_set():
+            records = [{"device_id": str(device_id),
+                        "record": {"temperature": 21.5, "humidity": 40.0,
+                                   "timestamp": (start_time + timedelta(milliseconds=next(timestamps))).isoformat()}}
+                       for _ in range(args.batch_size)]
+            start = time.perf_counter()
+            response = await client.post("/API/records/batch", headers=headers, json={"records": records})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(args.ingest_interval)
+
+    await asyncio.gather(*(run_client() for _ in range(args.ingest_clients)))
+    return latencies
+
+
+async def login_burst(client, path, args, stop):
+    statuses = Counter()
+    latencies = []
+
+    async def run_client():
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = await client.post(path, data={"username": EMAIL, "password": PASSWORD})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] += 1
+            if response.status_code == 503:
+                await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+    await asyncio.gather(*(run_client() for _ in range(args.logins)))
+    return statuses, latencies
+
+
+async def run_phase(client, token, device_id, login_path, args):
+    stop = asyncio.Event()
+    ingestion = asyncio.create_task(ingest(client, token, device_id, args, stop))
+    logins = asyncio.create_task(login_burst(client, login_path, args, stop)) if login_path else None
+    await asyncio.sleep(args.duration)
+    stop.set()
+    latencies = await ingestion
+    statuses, login_latencies = await logins if logins else (Counter(), [])
+    return latencies, statuses, login_latencies
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return float("nan"), float("nan")
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    return quantiles[49] * 1000, quantiles[98] * 1000
+
+
+async def run(args):
+    server = multiprocessing.Process(target=serve, args=(args.port,))
+    server.start()
+    limits = httpx.Limits(max_connections=args.ingest_clients + args.logins)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=60) as client:
+            while True:
+                try:
+                    await client.get("/docs")
+                    break
+                except httpx.ConnectError:
+                    await asyncio.sleep(0.1)
+
+            response = await client.post("/API/users", json={"email": EMAIL, "password": PASSWORD})
+            response.raise_for_status()
+            device_id = create_device(uuid.UUID(response.json()["id"]))
+            response = await client.post("/API/auth/token", data={"username": EMAIL, "password": PASSWORD})
+            token = response.json()["access_token"]
+
+            print(f"{args.ingest_clients} ingest clients sending {args.batch_size} records every "
+                  f"{args.ingest_interval * 1000:.0f}ms, {args.logins} concurrent logins, "
+                  f"{settings.password_hash_workers} password threads, queue of {settings.password_hash_queue_size}")
+            for name, login_path in (("no logins", None), ("inline", "/benchmark/inline-login"),
+                                     ("pool", "/API/auth/token")):
+                latencies, statuses, login_latencies = await run_phase(client, token, device_id, login_path, args)
+                p50, p99 = percentiles(latencies)
+                line = f"{name:>9}: ingest p50 {p50:8,.1f}ms, p99 {p99:8,.1f}ms"
+                if login_path:
+                    login_p50, login_p99 = percentiles(login_latencies)
+                    line += (f" | logins {statuses[200] / args.duration:6,.1f}/s, shed {statuses[503]}, "
+                             f"p50 {login_p50:8,.1f}ms, p99 {login_p99:8,.1f}ms")
+                print(line)
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ingest-clients", type=int, default=4, help="Hubs sending record batches")
+    parser.add_argument("--ingest-interval", type=float, default=0.05, help="Seconds between two batches of a Hub")
+    parser.add_argument("--batch-size", type=int, default=50, help="Records per batch")
+    parser.add_argument("--logins", type=int, default=16, help="Concurrent clients logging in during the burst")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds every phase runs for")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
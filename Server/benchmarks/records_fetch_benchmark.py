@@ -0,0 +1,110 @@
+# Compares the latency of reading the records of a WasteSorter with its record tables queried one after the other
+# on a single session, like get_device_records did before, and concurrently on a session each. Database round trips
+# are simulated by sleeping in the driver thread on every statement, so the difference shows without a Postgres server.
+# Run from the Server directory: python -m benchmarks.records_fetch_benchmark --round-trip 5
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+directory = tempfile.TemporaryDirectory()
+os.environ.setdefault("regular_database_url", f"sqlite:///{directory.name}/regular.db")
+os.environ.setdefault("time_series_database_url", f"sqlite:///{directory.name}/time_series.db")
+
+from sqlalchemy import asc, event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.core.database_manager import get_async_database_url
+from app.core.utils import camelcase_to_snakecase
+from app.entities import schemas, time_series_models
+from app.entities.enums import DeviceType
+from app.entities.time_series_models import time_series_db_base
+from app.services import records_service
+
+
+async def create_records(session_factory, device_id, count):
+    start = datetime(2024, 1, 1)
+    async with session_factory() as db:
+        db.add_all([time_series_models.WasteSorterRecycleRecord(device_id=device_id, waste_type="RECYCLABLE",
+                                                                timestamp=start + timedelta(seconds=i))
+                    for i in range(count)])
+        db.add_all([time_series_models.WasteSorterLevelRecord(device_id=device_id, recyclable_level=i % 100,
+                                                              non_recyclable_level=i % 50,
+                                                              timestamp=start + timedelta(seconds=i))
+                    for i in range(count)])
+        await db.commit()
+
+
+async def get_device_records_sequential(session_factory, device, limit):
+    # One query per table on the same session, like the records were read before
+    records = {}
+    async with session_factory() as db:
+        for record_model in records_service.schema_model_map[device.type].values():
+            query = (select(record_model).filter(record_model.device_id == device.id)
+                     .order_by(asc(record_model.timestamp)).limit(limit))
+            records[camelcase_to_snakecase(record_model.__name__)] = (await db.scalars(query)).all()
+    return records
+
+
+async def measure(fetch, requests):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await fetch()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run(args):
+    engine = create_async_engine(get_async_database_url(settings.time_series_database_url))
+    async with engine.begin() as connection:
+        await connection.run_sync(time_series_db_base.metadata.create_all)
+
+    def simulate_round_trip(dbapi_connection, connection_record):
+        # Called in the aiosqlite thread of the connection, like a network wait it only blocks that connection
+        dbapi_connection.await_(dbapi_connection.driver_connection.set_trace_callback(
+            lambda statement: time.sleep(args.round_trip / 1000)
+        ))
+
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    device = schemas.Device(id=uuid.uuid4(), title="Benchmark", description="Benchmark", type=DeviceType.WASTE_SORTER,
+                            owner_id=uuid.uuid4(), is_online=True)
+    await create_records(session_factory, device.id, args.records)
+    # Only the connections opened from now on wait on every statement
+    await engine.dispose()
+    event.listen(engine.sync_engine, "connect", simulate_round_trip)
+
+    print(f"WasteSorter with {args.records} records per table, {args.limit} per page, "
+          f"{args.round_trip}ms per database round trip")
+    phases = (
+        ("sequential", lambda: get_device_records_sequential(session_factory, device, args.limit)),
+        ("concurrent", lambda: records_service.get_device_records(session_factory, device, limit=args.limit))
+    )
+    for name, fetch in phases:
+        latencies = await measure(fetch, args.requests)
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        print(f"{name:>10}: p50 {percentiles[49] * 1000:8,.1f}ms, p99 {percentiles[98] * 1000:8,.1f}ms")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=10000, help="Records stored in every table")
+    parser.add_argument("--limit", type=int, default=100, help="Records read from every table")
+    parser.add_argument("--requests", type=int, default=100, help="Reads measured per phase")
+    parser.add_argument("--round-trip", type=float, default=5.0, help="Simulated database round trip in milliseconds")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Measures how long broadcasting records to the WebSocket clients of a device holds up the record request, and how
+# late the messages reach the fast clients, when one client is stalled. Compares sending to every client in turn,
+# like the manager did before, with the queues and writer tasks of WebSocketManager.
+# Run from the Server directory: python -m benchmarks.websocket_fanout_benchmark --clients 50 --slow-send 2
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+os.environ.setdefault("regular_database_url", "sqlite://")
+os.environ.setdefault("time_series_database_url", "sqlite://")
+
+from app.core.websockets import WebSocketManager
+
+
+class SimulatedWebSocket:
+    def __init__(self, send_time):
+        self.send_time = send_time
+        self.latencies = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await asyncio.sleep(self.send_time)
+        self.latencies.append(time.perf_counter() - float(message))
+
+    async def close(self, code=1000):
+        pass
+
+
+async def broadcast_sequential(websockets, message):
+    # Every client in turn within the request, like broadcast did before
+    for websocket in websockets:
+        await websocket.send_text(message)
+
+
+async def run_phase(name, args, broadcast):
+    websockets = [SimulatedWebSocket(args.send) for _ in range(args.clients - 1)] + [SimulatedWebSocket(args.slow_send)]
+    manager = WebSocketManager()
+    group_id = uuid.uuid4()
+    for websocket in websockets:
+        await manager.connect(websocket, group_id)
+
+    durations = []
+    for _ in range(args.messages):
+        start = time.perf_counter()
+        await broadcast(manager, websockets, group_id, str(start))
+        durations.append(time.perf_counter() - start)
+        await asyncio.sleep(args.interval)
+    await asyncio.sleep(args.send * 10)
+
+    latencies = [latency for websocket in websockets[:-1] for latency in websocket.latencies]
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    print(f"{name:>10}: request held {statistics.mean(durations) * 1000:9,.1f}ms per broadcast | fast clients got "
+          f"{len(latencies) / (len(websockets) - 1) / args.messages:4.0%} of messages, p50 {percentiles[49] * 1000:9,.1f}ms, "
+          f"p99 {percentiles[98] * 1000:9,.1f}ms late")
+    for websocket in websockets:
+        await manager.disconnect(websocket, group_id)
+
+
+async def run(args):
+    print(f"{args.clients} clients, one taking {args.slow_send}s per message, the others {args.send * 1000:.0f}ms, "
+          f"{args.messages} messages every {args.interval * 1000:.0f}ms")
+
+    async def sequential(manager, websockets, group_id, message):
+        await broadcast_sequential(websockets, message)
+
+    async def queued(manager, websockets, group_id, message):
+        manager.broadcast(group_id, message)
+
+    await run_phase("sequential", args, sequential)
+    await run_phase("queued", args, queued)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50, help="WebSocket clients watching the device")
+    parser.add_argument("--send", type=float, default=0.001, help="Seconds a message takes to reach a fast client")
+    parser.add_argument("--slow-send", type=float, default=2.0, help="Seconds a message takes to reach the slow client")
+    parser.add_argument("--messages", type=int, default=20, help="Records broadcast")
+    parser.add_argument("--interval", type=float, default=0.1, help="Seconds between two records")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
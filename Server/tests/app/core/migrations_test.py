@@ -0,0 +1,40 @@
+import asyncio
+import tempfile
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.migrations import upgrade_record_keys
+from app.entities.time_series_models import time_series_db_base
+
+
+def run_upgrade(statements):
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{directory}/time_series.db")
+            try:
+                async with engine.begin() as connection:
+                    for statement in statements:
+                        await connection.execute(text(statement))
+                    await connection.run_sync(time_series_db_base.metadata.create_all)
+                async with engine.begin() as connection:
+                    await upgrade_record_keys(connection)
+            finally:
+                await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_current_record_keys_need_no_upgrade():
+    run_upgrade([])
+
+
+def test_outdated_record_keys_are_refused_on_sqlite():
+    # The table as created before records were keyed by device
+    with pytest.raises(RuntimeError, match="thermo_humid_meter"):
+        run_upgrade([
+            "CREATE TABLE thermo_humid_meter (timestamp TIMESTAMP NOT NULL PRIMARY KEY, device_id CHAR(32) NOT NULL, "
+            "temperature FLOAT NOT NULL, humidity FLOAT NOT NULL)",
+            "CREATE INDEX ix_thermo_humid_meter_device_id ON thermo_humid_meter (device_id)"
+        ])
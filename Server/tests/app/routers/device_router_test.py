@@ -1,24 +1,32 @@
 import io
+from datetime import datetime
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.dependencies.database import get_regular_db
 from app.main import app
+from app.entities import models
 from app.entities.models import regular_db_base
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 regular_db_base.metadata.create_all(bind=engine)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Every TestClient request runs in its own event loop, so connections are not pooled across requests
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
 
 
-def get_test_regular_db() -> Session:
-    db = TestingSessionLocal()
+async def get_test_regular_db() -> AsyncSession:
+    db = TestingAsyncSessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
 
 
 # Dependency override
@@ -178,3 +186,54 @@ def test_toggle_device_state(device_id):
     )
     assert response.status_code == 200
     assert response.json()["is_online"] is True
+
+
+@pytest.mark.order(11)
+def test_update_devices_presence():
+    with TestingSessionLocal() as db:
+        owner = db.query(models.BaseUser).filter(models.BaseUser.email == "newuser@example.com").first()
+        devices = [models.WasteSorter(title="Presence Device", description="Test Description", owner_id=owner.id,
+                                      linked_timestamp=datetime.now()) for _ in range(2)]
+        db.add_all(devices)
+        db.commit()
+        online_id, offline_id = devices[0].id, devices[1].id
+
+    token = get_token()
+    response = client.post(
+        "/API/devices/presence",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"devices": [{"device_id": str(online_id), "is_online": True},
+                          {"device_id": str(offline_id), "is_online": False}]}
+    )
+    assert response.status_code == 200
+    assert response.json()["updated"] == 2
+
+    with TestingSessionLocal() as db:
+        assert db.query(models.BaseDevice).filter(models.BaseDevice.id == online_id).first().is_online is True
+        assert db.query(models.BaseDevice).filter(models.BaseDevice.id == offline_id).first().is_online is False
+
+
+@pytest.mark.order(12)
+def test_read_device_after_presence_update():
+    with TestingSessionLocal() as db:
+        owner = db.query(models.BaseUser).filter(models.BaseUser.email == "newuser@example.com").first()
+        device = models.ThermoHumidMeter(title="Cached Device", description="Test Description", owner_id=owner.id,
+                                         linked_timestamp=datetime.now())
+        db.add(device)
+        db.commit()
+        device_id = device.id
+
+    token = get_token()
+    response = client.get(f"/API/devices/{device_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["is_online"] is False
+
+    # The cached device is invalidated by the update
+    response = client.post(
+        "/API/devices/presence",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"devices": [{"device_id": str(device_id), "is_online": True}]}
+    )
+    assert response.json()["updated"] == 1
+    response = client.get(f"/API/devices/{device_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["is_online"] is True
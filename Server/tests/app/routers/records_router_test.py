@@ -0,0 +1,496 @@
+import csv
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import msgpack
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from app.core.config import settings
+from app.dependencies.database import (get_regular_db, get_time_series_db, get_regular_session_factory,
+                                       get_time_series_session_factory)
+from app.main import app
+from app.entities import models
+from app.entities.models import regular_db_base
+from app.entities.time_series_models import time_series_db_base
+
+settings.api_key_secret = "test-api-key-secret"
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_TIME_SERIES_DATABASE_URL = "sqlite:///./test_time_series.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+time_series_engine = create_engine(SQLALCHEMY_TIME_SERIES_DATABASE_URL)
+regular_db_base.metadata.create_all(bind=engine)
+time_series_db_base.metadata.create_all(bind=time_series_engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Every TestClient request runs in its own event loop, so connections are not pooled across requests
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool), expire_on_commit=False)
+TestingAsyncTimeSeriesSessionLocal = async_sessionmaker(
+    bind=create_async_engine("sqlite+aiosqlite:///./test_time_series.db", poolclass=NullPool),
+    expire_on_commit=False)
+
+
+async def get_test_regular_db() -> AsyncSession:
+    db = TestingAsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def get_test_time_series_db() -> AsyncSession:
+    db = TestingAsyncTimeSeriesSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# Dependency override
+app.dependency_overrides[get_regular_db] = get_test_regular_db
+app.dependency_overrides[get_time_series_db] = get_test_time_series_db
+app.dependency_overrides[get_regular_session_factory] = lambda: TestingAsyncSessionLocal
+app.dependency_overrides[get_time_series_session_factory] = lambda: TestingAsyncTimeSeriesSessionLocal
+client = TestClient(app)
+
+HUB_EMAIL = "hub@example.com"
+HUB_PASSWORD = "hubpassword"
+
+
+def get_token():
+    response = client.post("/API/auth/token", data={"username": HUB_EMAIL, "password": HUB_PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def create_linked_device(model_class, owner_id):
+    with TestingSessionLocal() as db:
+        device = model_class(title="Test Device", description="Test Description", owner_id=owner_id,
+                             linked_timestamp=datetime.now())
+        db.add(device)
+        db.commit()
+        return device.id
+
+
+@pytest.fixture(scope="module")
+def hub_user_id():
+    response = client.post("/API/users", json={"email": HUB_EMAIL, "password": HUB_PASSWORD})
+    if response.status_code == 200:
+        return uuid.UUID(response.json()["id"])
+    with TestingSessionLocal() as db:
+        return db.query(models.BaseUser).filter(models.BaseUser.email == HUB_EMAIL).first().id
+
+
+@pytest.fixture(scope="module")
+def thermo_humid_meter_id(hub_user_id):
+    return create_linked_device(models.ThermoHumidMeter, hub_user_id)
+
+
+@pytest.fixture(scope="module")
+def waste_sorter_id(hub_user_id):
+    return create_linked_device(models.WasteSorter, hub_user_id)
+
+
+def test_create_records_batch(thermo_humid_meter_id, waste_sorter_id):
+    timestamp = datetime.now()
+    records = [
+        {"device_id": str(thermo_humid_meter_id),
+         "record": {"temperature": "21.5", "humidity": "40", "timestamp": (timestamp + timedelta(seconds=1)).isoformat()}},
+        {"device_id": str(thermo_humid_meter_id),
+         "record": {"window_seconds": 60, "sample_count": 6, "temperature_min": 20, "temperature_max": 22,
+                    "temperature_mean": 21, "humidity_min": 39, "humidity_max": 41, "humidity_mean": 40,
+                    "timestamp": timestamp.isoformat()}},
+        {"device_id": str(waste_sorter_id),
+         "record": {"waste_type": "RECYCLABLE", "timestamp": (timestamp + timedelta(seconds=2)).isoformat()}},
+        {"device_id": str(waste_sorter_id),
+         "record": {"recyclable_level": 10, "non_recyclable_level": 20,
+                    "timestamp": (timestamp + timedelta(seconds=3)).isoformat()}},
+        # Record type does not belong to the device
+        {"device_id": str(thermo_humid_meter_id), "record": {"waste_type": "RECYCLABLE"}},
+        # Device is not owned by the user
+        {"device_id": str(uuid.uuid4()), "record": {"temperature": 1, "humidity": 2}},
+    ]
+    response = client.post(
+        "/API/records/batch",
+        headers={"Authorization": f"Bearer {get_token()}"},
+        json={"records": records}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 4, "rejected": 2}
+
+    response = client.get(
+        f"/API/records/{waste_sorter_id}",
+        headers={"Authorization": f"Bearer {get_token()}"}
+    )
+    assert response.status_code == 200
+    assert len(response.json()["waste_sorter_recycle_record"]) == 1
+    assert len(response.json()["waste_sorter_level_record"]) == 1
+
+    response = client.get(
+        f"/API/records/{thermo_humid_meter_id}",
+        headers={"Authorization": f"Bearer {get_token()}"}
+    )
+    assert response.status_code == 200
+    assert len(response.json()["thermo_humid_meter_record"]) == 1
+    assert response.json()["thermo_humid_meter_aggregate_record"][0]["sample_count"] == 6
+
+
+def test_create_records_batch_msgpack(thermo_humid_meter_id):
+    records = [{"device_id": str(thermo_humid_meter_id),
+                "record": {"temperature": 22.5, "humidity": 41.0,
+                           "timestamp": (datetime.now() + timedelta(minutes=1, seconds=i)).isoformat()}}
+               for i in range(3)]
+    response = client.post(
+        "/API/records/batch",
+        headers={"Authorization": f"Bearer {get_token()}", "Content-Type": "application/msgpack"},
+        content=msgpack.packb({"records": records})
+    )
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 3, "rejected": 0}
+
+
+def test_records_stream(thermo_humid_meter_id):
+    records = [{"device_id": str(thermo_humid_meter_id),
+                "record": {"temperature": 23.5, "humidity": 42.0,
+                           "timestamp": (datetime.now() + timedelta(minutes=2, seconds=i)).isoformat()}}
+               for i in range(3)]
+    with client.websocket_connect("/API/records/stream",
+                                  headers={"Authorization": f"Bearer {get_token()}"}) as websocket:
+        assert websocket.receive_json()["window"] > 0
+
+        websocket.send_json({"seq": 1, "type": "records", "body": {"records": records[:2]}})
+        websocket.send_bytes(msgpack.packb({"seq": 2, "type": "records", "body": {"records": records[2:]}}))
+        websocket.send_json({"seq": 3, "type": "presence",
+                             "body": {"devices": [{"device_id": str(thermo_humid_meter_id), "is_online": True}]}})
+        websocket.send_json({"seq": 4, "type": "records", "body": {"devices": []}})
+
+        assert websocket.receive_json() == {"ack": 1, "status": 200, "body": {"accepted": 2, "rejected": 0}}
+        assert msgpack.unpackb(websocket.receive_bytes()) == {"ack": 2, "status": 200,
+                                                              "body": {"accepted": 1, "rejected": 0}}
+        assert websocket.receive_json() == {"ack": 3, "status": 200, "body": {"updated": 1}}
+        assert websocket.receive_json()["status"] == 422
+
+
+def test_records_stream_unauthorized():
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/API/records/stream", headers={"Authorization": "Bearer invalid"}) as websocket:
+            websocket.receive_json()
+
+
+def test_records_stream_revoked_api_key(hub_user_id, thermo_humid_meter_id):
+    client.post("/API/admins", json={"email": "keyadmin@example.com", "password": "adminpassword"})
+    response = client.post("/API/auth/token", data={"username": "keyadmin@example.com", "password": "adminpassword"})
+    admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    api_key = client.post("/API/api-keys", headers=admin_headers,
+                          json={"title": "Hub", "owner_id": str(hub_user_id)}).json()
+
+    records = [{"device_id": str(thermo_humid_meter_id),
+                "record": {"temperature": 23.5, "humidity": 42.0,
+                           "timestamp": (datetime.now() + timedelta(minutes=4, seconds=i)).isoformat()}}
+               for i in range(2)]
+    with client.websocket_connect("/API/records/stream",
+                                  headers={"Authorization": f"Bearer {api_key['key']}"}) as websocket:
+        websocket.receive_json()
+        websocket.send_json({"seq": 1, "type": "records", "body": {"records": records[:1]}})
+        assert websocket.receive_json()["status"] == 200
+
+        # Revoked while the stream is open, the next frame is refused
+        response = client.delete(f"/API/api-keys/{api_key['id']}", headers=admin_headers)
+        assert response.status_code == 200
+        websocket.send_json({"seq": 2, "type": "records", "body": {"records": records[1:]}})
+        with pytest.raises(WebSocketDisconnect) as disconnect:
+            websocket.receive_json()
+        assert disconnect.value.code == 1008
+
+
+def test_create_records_batch_api_key(hub_user_id, thermo_humid_meter_id):
+    client.post("/API/admins", json={"email": "keyadmin@example.com", "password": "adminpassword"})
+    response = client.post("/API/auth/token", data={"username": "keyadmin@example.com", "password": "adminpassword"})
+    admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = client.post("/API/api-keys", headers=admin_headers, json={"title": "Hub", "owner_id": str(hub_user_id)})
+    assert response.status_code == 200
+    api_key = response.json()
+    assert api_key["key"].startswith("wfh_")
+    headers = {"Authorization": f"Bearer {api_key['key']}"}
+
+    records = [{"device_id": str(thermo_humid_meter_id),
+                "record": {"temperature": 24.5, "humidity": 43.0,
+                           "timestamp": (datetime.now() + timedelta(minutes=3)).isoformat()}}]
+    response = client.post("/API/records/batch", headers=headers, json={"records": records})
+    assert response.status_code == 200
+    assert response.json() == {"accepted": 1, "rejected": 0}
+
+    response = client.post(f"/API/devices/{thermo_humid_meter_id}/toggle?is_online=true", headers=headers)
+    assert response.status_code == 200
+
+    # Keys are not accepted outside of the Hub endpoints
+    response = client.get("/API/auth/validate_token", headers=headers)
+    assert response.status_code == 401
+
+    response = client.delete(f"/API/api-keys/{api_key['id']}", headers=admin_headers)
+    assert response.status_code == 200
+    response = client.post("/API/records/batch", headers=headers, json={"records": records})
+    assert response.status_code == 401
+
+
+def test_api_keys_disabled_without_secret(hub_user_id, monkeypatch):
+    client.post("/API/admins", json={"email": "keyadmin@example.com", "password": "adminpassword"})
+    response = client.post("/API/auth/token", data={"username": "keyadmin@example.com", "password": "adminpassword"})
+    admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = client.post("/API/api-keys", headers=admin_headers, json={"title": "Hub", "owner_id": str(hub_user_id)})
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['key']}"}
+
+    # Only the generated secret_key is left, keys can be neither created nor verified
+    monkeypatch.setattr(settings, "api_key_secret", None)
+    response = client.post("/API/api-keys", headers=admin_headers, json={"title": "Hub", "owner_id": str(hub_user_id)})
+    assert response.status_code == 503
+    response = client.post("/API/records/batch", headers=headers, json={"records": []})
+    assert response.status_code == 401
+
+
+def test_read_device_records_with_cursor(thermo_humid_meter_id):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    response = client.get(f"/API/records/{thermo_humid_meter_id}?limit=1000", headers=headers)
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    expected = response.json()["thermo_humid_meter_record"]
+    assert len(expected) > 2
+
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(f"/API/records/{thermo_humid_meter_id}", headers=headers,
+                              params={"limit": 2, **({"after": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.extend(response.json()["thermo_humid_meter_record"])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert pages == expected
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}?after=invalid", headers=headers)
+    assert response.status_code == 400
+
+
+def test_read_device_records_aggregate(hub_user_id):
+    thermo_humid_meter_id = create_linked_device(models.ThermoHumidMeter, hub_user_id)
+    waste_sorter_id = create_linked_device(models.WasteSorter, hub_user_id)
+    start = datetime(2024, 1, 1, 10, 0)
+    records = [{"device_id": str(thermo_humid_meter_id),
+                "record": {"temperature": 20 + i, "humidity": 40,
+                           "timestamp": (start + timedelta(minutes=20 * i)).isoformat()}}
+               for i in range(6)]
+    records += [{"device_id": str(waste_sorter_id),
+                 "record": {"waste_type": waste_type, "timestamp": (start + timedelta(minutes=i)).isoformat()}}
+                for i, waste_type in enumerate(["RECYCLABLE", "RECYCLABLE", "NON_RECYCLABLE"])]
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    response = client.post("/API/records/batch", headers=headers, json={"records": records})
+    assert response.json() == {"accepted": 9, "rejected": 0}
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}/aggregate", headers=headers,
+                          params={"bucket": "1h", "fields": "temperature", "agg": "avg,max,count"})
+    assert response.status_code == 200
+    buckets = response.json()["thermo_humid_meter_record"]
+    assert [bucket["count"] for bucket in buckets] == [3, 3]
+    assert buckets[0]["values"] == {"temperature_avg": 21, "temperature_max": 22}
+    assert buckets[1]["values"] == {"temperature_avg": 24, "temperature_max": 25}
+    assert datetime.fromisoformat(buckets[1]["timestamp"]) == start + timedelta(hours=1)
+
+    # Sent again by a Hub retrying, the rollups do not count the records twice
+    response = client.post("/API/records/batch", headers=headers, json={"records": records})
+    assert response.status_code == 200
+
+    # Raw records for the partial hour at the start, the hourly rollup for the rest
+    response = client.get(f"/API/records/{thermo_humid_meter_id}/aggregate", headers=headers,
+                          params={"bucket": "1h", "fields": "temperature", "agg": "avg,count",
+                                  "start_date": (start + timedelta(minutes=10)).isoformat(),
+                                  "end_date": (start + timedelta(hours=2, minutes=30)).isoformat()})
+    buckets = response.json()["thermo_humid_meter_record"]
+    assert [(bucket["count"], bucket["values"]) for bucket in buckets] == [(2, {"temperature_avg": 21.5}),
+                                                                           (3, {"temperature_avg": 24})]
+
+    response = client.get(f"/API/records/{waste_sorter_id}/aggregate?bucket=1d", headers=headers)
+    assert response.status_code == 200
+    counts = {bucket["waste_type"]: bucket["count"] for bucket in response.json()["waste_sorter_recycle_record"]}
+    assert counts == {"RECYCLABLE": 2, "NON_RECYCLABLE": 1}
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}/aggregate?bucket=1w", headers=headers)
+    assert response.status_code == 400
+    response = client.get(f"/API/records/{thermo_humid_meter_id}/aggregate?bucket=1h&fields=level", headers=headers)
+    assert response.status_code == 400
+    for limit in (0, -1, settings.records_aggregate_max_buckets + 1):
+        response = client.get(f"/API/records/{thermo_humid_meter_id}/aggregate?bucket=1h&limit={limit}",
+                              headers=headers)
+        assert response.status_code == 422
+
+
+def test_export_device_records(thermo_humid_meter_id):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    records = client.get(f"/API/records/{thermo_humid_meter_id}?limit=1000", headers=headers).json()
+    record_count = sum(len(items) for items in records.values())
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == record_count
+    assert {line["record_type"] for line in lines} == {"thermo_humid_meter_record", "thermo_humid_meter_aggregate_record"}
+    assert lines[0]["temperature"] == records["thermo_humid_meter_record"][0]["temperature"]
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}/export?format=csv", headers=headers)
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == record_count
+    assert float(rows[0]["humidity"]) == records["thermo_humid_meter_record"][0]["humidity"]
+
+
+def test_export_records_columnar(thermo_humid_meter_id, waste_sorter_id):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    records = client.get(f"/API/records/{thermo_humid_meter_id}?limit=1000", headers=headers).json()
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}/export", headers=headers,
+                          params={"format": "arrow", "record_type": "thermo_humid_meter_record"})
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column_names == ["timestamp", "device_id", "temperature", "humidity"]
+    assert table.num_rows == len(records["thermo_humid_meter_record"])
+    assert table.column("temperature").to_pylist() == [item["temperature"]
+                                                       for item in records["thermo_humid_meter_record"]]
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}/export", headers=headers,
+                          params={"format": "parquet", "record_type": "waste_sorter_recycle_record"})
+    assert response.status_code == 400
+
+    # All devices of the user, the waste type is dictionary encoded
+    response = client.get("/API/records/export", headers=headers,
+                          params={"format": "parquet", "record_type": "waste_sorter_recycle_record"})
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert pa.types.is_dictionary(table.schema.field("waste_type").type)
+    assert str(waste_sorter_id) in table.column("device_id").to_pylist()
+
+
+def test_read_device_records_downsampled(hub_user_id):
+    thermo_humid_meter_id = create_linked_device(models.ThermoHumidMeter, hub_user_id)
+    start = datetime(2024, 1, 1)
+    records = [{"device_id": str(thermo_humid_meter_id),
+                "record": {"temperature": 35 if i == 123 else 20 + i % 2, "humidity": 5 if i == 321 else 40,
+                           "timestamp": (start + timedelta(seconds=10 * i)).isoformat()}}
+               for i in range(500)]
+    records += [{"device_id": str(thermo_humid_meter_id),
+                 "record": {"window_seconds": 60, "sample_count": 6 + i, "temperature_min": 20, "temperature_max": 22,
+                            "temperature_mean": 21, "humidity_min": 39, "humidity_max": 41, "humidity_mean": 40,
+                            "timestamp": (start + timedelta(minutes=i)).isoformat()}}
+                for i in range(100)]
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    response = client.post("/API/records/batch", headers=headers, json={"records": records})
+    assert response.json() == {"accepted": 600, "rejected": 0}
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}?max_points=50", headers=headers)
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    points = response.json()["thermo_humid_meter_record"]
+    assert 25 <= len(points) <= 50
+    # The first and last records, the peak and the trough are kept
+    timestamps = [datetime.fromisoformat(point["timestamp"]) for point in points]
+    assert timestamps == sorted(timestamps)
+    assert timestamps[0] == start and timestamps[-1] == start + timedelta(seconds=4990)
+    assert max(point["temperature"] for point in points) == 35
+    assert min(point["humidity"] for point in points) == 5
+    aggregates = response.json()["thermo_humid_meter_aggregate_record"]
+    assert 3 <= len(aggregates) <= 50
+    assert aggregates[0]["sample_count"] == 6 and aggregates[-1]["sample_count"] == 105
+
+    response = client.get(f"/API/records/{thermo_humid_meter_id}?max_points=5", headers=headers)
+    assert response.status_code == 422
+
+    # Ranges over the row cap are refused instead of loaded whole
+    max_rows = settings.records_downsample_max_rows
+    settings.records_downsample_max_rows = 100
+    try:
+        response = client.get(f"/API/records/{thermo_humid_meter_id}?max_points=50", headers=headers)
+        assert response.status_code == 400
+        response = client.get(f"/API/records/{thermo_humid_meter_id}", headers=headers, params={
+            "max_points": 50, "start_date": start.isoformat(), "end_date": (start + timedelta(seconds=990)).isoformat()
+        })
+        assert response.status_code == 200
+        assert len(response.json()["thermo_humid_meter_record"]) <= 50
+    finally:
+        settings.records_downsample_max_rows = max_rows
+
+
+def test_device_records_websocket(thermo_humid_meter_id):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    # Requests and WebSockets share one event loop, like in a Server worker
+    with TestClient(app) as shared_client:
+        with shared_client.websocket_connect(f"/API/records/{thermo_humid_meter_id}", headers=headers) as websocket:
+            response = shared_client.post(f"/API/records/{thermo_humid_meter_id}", headers=headers,
+                                          json={"temperature": 22.5, "humidity": 41})
+            assert response.status_code == 200
+            message = json.loads(websocket.receive_text())
+            assert message["temperature"] == 22.5
+            assert datetime.fromisoformat(message["timestamp"]) == datetime.fromisoformat(response.json()["timestamp"])
+
+
+def test_create_records_batch_retried(hub_user_id):
+    thermo_humid_meter_id = create_linked_device(models.ThermoHumidMeter, hub_user_id)
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    start = datetime(2024, 2, 1)
+    records = [{"device_id": str(thermo_humid_meter_id),
+                "record": {"temperature": 20 + i, "humidity": 40, "timestamp": (start + timedelta(seconds=i)).isoformat()}}
+               for i in range(3)]
+    with TestClient(app) as shared_client:
+        response = shared_client.post("/API/records/batch", headers=headers, json={"records": records[:2]})
+        assert response.json() == {"accepted": 2, "rejected": 0}
+
+        with shared_client.websocket_connect(f"/API/records/{thermo_humid_meter_id}", headers=headers) as websocket:
+            # The retry holds the records already stored, only the new one is accepted and broadcast
+            response = shared_client.post("/API/records/batch", headers=headers, json={"records": records})
+            assert response.json() == {"accepted": 1, "rejected": 2}
+            response = shared_client.post(f"/API/records/{thermo_humid_meter_id}", headers=headers,
+                                          json={"temperature": 30, "humidity": 40})
+            assert response.status_code == 200
+            assert [json.loads(websocket.receive_text())["temperature"] for _ in range(2)] == [22, 30]
+
+
+def test_create_records_with_aware_and_missing_timestamps(hub_user_id):
+    thermo_humid_meter_id = create_linked_device(models.ThermoHumidMeter, hub_user_id)
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    before = datetime.utcnow()
+    records = [{"device_id": str(thermo_humid_meter_id),
+                "record": {"temperature": 20, "humidity": 40, "timestamp": "2024-03-01T12:00:00+02:00"}},
+               {"device_id": str(thermo_humid_meter_id), "record": {"temperature": 21, "humidity": 41}}]
+    response = client.post("/API/records/batch", headers=headers, json={"records": records})
+    assert response.json() == {"accepted": 2, "rejected": 0}
+    response = client.post(f"/API/records/{thermo_humid_meter_id}", headers=headers,
+                           json={"temperature": 22, "humidity": 42})
+    assert response.status_code == 200
+
+    # Stored as naive UTC, and filtered with aware bounds converted the same way
+    response = client.get(f"/API/records/{thermo_humid_meter_id}", headers=headers,
+                          params={"end_date": "2024-03-01T12:00:00+02:00"})
+    timestamps = [datetime.fromisoformat(item["timestamp"]) for item in response.json()["thermo_humid_meter_record"]]
+    assert timestamps == [datetime(2024, 3, 1, 10, 0)]
+    response = client.get(f"/API/records/{thermo_humid_meter_id}", headers=headers,
+                          params={"start_date": (before - timedelta(seconds=1)).isoformat()})
+    timestamps = [datetime.fromisoformat(item["timestamp"]) for item in response.json()["thermo_humid_meter_record"]]
+    assert len(timestamps) == 2
+    assert all(timestamp.tzinfo is None and timestamp >= before - timedelta(seconds=1) for timestamp in timestamps)
+
+
+def test_read_device_records_invalid_limit(thermo_humid_meter_id):
+    headers = {"Authorization": f"Bearer {get_token()}"}
+    for limit in (0, -1, 1001):
+        response = client.get(f"/API/records/{thermo_humid_meter_id}?limit={limit}", headers=headers)
+        assert response.status_code == 422
@@ -0,0 +1,80 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
+from sqlalchemy import create_engine
+from app.core.config import settings
+from app.dependencies.database import get_regular_db
+from app.main import app
+from app.entities.models import regular_db_base
+
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
+regular_db_base.metadata.create_all(bind=engine)
+# Every TestClient request runs in its own event loop, so connections are not pooled across requests
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool), expire_on_commit=False)
+
+
+async def get_test_regular_db() -> AsyncSession:
+    db = TestingAsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# Dependency override
+app.dependency_overrides[get_regular_db] = get_test_regular_db
+client = TestClient(app)
+
+
+def get_token(email, password):
+    response = client.post("/API/auth/token", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def test_update_user_status():
+    client.post("/API/admins", json={"email": "statusadmin@example.com", "password": "adminpassword"})
+    response = client.post("/API/users", json={"email": "status@example.com", "password": "statuspassword"})
+    assert response.status_code == 200
+    user_id = response.json()["id"]
+    token = get_token("status@example.com", "statuspassword")
+    admin_token = get_token("statusadmin@example.com", "adminpassword")
+
+    # The principal of the user is cached by this request
+    response = client.get("/API/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    response = client.put(f"/API/users/{user_id}/status", json={"is_active": False},
+                          headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200
+    assert response.json()["is_active"] is False
+
+    # The same token is refused right away
+    response = client.get("/API/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400
+
+    response = client.put(f"/API/users/{user_id}/status", json={"is_active": True, "role": "ADMIN"},
+                          headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200
+    assert response.json()["role"] == "ADMIN"
+
+    response = client.get("/API/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+
+def test_update_user_status_forbidden():
+    client.post("/API/users", json={"email": "status2@example.com", "password": "statuspassword"})
+    token = get_token("status2@example.com", "statuspassword")
+    response = client.put("/API/users/00000000-0000-0000-0000-000000000000/status", json={"is_active": False},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+
+def test_login_shed_when_password_queue_full(monkeypatch):
+    client.post("/API/users", json={"email": "shed@example.com", "password": "shedpassword"})
+    monkeypatch.setattr(settings, "password_hash_queue_size", -settings.password_hash_workers)
+    response = client.post("/API/auth/token", data={"username": "shed@example.com", "password": "shedpassword"})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers